@@ -0,0 +1,154 @@
+"""Generate synthetic ASR files for benchmarks.
+
+The generated files have the same structure as the JSON files of AWS
+Transcribe: a transcript and a list of pronunciation and punctuation items.
+The words are drawn from a small vocabulary that covers all universal
+POS-tags, so every weighting rule has something to match.
+
+The length, speech rate, gap distribution and punctuation density can be
+configured. The same arguments and seed always give the same file.
+
+Usage:
+    $ python benchmarks/generate.py --minutes 60 [--wpm 150] [--gaps 2]
+                                    [--gap-length 2] [--punctuation 0.1]
+                                    [--seed 0] -o file.json
+"""
+import argparse
+import json
+import random
+from typing import Any, Dict, List
+
+
+# words per universal POS-tag, drawn with the frequencies of spoken English
+VOCABULARY = {
+    'NOUN': ('time', 'people', 'video', 'house', 'way', 'day', 'world',
+             'problem', 'question', 'thing', 'water', 'car', 'idea'),
+    'VERB': ('is', 'was', 'have', 'said', 'go', 'think', 'see', 'know',
+             'make', 'want', 'going', 'looked', 'take', 'came'),
+    'PRON': ('i', 'you', 'he', 'she', 'it', 'we', 'they', 'this', 'that'),
+    'DET': ('the', 'a', 'an', 'every', 'some', 'no', 'my', 'their'),
+    'ADP': ('of', 'in', 'to', 'for', 'with', 'on', 'at', 'from', 'about'),
+    'ADJ': ('good', 'new', 'big', 'small', 'important', 'different', 'old'),
+    'ADV': ('really', 'just', 'very', 'now', 'then', 'also', 'quickly'),
+    'CONJ': ('and', 'but', 'or', 'because', 'so', 'if'),
+    'NUM': ('one', 'two', 'three', 'ten', 'hundred'),
+    'PRT': ('not', 'up', 'out', 'off'),
+}
+TAG_FREQUENCIES = {'NOUN': 22, 'VERB': 18, 'PRON': 14, 'DET': 11, 'ADP': 11,
+                   'ADJ': 7, 'ADV': 7, 'CONJ': 5, 'NUM': 2, 'PRT': 3}
+
+# share of the punctuation marks that end a sentence, and their marks
+SENTENCE_ENDS = 0.6
+END_MARKS = ('.', '.', '.', '?', '!')
+
+
+def generate(minutes: float, wpm: float = 150, gaps: float = 2,
+             gap_length: float = 2, punctuation: float = 0.1,
+             seed: int = 0) -> Dict[str, Any]:
+    """Generate the JSON data of an ASR file.
+
+    Args:
+        minutes: Length of the speech in minutes.
+        wpm: Speech rate in words per minute.
+        gaps: Average number of speech gaps (pauses longer than a few
+            tenths of a second) per minute.
+        gap_length: Average length of a speech gap in seconds. The lengths
+            are exponentially distributed.
+        punctuation: Probability of a punctuation mark after a word.
+        seed: Seed of the random generator.
+
+    Returns:
+        The data of the ASR file, see asr.ASR.
+    """
+    rng = random.Random(seed)
+    tags = list(TAG_FREQUENCIES)
+    frequencies = list(TAG_FREQUENCIES.values())
+
+    word_time = 60 / wpm
+    gap_probability = gaps / wpm
+
+    items: List[Dict[str, Any]] = []
+    words: List[str] = []
+    time = 0.0
+    capitalize = True
+    while time < minutes * 60:
+        text = rng.choice(VOCABULARY[rng.choices(tags, frequencies)[0]])
+        if capitalize or text == 'i':
+            text = text.capitalize()
+        capitalize = False
+
+        duration = word_time * rng.uniform(0.5, 1.2)
+        items.append({
+            'start_time': f'{time:.2f}',
+            'end_time': f'{time + duration:.2f}',
+            'alternatives': [{'confidence': f'{rng.uniform(0.6, 1):.4f}',
+                              'content': text}],
+            'type': 'pronunciation',
+        })
+        words.append(text)
+
+        time += duration + word_time * rng.uniform(0, 0.3)
+        if rng.random() < gap_probability:
+            time += rng.expovariate(1 / gap_length)
+
+        if rng.random() < punctuation:
+            mark = ','
+            if rng.random() < SENTENCE_ENDS:
+                mark = rng.choice(END_MARKS)
+                capitalize = True
+
+            items.append({
+                'alternatives': [{'confidence': '0.0', 'content': mark}],
+                'type': 'punctuation',
+            })
+            words[-1] += mark
+
+    return {
+        'jobName': 'benchmark',
+        'accountId': '0',
+        'results': {
+            'transcripts': [{'transcript': ' '.join(words)}],
+            'items': items,
+        },
+        'status': 'COMPLETED',
+    }
+
+
+def write(filename: str, minutes: float, **kwargs: Any) -> None:
+    """Generate an ASR file.
+
+    Args:
+        filename: Name of the ASR file.
+        minutes: Length of the speech in minutes.
+        **kwargs: Other arguments of generate().
+    """
+    with open(filename, 'w') as f:
+        json.dump(generate(minutes, **kwargs), f)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--minutes', type=float, default=10,
+                        help='Length of the speech (default: 10)')
+    parser.add_argument('--wpm', type=float, default=150,
+                        help='Words per minute (default: 150)')
+    parser.add_argument('--gaps', type=float, default=2,
+                        help='Speech gaps per minute (default: 2)')
+    parser.add_argument('--gap-length', type=float, default=2,
+                        help='Average length of a speech gap in seconds '
+                             '(default: 2)')
+    parser.add_argument('--punctuation', type=float, default=0.1,
+                        help='Probability of punctuation after a word '
+                             '(default: 0.1)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', required=True,
+                        help='Name of the ASR file')
+    args = parser.parse_args()
+
+    write(args.output, args.minutes, wpm=args.wpm, gaps=args.gaps,
+          gap_length=args.gap_length, punctuation=args.punctuation,
+          seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""Time every stage of the captioning pipeline.
+
+This script generates ASR files with benchmarks/generate.py and measures:
+
+- every stage separately on one file: reading the ASR file, every weighting
+  function, the segmentation, convert.cps(), weighting.line_breaks() and
+  caption.compose();
+- cap.group() end-to-end on files from 1 minute to 10 hours of speech.
+
+The time of a stage is the best of --repeat runs, its input is prepared
+outside the timed code. The peak memory of a stage is measured in a separate
+run with tracemalloc, because tracing slows everything down.
+
+The results are saved with --output and compared with an earlier run with
+--compare, which prints how much slower or faster every stage got.
+
+Usage:
+    $ python benchmarks/pipeline.py [--minutes 1 10 60 600]
+                                    [--stage-minutes 60] [--repeat 3]
+                                    [--output results.json]
+                                    [--compare baseline.json]
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import generate
+
+import cap
+from cap import asr, caption, convert, transcript, weighting
+
+
+# a stage prepares its input (not timed) and runs on it (timed)
+Stage = Tuple[Callable[[], Any], Callable[[Any], Any]]
+
+# stages slower than this factor compared to the baseline are marked
+SLOWER = 1.1
+
+
+def stages(filename: str) -> Dict[str, Stage]:
+    """Define the stages of the pipeline for an ASR file.
+
+    Args:
+        filename: Name of the ASR file.
+
+    Returns:
+        The setup and run function of every stage, in pipeline order.
+    """
+    words = asr.ASR(filename).groups()
+
+    def fresh() -> transcript.Transcript:
+        return transcript.Transcript(words)
+
+    tagged = fresh()
+    weighting.pos_tags(tagged)
+    tags = tagged.tags()
+
+    def with_tags() -> transcript.Transcript:
+        data = fresh()
+        data.set_tags(tags)
+        return data
+
+    weighted = convert.add_weights(fresh(), tags=tags)
+    ranges = convert.split_ranges(weighted)
+
+    def groups() -> convert.Groups:
+        return [weighted.words(lo, hi) for lo, hi in ranges]
+
+    retimed = convert.cps(groups())
+    final = weighting.line_breaks(copy.deepcopy(retimed))
+
+    result: Dict[str, Stage] = {
+        'asr.groups': (lambda: filename, lambda f: asr.ASR(f).groups()),
+        'transcript.Transcript': (lambda: words, transcript.Transcript),
+        'weighting.speech_gaps': (fresh, weighting.speech_gaps),
+        'weighting.punctuation': (fresh, weighting.punctuation),
+        'weighting.pos_tags': (fresh, weighting.pos_tags),
+    }
+    for function in (weighting.pos_pron_verb, weighting.pos_det_noun,
+                     weighting.pos_prep_phrase, weighting.pos_conj_phrase,
+                     weighting.complex_verbs, weighting.pos_rules):
+        result[f'weighting.{function.__name__}'] = (with_tags, function)
+
+    result.update({
+        'convert.split_weights': (weighted.words, convert.split_weights),
+        'convert.optimal_ranges': (lambda: weighted, convert.optimal_ranges),
+        'convert.cps': (groups, convert.cps),
+        'weighting.line_breaks': (lambda: copy.deepcopy(retimed),
+                                  weighting.line_breaks),
+        'caption.compose': (lambda: final, caption.compose),
+    })
+    return result
+
+
+def measure(setup: Callable[[], Any], function: Callable[[Any], Any],
+            repeat: int) -> Dict[str, Any]:
+    """Time a stage and measure its peak memory.
+
+    Args:
+        setup: Function that prepares the input of the stage.
+        function: Function that runs the stage on the input.
+        repeat: Number of timed runs.
+
+    Returns:
+        The best and median time in seconds and the peak memory in MB.
+    """
+    times = []
+    for _ in range(repeat):
+        data = setup()
+        start = time.perf_counter()
+        function(data)
+        times.append(time.perf_counter() - start)
+
+    data = setup()
+    tracemalloc.start()
+    try:
+        function(data)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': min(times),
+        'median': statistics.median(times),
+        'peak_mb': peak / 1e6,
+    }
+
+
+def report(name: str, result: Dict[str, Any],
+           baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Print the result of a stage.
+
+    Args:
+        name: Name of the stage.
+        result: The result of the stage, see measure().
+        baseline: The result of the stage in an earlier run.
+    """
+    line = (f'{name:<28} {result["words"]:8d} words '
+            f'{result["seconds"] * 1000:10.1f} ms '
+            f'{result["peak_mb"]:9.1f} MB peak')
+
+    if baseline and baseline.get('seconds'):
+        ratio = result['seconds'] / baseline['seconds']
+        mark = '  slower' if ratio > SLOWER else ''
+        line += f'   {ratio:5.2f}x baseline{mark}'
+
+    print(line)
+
+
+def run(args: argparse.Namespace, directory: str) -> Dict[str, Any]:
+    """Run all benchmarks.
+
+    Args:
+        args: The command line arguments.
+        directory: Directory to write the generated ASR files to.
+
+    Returns:
+        The results, in the format saved by --output.
+    """
+    settings = {
+        'wpm': args.wpm, 'gaps': args.gaps, 'gap_length': args.gap_length,
+        'punctuation': args.punctuation, 'seed': args.seed,
+        'stage_minutes': args.stage_minutes,
+    }
+
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if args.compare:
+        with open(args.compare) as f:
+            earlier = json.load(f)
+        baseline = earlier['results']
+
+        if any(earlier['settings'].get(key) != value
+               for key, value in settings.items()):
+            print(f'warning: {args.compare} was generated with other '
+                  'settings, the results are not comparable\n')
+
+    def asr_file(minutes: float) -> Tuple[str, int]:
+        filename = os.path.join(directory, f'{minutes:g}min.json')
+        generate.write(filename, minutes, wpm=args.wpm, gaps=args.gaps,
+                       gap_length=args.gap_length,
+                       punctuation=args.punctuation, seed=args.seed)
+        return filename, len(asr.ASR(filename).groups())
+
+    # load the tagger before timing
+    weighting.load_tagger()
+
+    results: Dict[str, Dict[str, Any]] = {}
+
+    filename, words = asr_file(args.stage_minutes)
+    print(f'stages, {args.stage_minutes:g} minutes of speech:')
+    for name, (setup, function) in stages(filename).items():
+        results[name] = dict(measure(setup, function, args.repeat),
+                             words=words)
+        report(name, results[name], baseline.get(name))
+
+    print('\ncap.group end-to-end:')
+    for minutes in args.minutes:
+        filename, words = asr_file(minutes)
+        name = f'cap.group {minutes:g}min'
+        # pylint: disable=cell-var-from-loop
+        results[name] = dict(measure(lambda: filename, cap.group,
+                                     args.repeat), words=words)
+        report(name, results[name], baseline.get(name))
+
+    return {
+        'version': 1,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': dict(settings, repeat=args.repeat),
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--minutes', type=float, nargs='+',
+                        default=[1, 10, 60, 600],
+                        help='Lengths of speech to time cap.group() on '
+                             '(default: 1 10 60 600)')
+    parser.add_argument('--stage-minutes', type=float, default=60,
+                        help='Length of speech to time the stages on '
+                             '(default: 60)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs (default: 3)')
+    parser.add_argument('--wpm', type=float, default=150)
+    parser.add_argument('--gaps', type=float, default=2)
+    parser.add_argument('--gap-length', type=float, default=2)
+    parser.add_argument('--punctuation', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='Save the results as JSON')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='Compare with the results of an earlier run')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(args, directory)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
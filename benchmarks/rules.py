@@ -0,0 +1,168 @@
+"""Compare the POS rule engine with the original pos_* functions.
+
+This script generates words with benchmarks/generate.py and times the five
+original pos_* functions (see tests/baseline.py) applied one after another,
+against weighting.pos_rules() on a Caption-list and on a Transcript. The words
+are tagged with the POS-tags of the generator's vocabulary, so the tagger
+isn't needed. The tagged words of the original functions are created once,
+before timing. The weights of all versions are checked to be the same.
+
+Usage:
+    $ python benchmarks/rules.py [--words 100000] [--repeat 5]
+                                 [--output results.json]
+"""
+import argparse
+import copy
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import generate
+
+from cap import asr, transcript, weighting
+
+# the original functions are kept with the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'tests'))
+import baseline  # noqa: E402 pylint: disable=wrong-import-position
+
+
+def tagged_words(n: int, seed: int) -> Tuple[List[asr.Word], List[str]]:
+    """Generate words with their POS-tags and the non-POS weights.
+
+    Args:
+        n: Number of words and punctuation marks.
+        seed: Seed of the generator.
+
+    Returns:
+        The words, with the weights of speech_gaps() and punctuation(), and
+        their POS-tags.
+    """
+    tag_of = {word: tag for tag, words in generate.VOCABULARY.items()
+              for word in words}
+
+    # about 1.1 words per word time, see generate.generate()
+    data = generate.generate(n / 150 * 1.1, seed=seed)
+    words = asr.ASR(io.StringIO(json.dumps(data))).groups()[:n]
+    tags = [tag_of.get(word.text.lower(), '.') for word in words]
+
+    weighting.speech_gaps(words)
+    weighting.punctuation(words)
+    return words, tags
+
+
+def best(setup: Callable[[], Any], function: Callable[[Any], Any],
+         repeat: int) -> Tuple[float, Any]:
+    """Time a function on fresh input.
+
+    Like timeit, the garbage collector is disabled while timing.
+
+    Args:
+        setup: Function that prepares the input, not timed.
+        function: The timed function.
+        repeat: Number of timed runs.
+
+    Returns:
+        The best time in seconds and the result of the last run.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        data = setup()
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = function(data)
+            times.append(time.perf_counter() - start)
+        finally:
+            gc.enable()
+
+    return min(times), result
+
+
+def run(n: int, repeat: int, seed: int) -> Dict[str, Any]:
+    """Time the rule implementations.
+
+    Args:
+        n: Number of words.
+        repeat: Number of timed runs.
+        seed: Seed of the generator.
+
+    Returns:
+        The results, in the format saved by --output.
+
+    Raises:
+        AssertionError: If the weights differ.
+    """
+    words, tags = tagged_words(n, seed)
+    tagged = baseline.pos_tagger(words, tags)
+
+    def original(data: List[asr.Word]) -> List[asr.Word]:
+        for function in baseline.POS_FUNCTIONS:
+            data = function(data, tagged)
+        return data
+
+    def fresh() -> transcript.Transcript:
+        data = transcript.Transcript(words)
+        data.set_tags(tags)
+        return data
+
+    seconds, expected = best(lambda: copy.deepcopy(words), original, repeat)
+    results = {'baseline.pos_*': {'seconds': seconds}}
+    weights = [word.weight for word in expected]
+
+    seconds, caption = best(
+        lambda: copy.deepcopy(words),
+        lambda data: weighting.pos_rules(data, tags=tags), repeat)
+    results['weighting.pos_rules Caption-list'] = {'seconds': seconds}
+    if [word.weight for word in caption] != weights:
+        raise AssertionError('pos_rules changed the weights of a Caption-list')
+
+    seconds, data = best(fresh, weighting.pos_rules, repeat)
+    results['weighting.pos_rules Transcript'] = {'seconds': seconds}
+    if list(data.weight) != weights:
+        raise AssertionError('pos_rules changed the weights of a Transcript')
+
+    base = results['baseline.pos_*']['seconds']
+    for name, result in results.items():
+        result['speedup'] = base / result['seconds']
+        print(f'{name:<36} {n:8d} words {result["seconds"] * 1000:9.1f} ms '
+              f'{result["speedup"]:7.1f}x')
+
+    return {
+        'version': 1,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': {'words': n, 'repeat': repeat, 'seed': seed},
+        'results': results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--words', type=int, default=100000,
+                        help='Number of words (default: 100000)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs (default: 5)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='Save the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.words, args.repeat, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Compare the greedy and dynamic programming segmentation modes.
+
+For every ASR file, this script creates the caption groups with both modes of
+convert.create_groups() and reports the time it took. If a manual SRT file is
+given for an ASR file, the basic_error of both modes is reported too (lower is
+better).
+
+With --jobs, both modes are also timed with a pool of worker processes, and
+the caption groups are checked to be the same as without the pool.
+
+Usage:
+    $ python benchmarks/segmentation.py [--jobs N] file.json[:manual.srt] ...
+"""
+import argparse
+import concurrent.futures
+import time
+from typing import List, Optional, Tuple
+
+import srt
+
+from cap import asr, caption, convert, transcript, weighting
+
+
+MODES = ('greedy', 'dp')
+
+
+def timed(words: List[asr.Word], mode: str,
+          pool: Optional[concurrent.futures.Executor] = None
+          ) -> Tuple[convert.Groups, float]:
+    """Create the caption groups of the words.
+
+    Args:
+        words: The words of an ASR file.
+        mode: The segmentation mode.
+        pool: Worker processes for convert.create_groups().
+
+    Returns:
+        The caption groups and the time it took in seconds.
+    """
+    data = transcript.Transcript(words)
+    start = time.perf_counter()
+    groups = convert.create_groups(data, mode=mode, pool=pool)
+    return groups, time.perf_counter() - start
+
+
+def run(asr_file: str, manual_file: Optional[str],
+        pool: Optional[concurrent.futures.Executor]) -> None:
+    """Segment an ASR file with all modes and print the results.
+
+    Args:
+        asr_file: Filename of the ASR file.
+        manual_file: Filename of the manual SRT file, or None.
+        pool: Worker processes to time the modes with, or None.
+    """
+    manual: List[srt.Subtitle] = []
+    if manual_file:
+        with open(manual_file) as f:
+            manual = list(srt.parse(f.read()))
+
+    # load the tagger before timing
+    words = list(asr.ASR(asr_file).words())
+    weighting.pos_tags(transcript.Transcript(words))
+
+    for mode in MODES:
+        groups, seconds = timed(words, mode)
+
+        error = ''
+        if manual:
+            subs = caption.create_subtitles(groups)
+            error = f'basic_error {convert.basic_error(subs, manual):6d}'
+
+        print(f'{asr_file:<30} {mode:<7} {len(words):7d} words '
+              f'{len(groups):6d} groups {seconds * 1000:9.1f} ms   {error}')
+
+        if pool is not None:
+            parallel, seconds = timed(words, mode, pool)
+            same = 'same' if parallel == groups else 'DIFFERENT'
+            print(f'{"":<30} {"+pool":<7} {"":13} {len(parallel):6d} groups '
+                  f'{seconds * 1000:9.1f} ms   {same}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('files', nargs='+', metavar='file.json[:manual.srt]',
+                        help='ASR file, optionally with its manual SRT file')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Also time with this number of worker processes')
+    args = parser.parse_args()
+
+    pool = None
+    if args.jobs:
+        pool = concurrent.futures.ProcessPoolExecutor(
+            args.jobs, initializer=weighting.load_tagger)
+
+    for arg in args.files:
+        asr_file, _, manual_file = arg.partition(':')
+        run(asr_file, manual_file or None, pool)
+
+    if pool is not None:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
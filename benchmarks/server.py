@@ -0,0 +1,159 @@
+"""Measure the throughput of the captioning service.
+
+This script starts `cap serve` on a local port, posts ASR files to it from
+multiple client threads and reports the number of clips per second, the
+response statuses and the stage latencies from /metrics.
+
+Usage:
+    $ python benchmarks/server.py [--requests N] [--concurrency N]
+                                  [--workers N] [file.json ...]
+"""
+import argparse
+import collections
+import concurrent.futures
+import http.client
+import json
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# a short clip, used if no ASR files are given
+CLIP = {
+    'results': {
+        'transcripts': [{'transcript': 'Thanks for watching. See you soon!'}],
+        'items': [
+            {'start_time': str(0.3 * i), 'end_time': str(0.3 * i + 0.25),
+             'type': 'pronunciation',
+             'alternatives': [{'confidence': '1.0', 'content': word}]}
+            for i, word in enumerate('Thanks for watching this video and see '
+                                     'you next week'.split())
+        ] + [{'type': 'punctuation',
+              'alternatives': [{'confidence': '0.0', 'content': '.'}]}]
+    }
+}
+
+
+def free_port() -> int:
+    """Return a free local port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, body: Optional[bytes] = None
+            ) -> Tuple[int, bytes]:
+    """Send a request to the service.
+
+    Args:
+        port: Port of the service.
+        method: The HTTP method.
+        path: The path of the request.
+        body: The body of the request.
+
+    Returns:
+        The status and body of the response.
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        conn.request(method, path, body)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def wait_until_up(port: int, timeout: float = 30) -> None:
+    """Wait until the service answers /health.
+
+    Args:
+        port: Port of the service.
+        timeout: Maximum time to wait in seconds.
+
+    Raises:
+        RuntimeError: If the service doesn't start in time.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if request(port, 'GET', '/health')[0] == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise RuntimeError('the service did not start')
+
+
+def stage_means(metrics: str) -> Dict[str, float]:
+    """Compute the mean latency of every stage from /metrics.
+
+    Args:
+        metrics: The metrics in the Prometheus text format.
+
+    Returns:
+        The mean latency of every stage in milliseconds.
+    """
+    sums: Dict[str, float] = {}
+    counts: Dict[str, float] = {}
+    for line in metrics.splitlines():
+        if line.startswith('cap_stage_seconds_sum'):
+            sums[line.split('"')[1]] = float(line.split()[-1])
+        elif line.startswith('cap_stage_seconds_count'):
+            counts[line.split('"')[1]] = float(line.split()[-1])
+
+    return {stage: 1000 * sums[stage] / counts[stage]
+            for stage in sums if counts.get(stage)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('files', nargs='*', help='ASR files to post')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    bodies: List[bytes] = [json.dumps(CLIP).encode()]
+    if args.files:
+        bodies = []
+        for filename in args.files:
+            with open(filename, 'rb') as f:
+                bodies.append(f.read())
+
+    port = free_port()
+    cmd = [sys.executable, '-m', 'cap', 'serve', '--port', str(port)]
+    if args.workers:
+        cmd += ['--workers', str(args.workers)]
+
+    with subprocess.Popen(cmd) as proc:
+        try:
+            wait_until_up(port)
+
+            # warm up every worker
+            request(port, 'POST', '/caption', bodies[0])
+
+            statuses: Dict[int, int] = collections.Counter()
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(
+                    args.concurrency) as pool:
+                jobs = [pool.submit(request, port, 'POST', '/caption',
+                                    bodies[i % len(bodies)])
+                        for i in range(args.requests)]
+                for job in jobs:
+                    statuses[job.result()[0]] += 1
+            seconds = time.perf_counter() - start
+
+            metrics = request(port, 'GET', '/metrics')[1].decode()
+        finally:
+            proc.terminate()
+
+    print(f'{args.requests} requests in {seconds:.2f} s: '
+          f'{statuses[200] / seconds:.1f} clips/s, statuses {dict(statuses)}')
+    for stage, mean in stage_means(metrics).items():
+        print(f'  {stage:<8} mean {mean:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
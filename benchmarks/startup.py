@@ -0,0 +1,130 @@
+"""Measure the startup time of the cap command line interface.
+
+Batch jobs start many short-lived cap processes, so startup time matters. This
+script times `cap -h` and captioning a tiny ASR file, both in-process and
+forwarded to a warm `cap daemon`, and fails if the median time exceeds the
+budget.
+
+Usage:
+    $ python benchmarks/startup.py [--runs N] [--help-budget MS]
+                                   [--tiny-budget MS] [--daemon-budget MS]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+
+TINY_ASR = {
+    'results': {
+        'transcripts': [{'transcript': 'Hello there.'}],
+        'items': [
+            {'start_time': '0.1', 'end_time': '0.4', 'type': 'pronunciation',
+             'alternatives': [{'confidence': '1.0', 'content': 'Hello'}]},
+            {'start_time': '0.4', 'end_time': '0.8', 'type': 'pronunciation',
+             'alternatives': [{'confidence': '1.0', 'content': 'there'}]},
+            {'type': 'punctuation',
+             'alternatives': [{'confidence': '0.0', 'content': '.'}]},
+        ]
+    }
+}
+
+
+def timed(cmd: List[str], runs: int,
+          env: Optional[Dict[str, str]] = None) -> List[float]:
+    """Run a command multiple times.
+
+    Args:
+        cmd: The command to run.
+        runs: How many times to run the command.
+        env: Extra environment variables for the command.
+
+    Returns:
+        The wall time of every run in milliseconds.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL,
+                       env=dict(os.environ, **(env or {})))
+        times.append((time.perf_counter() - start) * 1000)
+
+    return times
+
+
+def report(name: str, times: List[float], budget: float) -> bool:
+    """Print the timing results of a command.
+
+    Args:
+        name: Description of the command.
+        times: The wall times in milliseconds.
+        budget: Maximum allowed median wall time in milliseconds.
+
+    Returns:
+        True if the median is within budget.
+    """
+    median = statistics.median(times)
+    ok = median <= budget
+    print(f'{name:<12} min {min(times):7.1f} ms   median {median:7.1f} ms   '
+          f'budget {budget:7.1f} ms   {"ok" if ok else "OVER BUDGET"}')
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--help-budget', type=float, default=150,
+                        help='Budget for cap -h in milliseconds')
+    parser.add_argument('--tiny-budget', type=float, default=1500,
+                        help='Budget for a tiny input in milliseconds')
+    parser.add_argument('--daemon-budget', type=float, default=300,
+                        help='Budget for a tiny input forwarded to the daemon '
+                             'in milliseconds')
+    args = parser.parse_args()
+
+    cap = [sys.executable, '-m', 'cap']
+
+    # importing the cli must not import the heavy tagger modules
+    check = subprocess.run(
+        [sys.executable, '-c',
+         'import sys, cap.cli; print(sorted({"nltk", "torch"} & '
+         'set(sys.modules)))'],
+        check=True, capture_output=True, text=True)
+    heavy = check.stdout.strip()
+    print('heavy modules imported by cap.cli:', heavy)
+
+    ok = heavy == '[]'
+    ok &= report('cap -h', timed(cap + ['-h'], args.runs), args.help_budget)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asr_file = os.path.join(tmp, 'tiny.json')
+        with open(asr_file, 'w') as f:
+            json.dump(TINY_ASR, f)
+
+        srt_file = os.path.join(tmp, 'tiny.srt')
+        no_daemon = {'CAP_DAEMON': '0'}
+        times = timed(cap + [asr_file, '-o', srt_file], args.runs, no_daemon)
+        ok &= report('tiny input', times, args.tiny_budget)
+
+        sock = os.path.join(tmp, 'cap.sock')
+        with subprocess.Popen(cap + ['daemon', '--socket', sock]) as daemon:
+            while not os.path.exists(sock):
+                if daemon.poll() is not None:
+                    sys.exit('cap daemon did not start')
+                time.sleep(0.05)
+
+            times = timed(cap + [asr_file, '-o', srt_file], args.runs,
+                          {'CAP_SOCKET': sock})
+            ok &= report('tiny daemon', times, args.daemon_budget)
+            daemon.terminate()
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
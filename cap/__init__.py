@@ -1,13 +1,22 @@
 """
 .. include:: ../README.md
 """
+from typing import Optional
+
 from . import asr
 from . import caption
 from . import convert
+from . import instrument
+from . import stream
+from . import transcript
 from . import weighting
+from .tagcache import TagCache
 
 
-def group(asr_file: str, srt_file: str = None) -> convert.Groups:
+def group(asr_file: str, srt_file: Optional[str] = None,
+          tag_cache: Optional[TagCache] = None,
+          mode: str = 'greedy',
+          profiler: Optional[instrument.Profiler] = None) -> convert.Groups:
     """Convert ASR to SRT file with well formatted caption groups.
 
     This function is the main interface for the module. Given a filename of an
@@ -17,15 +26,27 @@ def group(asr_file: str, srt_file: str = None) -> convert.Groups:
     Args:
         asr_file: Filename of the ASR file.
         srt_file: Filename to which the SRT output will be written.
+        tag_cache: Persistent cache of previously tagged sentences, see the
+            tagcache module.
+        mode: The segmentation mode, 'greedy' or 'dp', see
+            convert.create_groups().
+        profiler: Records the wall time, words and groups of every stage,
+            see the instrument module.
 
     Returns:
         The caption groups, consists of a list of our custom Caption-list
         dataformats.
     """
-    data = asr.ASR(asr_file).groups()
-    groups = convert.create_groups(data)
+    with instrument.stage(profiler, 'read') as totals:
+        data = transcript.Transcript(asr.ASR(asr_file).words())
+        if totals is not None:
+            totals.words += len(data)
+
+    groups = convert.create_groups(data, tag_cache=tag_cache, mode=mode,
+                                   profiler=profiler)
 
     if srt_file:
-        caption.write(groups, srt_file)
+        with instrument.stage(profiler, 'write', len(data)):
+            caption.write(groups, srt_file)
 
     return groups
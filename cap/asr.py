@@ -4,6 +4,10 @@ This Module is for working with ASR (Automatic Speech Recognition) files
 formatted as JSON. It provides the ASR class and the Word and Punc
 dataclasses.
 
+The words are read from the file while iterating over them, without loading
+the whole file in memory. So even ASR files of recordings that take many hours
+can be processed with little memory.
+
 Example:
     >>> import asr
     >>> asr.ASR('/path/to/file.json').groups()
@@ -13,7 +17,15 @@ Example:
 """
 from dataclasses import dataclass
 import json
-from typing import List, Union
+import re
+from typing import Any, IO, Iterator, List, Optional, Sequence, Union
+
+
+# the characters that start or end a JSON value, and that end a JSON string
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING = re.compile(r'["\\]')
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DELIMITER = re.compile(r'[ \t\n\r,\]}]')
 
 
 @dataclass
@@ -28,11 +40,14 @@ class Word:
         end: End time of the word in seconds.
         weight: How good a split after this word would be. How higher the
             value, the better the split would be.
+        line_break: Whether the caption group continues on a new line after
+            this word, see weighting.line_breaks().
     """
     text: str
     start: float
     end: float
     weight: float
+    line_break: bool = False
 
 
 @dataclass
@@ -47,7 +62,193 @@ class Punc(Word):
         end: End time of the word before the punctuation in seconds.
         weight: How good a split after this word would be. How higher the
             value, how better the split would be.
+        line_break: See Word dataclass documentation.
+    """
+
+
+class _Reader:
+    """Reads JSON from a text stream, one chunk at a time.
+
+    Only the unread part of the current chunk and the value that is being
+    decoded are kept in memory.
+    """
+
+    def __init__(self, f: IO[str], chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _more(self) -> bool:
+        """Read the next chunk and drop the text before the position.
+
+        Returns:
+            False if the end of the stream is reached.
+        """
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, '' at the end."""
+        while True:
+            match = _WHITESPACE.match(self.buf, self.pos)
+            self.pos = match.end() if match else self.pos
+            if self.pos < len(self.buf) or not self._more():
+                return self.buf[self.pos:self.pos+1]
+
+    def expect(self, chars: str) -> str:
+        """Read one of the given characters.
+
+        Args:
+            chars: The allowed characters.
+
+        Returns:
+            The character that was read.
+
+        Raises:
+            JSONDecodeError: If the next character isn't allowed.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            msg = 'Expecting ' + ' or '.join(map(repr, chars))
+            raise json.JSONDecodeError(msg, self.buf, self.pos)
+
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        """Read and decode the next JSON value.
+
+        Returns:
+            The decoded value.
+
+        Raises:
+            json.JSONDecodeError: If the value isn't valid JSON.
+        """
+        # a number or literal is complete when the character after it is read
+        if self.peek() not in ('"', '[', '{'):
+            while not _DELIMITER.search(self.buf, self.pos) and self._more():
+                pass
+
+        while True:
+            try:
+                value, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return value
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+
+    def _skip_string(self) -> None:
+        """Skip the rest of a string, after its opening quote."""
+        while True:
+            match = _STRING.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._more():
+                    raise json.JSONDecodeError('Unterminated string', self.buf,
+                                               self.pos)
+            elif match.group() == '"':
+                self.pos = match.end()
+                return
+            elif match.end() == len(self.buf):
+                # the escaped character is in the next chunk
+                self.pos = match.start()
+                if not self._more():
+                    raise json.JSONDecodeError('Unterminated string', self.buf,
+                                               self.pos)
+            else:
+                self.pos = match.end() + 1
+
+    def skip(self) -> None:
+        """Skip the next JSON value without decoding it."""
+        if self.peek() not in ('"', '[', '{'):
+            self.value()
+            return
+
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+                if not self._more():
+                    raise json.JSONDecodeError('Unterminated value', self.buf,
+                                               self.pos)
+                continue
+
+            self.pos = match.end()
+            if match.group() == '"':
+                self._skip_string()
+            elif match.group() in '[{':
+                depth += 1
+            else:
+                depth -= 1
+
+            if depth == 0:
+                return
+
+
+def stream_items(f: IO[str], path: Sequence[str] = ('results', 'items'),
+                 chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """Iterate over the elements of a list in a JSON stream.
+
+    The elements are decoded one at a time while reading the stream, all other
+    values are skipped without decoding them. The memory use doesn't depend on
+    the size of the stream. The skipped values are only checked for balanced
+    brackets and terminated strings, not decoded.
+
+    Args:
+        f: The JSON text stream, for example an opened ASR file.
+        path: The keys of the list in the JSON objects.
+        chunk_size: Number of characters to read at a time.
+
+    Yields:
+        The decoded elements of the list.
+
+    Raises:
+        KeyError: If a key of the path doesn't exist.
+        JSONDecodeError: If the stream isn't valid JSON or the path
+            doesn't lead to a list, after the elements that were read before
+            the error.
     """
+    reader = _Reader(f, chunk_size)
+
+    for key in path:
+        reader.expect('{')
+        if reader.peek() == '}':
+            raise KeyError(key)
+
+        while reader.value() != key:
+            reader.expect(':')
+            reader.skip()
+            if reader.expect(',}') == '}':
+                raise KeyError(key)
+
+        reader.expect(':')
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        reader.expect(']')
+    else:
+        while True:
+            yield reader.value()
+            if reader.expect(',]') == ']':
+                break
+
+    # the members after the list, and the end of every object of the path
+    for _ in path:
+        while reader.expect(',}') == ',':
+            reader.value()
+            reader.expect(':')
+            reader.skip()
+
+    if reader.peek():
+        raise json.JSONDecodeError('Extra data', reader.buf, reader.pos)
 
 
 class ASR:
@@ -56,20 +257,34 @@ class ASR:
     This class helps working with ASR files. It provides an API for loading
     these files and converting it to various datastructures.
 
+    The words are read from the file while iterating over them. The whole file
+    is only loaded if transcript(), json() or data is used.
+
     Attributes:
-        data: All data from the ASR file loaded with the JSON module.
+        source: The filename of the ASR file, or the opened file.
     """
 
-    def __init__(self, filename: str):
-        """Load asr file with given filename.
+    def __init__(self, source: Union[str, IO[str]]):
+        """Use the asr file with given filename.
 
         Args:
-            filename: A string of an ASR filename.
+            source: A string of an ASR filename, or an opened ASR file (or any
+                other text stream). A stream can only be read once.
         """
-        with open(filename, 'r') as f:
-            raw = f.read()
+        self.source = source
+        self._data: Optional[dict] = None
 
-        self.data = json.loads(raw)
+    @property
+    def data(self) -> dict:
+        """All data from the ASR file loaded with the JSON module."""
+        if self._data is None:
+            if isinstance(self.source, str):
+                with open(self.source, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            else:
+                self._data = json.load(self.source)
+
+        return self._data
 
     def transcript(self) -> str:
         """Return the transcript as one big string.
@@ -89,29 +304,48 @@ class ASR:
         """
         return self.data
 
-    def groups(self) -> List[Union[Word, Punc]]:
-        """Convert the ASR to the following format to the Caption-list format:
+    def items(self) -> Iterator[dict]:
+        """Iterate over the items in the ASR file.
 
-            [Word(text='An', start=0, end=1, weight=0),
-             Word(text='example', start=1, end=2, weight=0),
-             Punc(text='.', start=2, end=2, weight=0)]
+        The items are read from the file one at a time, unless the file is
+        loaded already.
 
-        Returns:
-            Caption-list with weights initialised at 0.
+        Yields:
+            The item dictionaries, see json().
         """
-        cap = []
+        if self._data is not None:
+            yield from self._data['results']['items']
+        elif isinstance(self.source, str):
+            with open(self.source, 'r', encoding='utf-8') as f:
+                yield from stream_items(f)
+        else:
+            yield from stream_items(self.source)
 
-        words = self.data['results']['items']
+    def words(self) -> Iterator[Union[Word, Punc]]:
+        """Iterate over the words and punctuation in the ASR file.
 
-        for word in words:
+        Yields:
+            Word and Punc instances with weights initialised at 0.
+        """
+        end = 0.0
+
+        for word in self.items():
             text = word['alternatives'][0]['content']
 
             if word['type'] == 'pronunciation':
-                start = word['start_time']
-                end = word['end_time']
-                cap.append(Word(text, float(start), float(end), weight=0))
+                end = float(word['end_time'])
+                yield Word(text, float(word['start_time']), end, weight=0)
             else:
-                time = cap[-1].end
-                cap.append(Punc(text, time, time, weight=0))
+                yield Punc(text, end, end, weight=0)
 
-        return cap
+    def groups(self) -> List[Union[Word, Punc]]:
+        """Convert the ASR to the following format to the Caption-list format:
+
+            [Word(text='An', start=0, end=1, weight=0),
+             Word(text='example', start=1, end=2, weight=0),
+             Punc(text='.', start=2, end=2, weight=0)]
+
+        Returns:
+            Caption-list with weights initialised at 0.
+        """
+        return list(self.words())
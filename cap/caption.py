@@ -1,9 +1,16 @@
 """
-Module to convert our Caption dataformat to various srt package formats.
+Module to convert our Caption dataformat to various srt package formats, and
+to write the subtitles as SRT, WebVTT, TTML or JSON, see FORMATS.
 """
+import contextlib
+from dataclasses import dataclass
 from datetime import timedelta
-import re
-from typing import List, Union
+import io
+import json
+import math
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Mapping, \
+    NamedTuple, Union
+from xml.sax.saxutils import escape
 
 import srt
 
@@ -14,6 +21,9 @@ from . import asr
 Caption = List[Union[asr.Word, asr.Punc]]
 Groups = List[Caption]
 
+# punctuation that is written without a space in front of it
+_PUNC_CHARS = ',.?!'
+
 
 def create_subtitles(caption: Groups) -> List[srt.Subtitle]:
     """
@@ -28,52 +38,314 @@ def create_subtitles(caption: Groups) -> List[srt.Subtitle]:
     Returns:
         List of srt.Subtitle instances, created from the caption groups.
     """
-    punc = re.compile(r' ([,.?!])')
-    nl = re.compile(r'\n ')
-
     subtitles = []
     for i, group in enumerate(caption):
-        text = ' '.join(word.text for word in group)
-
-        # strip spaces in front of punctuation
-        text = punc.sub(r'\g<1>', text)
-        text = nl.sub(r'\n', text)
-
         start = group[0].start
         end = group[-1].end
         sub = srt.Subtitle(i, timedelta(seconds=start),
-                           timedelta(seconds=end), text)
+                           timedelta(seconds=end), _text(group))
         subtitles.append(sub)
 
     return subtitles
 
 
-def compose(caption: Groups) -> str:
+def _text(group: Caption) -> str:
+    """Return the content of the subtitle of a caption group.
+
+    Words are separated by a space, or a newline after a line break, and
+    spaces in front of punctuation are stripped.
+
+    Args:
+        group: The caption group.
+
+    Returns:
+        The content of the subtitle.
     """
-    Convert caption groups to the content of a srt file as a string.
+    text = ''.join([word.text + ('\n' if word.line_break else ' ')
+                    for word in group])[:-1]
+
+    for punc in _PUNC_CHARS:
+        text = text.replace(' ' + punc, punc)
+
+    return text
+
+
+def _microseconds(seconds: float) -> int:
+    """Round a time to whole microseconds, like datetime.timedelta does.
+
+    Like timedelta, only the fractional part of the seconds is multiplied,
+    which is rounded half to even.
+
+    Args:
+        seconds: The time in seconds.
+
+    Returns:
+        The time in microseconds.
+    """
+    fraction, whole = math.modf(seconds)
+    return int(whole) * 1000000 + round(fraction * 1000000)
+
+
+def _timestamp(microseconds: int, sep: str = ',') -> str:
+    """Format a non-negative time in microseconds as HH:MM:SS,mmm."""
+    ms = microseconds // 1000
+    return (f'{ms // 3600000:02d}:{ms // 60000 % 60:02d}:'
+            f'{ms // 1000 % 60:02d}{sep}{ms % 1000:03d}')
+
+
+class Cue(NamedTuple):
+    """A subtitle, as it's written in every output format.
+
+    The text and times are computed once and shared by all formats.
+
+    Attributes:
+        number: The number of the subtitle.
+        start: The start time in microseconds.
+        end: The end time in microseconds.
+        text: The text of the subtitle, lines are separated by newlines.
+        group: The caption group of the subtitle.
+    """
+    number: int
+    start: int
+    end: int
+    text: str
+    group: Caption
+
+
+def _skip(start: int, end: int, content: str) -> bool:
+    """Check if srt.compose() skips a subtitle.
+
+    Args:
+        start: The start time in microseconds.
+        end: The end time in microseconds.
+        content: The text of the subtitle.
+
+    Returns:
+        True for subtitles without content, a negative start time or without
+        duration.
+    """
+    return not content.strip() or start < 0 or start >= end
+
+
+def _cues(caption: Iterable[Caption], start_index: int = 1) -> Iterator[Cue]:
+    """Create the cues of caption groups, skipping the ones srt skips.
+
+    Args:
+        caption: The caption groups, in the order of the output.
+        start_index: The number of the first cue.
+
+    Yields:
+        The cues, numbered from start_index.
+    """
+    index = start_index
+    for group in caption:
+        start = _microseconds(group[0].start)
+        end = _microseconds(group[-1].end)
+        text = _text(group)
+        if _skip(start, end, text):
+            continue
+
+        # no blank lines, like srt.make_legal_content()
+        if text[:1] == '\n' or '\n\n' in text:
+            text = srt.make_legal_content(text)
+
+        yield Cue(index, start, end, text, group)
+        index += 1
+
+
+def cues(caption: Groups, start_index: int = 1) -> Iterator[Cue]:
+    """
+    Convert caption groups to cues exactly like srt.compose() does with the
+    subtitles of create_subtitles(): the subtitles are sorted by time,
+    subtitles without content or duration are skipped and the others are
+    numbered from start_index.
+
+    The times are rounded to microseconds and the text is joined from the
+    words, without creating srt.Subtitle and timedelta instances.
 
     Args:
         caption: The caption groups, consists of a list of our custom
             Caption-list dataformats.
+        start_index: The number of the first subtitle.
 
     Returns:
-        A formatted srt file as a string.
+        The cues, in the order of the output file.
     """
-    return srt.compose(create_subtitles(caption))
+    keys = [(_microseconds(group[0].start), _microseconds(group[-1].end), i)
+            for i, group in enumerate(caption)]
+
+    # caption groups are usually in order already
+    if any(a > b for a, b in zip(keys, keys[1:])):
+        return _cues((caption[i] for _, _, i in sorted(keys)), start_index)
+
+    return _cues(caption, start_index)
 
 
-def write(caption: Groups, filename: str) -> None:
+def _srt(cue: Cue) -> str:
+    """Format a cue as a SRT block, like srt.Subtitle.to_srt()."""
+    return (f'{cue.number}\n{_timestamp(cue.start)} --> '
+            f'{_timestamp(cue.end)}\n{cue.text}\n\n')
+
+
+def _vtt(cue: Cue) -> str:
+    """Format a cue as a WebVTT cue block."""
+    return (f'{cue.number}\n{_timestamp(cue.start, ".")} --> '
+            f'{_timestamp(cue.end, ".")}\n{escape(cue.text)}\n\n')
+
+
+def _ttml(cue: Cue) -> str:
+    """Format a cue as a TTML paragraph."""
+    text = escape(cue.text).replace('\n', '<br/>')
+    return (f'      <p xml:id="c{cue.number}" '
+            f'begin="{_timestamp(cue.start, ".")}" '
+            f'end="{_timestamp(cue.end, ".")}">{text}</p>\n')
+
+
+def _json(cue: Cue) -> str:
+    """Format a cue and the words of its caption group as a JSON object."""
+    return json.dumps({
+        'index': cue.number,
+        'start': cue.start / 1000000,
+        'end': cue.end / 1000000,
+        'text': cue.text,
+        'words': [{
+            'text': word.text,
+            'start': word.start,
+            'end': word.end,
+            'weight': word.weight,
+            'line_break': word.line_break,
+            'punctuation': isinstance(word, asr.Punc),
+        } for word in cue.group],
+    })
+
+
+@dataclass(frozen=True)
+class Format:
+    """An output format.
+
+    Attributes:
+        extension: The file extension.
+        cue: Function that formats a cue.
+        header: Text in front of the first cue.
+        separator: Text between the cues.
+        footer: Text after the last cue.
+    """
+    extension: str
+    cue: Callable[[Cue], str]
+    header: str = ''
+    separator: str = ''
+    footer: str = ''
+
+
+FORMATS: Dict[str, Format] = {
+    'srt': Format('.srt', _srt),
+    'vtt': Format('.vtt', _vtt, header='WEBVTT\n\n'),
+    'ttml': Format('.ttml', _ttml,
+                   header='<?xml version="1.0" encoding="utf-8"?>\n'
+                          '<tt xmlns="http://www.w3.org/ns/ttml" '
+                          'xml:lang="en">\n  <body>\n    <div>\n',
+                   footer='    </div>\n  </body>\n</tt>\n'),
+    'json': Format('.captions.json', _json, header='[\n', separator=',\n',
+                   footer='\n]\n'),
+}
+
+
+def write_cues(cues_: Iterable[Cue], files: Mapping[str, IO[str]],
+               flush: bool = False) -> None:
+    """
+    Writes cues to files of multiple formats in a single pass: every cue is
+    formatted and written in all formats before the next cue is created.
+
+    Args:
+        cues_: The cues, see cues().
+        files: The opened file of every format, see FORMATS.
+        flush: Flush the files after every cue.
+    """
+    formats = [(FORMATS[name], f) for name, f in files.items()]
+    for fmt, f in formats:
+        f.write(fmt.header)
+
+    first = True
+    for cue in cues_:
+        for fmt, f in formats:
+            if not first:
+                f.write(fmt.separator)
+            f.write(fmt.cue(cue))
+            if flush:
+                f.flush()
+        first = False
+
+    for fmt, f in formats:
+        f.write(fmt.footer)
+        if flush:
+            f.flush()
+
+
+def compose(caption: Groups, fmt: str = 'srt') -> str:
+    """
+    Convert caption groups to the content of a subtitle file as a string.
+
+    Args:
+        caption: The caption groups, consists of a list of our custom
+            Caption-list dataformats.
+        fmt: The output format, see FORMATS.
+
+    Returns:
+        A formatted subtitle file as a string, for srt the same as
+        srt.compose() creates.
     """
-    Writes a srt file from the caption groups using the srt.compose() function.
-    Writes to a file with the given filename.
+    f = io.StringIO()
+    write_cues(cues(caption), {fmt: f})
+    return f.getvalue()
+
+
+def write(caption: Groups, filename: str, fmt: str = 'srt') -> None:
+    """
+    Writes a subtitle file from the caption groups, see write_formats().
 
     Args:
         caption: The caption groups, consists of a list of our custom
             Caption-list dataformats.
-        filename: Name of the file to write the srt file to. Filename is
-            recommended to end with '.srt'.
+        filename: Name of the file to write the subtitles to. Filename is
+            recommended to end with the extension of the format.
+        fmt: The output format, see FORMATS.
+    """
+    write_formats(caption, {fmt: filename})
+
+
+def write_formats(caption: Groups, filenames: Mapping[str, str]) -> None:
     """
-    composed = srt.compose(create_subtitles(caption))
+    Writes subtitle files of multiple formats from the caption groups, in a
+    single pass over the caption groups. The cues are written as they're
+    created. The srt file is the same as the one created by srt.compose().
 
-    with open(filename, 'w') as f:
-        f.write(composed)
+    Args:
+        caption: The caption groups, consists of a list of our custom
+            Caption-list dataformats.
+        filenames: Name of the file to write for every format, see FORMATS.
+    """
+    with contextlib.ExitStack() as stack:
+        files = {fmt: stack.enter_context(open(filename, 'w'))
+                 for fmt, filename in filenames.items()}
+        write_cues(cues(caption), files)
+
+
+def write_stream(caption: Iterable[Caption],
+                 f: Union[IO[str], Mapping[str, IO[str]]]) -> None:
+    """
+    Writes caption groups to opened subtitle files as they come in. Every
+    caption group is written (and flushed) as soon as it's available, so the
+    files can be used while the caption groups are still being created, see
+    the stream module.
+
+    Unlike write(), the subtitles aren't sorted by time, they're written in
+    the order of the caption groups.
+
+    Args:
+        caption: The caption groups, any iterable of our custom Caption-list
+            dataformats.
+        f: The opened srt file to write to, or the opened file of every
+            format, see FORMATS.
+    """
+    files = {'srt': f} if not isinstance(f, Mapping) else f
+    write_cues(_cues(caption), files, flush=True)
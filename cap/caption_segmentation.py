@@ -13,17 +13,28 @@ creator uses the same intro or has certain catchphrases this can be useful. We
 therefore recommend creating a specialised dataset in adjusting the contents of
 the 'directory' variable.
 """
+import argparse
+from dataclasses import dataclass
+import functools
 import os
-from typing import List, Union
+import random
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import torch.optim as optim
-import srt
 
 from . import asr
 from . import caption
+from . import convert
+from . import corpus
+from . import instrument
+from . import weighting
+from .tagcache import TagCache
+from .transcript import Transcript
 
 # Type aliases
 Caption = List[Union[asr.Word, asr.Punc]]
@@ -43,7 +54,8 @@ def create_traindata(directory: str) -> List[List[str]]:
 
     Adds the eoc tags at the end of each caption and replaces the newlines
     with the nl tag. Preprocesses the data in a way that punctuationsymbols
-    can be learned by the model.
+    can be learned by the model, see corpus.tokenize(). To train on many
+    files, build a corpus once with the corpus module instead.
 
     Args:
         directory: The directory containing the trainingset.
@@ -53,28 +65,12 @@ def create_traindata(directory: str) -> List[List[str]]:
     """
     training_data = []
     for entry in os.scandir(directory):
-        filename = entry.path
-        with open(filename) as subs:
-            training_data = []
-
-            for sub in list(srt.parse(subs)):
-                # Add the eoc tags at the end of each caption
-                sub.content += " <eoc>"
-
-                # Preprocess the sub to indepently train on punctuation and nl's
-                sub.content = sub.content.replace('\n', ' <nl> ')
-                sub.content = sub.content.replace('.', ' .')
-                sub.content = sub.content.replace('?', ' ?')
-                sub.content = sub.content.replace('!', ' !')
-                sub.content = sub.content.replace(',', ' ,')
-                sub.content = sub.content.replace(';', ' ;')
-                sub.content = sub.content.replace(':', ' :')
-                training_data.append(sub.content.lower().split())
+        training_data.extend(corpus.tokenize_file(entry.path))
 
     return training_data
 
 
-def create_testdata(training_data: List[List[str]], groups: Groups) -> List[List[str]]:
+def create_testdata(training_data: List[List[str]], groups: Caption) -> List[List[str]]:
     """
     Preprocess the testdata.
 
@@ -93,22 +89,26 @@ def create_testdata(training_data: List[List[str]], groups: Groups) -> List[List
     max_len = max([len(x) for x in training_data])
 
     test_set = [word.text for word in groups]
-    eval_data = []
 
     # Divide the transcript into sentences of input length
-    for i in range(len(test_set) // max_len):
-        eval_data.append(test_set[i*max_len:i*max_len+max_len])
+    return [test_set[i:i+max_len] for i in range(0, len(test_set), max_len)]
 
 
-    eval_data.append(test_set[(i+1)*max_len:
-                              (i+1)*max_len+len(test_set)%max_len])
-
-    return eval_data
-
 # The dimensions of the LSTM.
 EMBEDDING_DIM = 64
 HIDDEN_DIM = 64
 
+# The default training settings. With a batch size of 1, every sentence is a
+# separate SGD step, like the original training loop.
+BATCH_SIZE = 32
+LEARNING_RATE = 0.1
+
+# Padding of the targets in a mini-batch, ignored by the loss.
+PAD_TARGET = -100
+
+# Number of words scored at once when captioning.
+INFERENCE_WORDS = 4096
+
 
 class LSTMCaption(nn.Module):
 
@@ -125,97 +125,393 @@ class LSTMCaption(nn.Module):
         # The linear layer that maps from hidden state space to vocabulary space
         self.hidden2output = nn.Linear(hidden_dim, vocab_size)
 
-    def forward(self, sentence):
+    def forward(self, sentence: torch.Tensor,
+                lengths: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """Score every word of a sentence or a padded mini-batch.
+
+        Args:
+            sentence: The word indices of one sentence, or a mini-batch of
+                padded sentences with shape (batch, length).
+            lengths: The length of every sentence in the mini-batch. Must be
+                given for a mini-batch.
+
+        Returns:
+            The log probabilities of every word in the vocabulary, with shape
+            (length, vocab_size) for one sentence and (batch, length,
+            vocab_size) for a mini-batch.
+        """
+        if lengths is None:
+            embeds = self.word_embeddings(sentence)
+            lstm_out, _ = self.lstm(embeds.view(len(sentence), 1, -1))
+            output_space = self.hidden2output(lstm_out.view(len(sentence), -1))
+            output_scores = F.log_softmax(output_space, dim=1)
+            return output_scores
+
+        # The padding is skipped by the LSTM, so every sentence gets the same
+        # scores as on its own.
         embeds = self.word_embeddings(sentence)
-        lstm_out, _ = self.lstm(embeds.view(len(sentence), 1, -1))
-        output_space = self.hidden2output(lstm_out.view(len(sentence), -1))
-        output_scores = F.log_softmax(output_space, dim=1)
-        return output_scores
+        packed = nn.utils.rnn.pack_padded_sequence(
+            embeds, lengths, batch_first=True, enforce_sorted=False)
+        lstm_out, _ = self.lstm(packed)
+        lstm_out, _ = nn.utils.rnn.pad_packed_sequence(
+            lstm_out, batch_first=True, total_length=sentence.size(1))
+        output_space = self.hidden2output(lstm_out)
+        return F.log_softmax(output_space, dim=2)
 
 
-def train(n_epochs: int, training_data: List[List[str]]):
-    """Train the model on the trainingdata.
+def build_vocab(training_data: List[List[str]]) -> Dict[str, int]:
+    """Make an index set of the observed words.
 
     Args:
-        n_epochs: The number times the model goes over the entire trainingset.
         training_data: The trainingdata, generated by the create_traindata()
             function.
+
+    Returns:
+        The index of every word. Index 0 is 'unk', for unknown words.
+    """
+    word_to_ix = {'unk': 0}
+    for sent in training_data:
+        for word in sent:
+            if word not in word_to_ix:
+                word_to_ix[word] = len(word_to_ix)
+
+    return word_to_ix
+
+
+def batches(sequences: List[torch.Tensor], batch_size: int,
+            rng: Optional[random.Random] = None
+            ) -> Iterator[Tuple[torch.Tensor, torch.Tensor, torch.Tensor]]:
+    """Group sequences into padded mini-batches.
+
+    Sequences of about the same length are batched together, so there is
+    little padding. With a random generator, the lengths are shuffled a bit
+    and the batches are yielded in random order.
+
+    Args:
+        sequences: The word indices of every sentence, see prepare_sequence()
+            and corpus_sequences().
+        batch_size: Maximal number of sentences in a mini-batch.
+        rng: Random generator to shuffle the batches with.
+
+    Yields:
+        The padded inputs and targets with shape (batch, length), and the
+        length of every sentence.
     """
-    for _ in range(n_epochs):
+    def key(i: int) -> Tuple[int, float]:
+        return len(sequences[i]), rng.random() if rng else 0
 
-        # Go once over the entire train data
-        for sentence in training_data:
-            # Step 1. Remember that Pytorch accumulates gradients.
-            # We need to clear them out before each instance
-            model.zero_grad()
+    order = sorted(range(len(sequences)), key=key)
+    chunks = [order[i:i+batch_size] for i in range(0, len(order), batch_size)]
+    if rng is not None:
+        rng.shuffle(chunks)
 
-            # Step 2. Get our inputs ready for the network, that is, turn them into
-            # Tensors of word indices.
-            sentence_in = prepare_sequence(sentence, word_to_ix)
-            # targets = prepare_sequence(tags, tag_to_ix)
+    for chunk in chunks:
+        batch = [sequences[i] for i in chunk]
+        lengths = torch.tensor([len(seq) for seq in batch], dtype=torch.long)
+        inputs = nn.utils.rnn.pad_sequence(batch, batch_first=True)
+        targets = nn.utils.rnn.pad_sequence(batch, batch_first=True,
+                                            padding_value=PAD_TARGET)
+        yield inputs.long(), targets.long(), lengths
 
-            # Step 3. Run our forward pass.
-            output_scores = model(sentence_in)
 
-            pad_idx = len(sentence)
+def corpus_sequences(data: corpus.Corpus) -> List[torch.Tensor]:
+    """Wrap the sentences of a corpus file in tensors.
+
+    The tensors are views of the memory-mapped token ids, nothing is copied
+    until a mini-batch is padded.
+
+    Args:
+        data: The corpus, built by the corpus module.
+
+    Returns:
+        The word indices of every sentence, as int32 tensors.
+    """
+    if not data:
+        return []
+
+    tokens = torch.frombuffer(data.tokens, dtype=torch.int32)
+    return [sequence for sequence in torch.split(tokens, data.lengths())
+            if len(sequence)]
+
+
+def train(n_epochs: int,
+          training_data: Union[List[List[str]], corpus.Corpus],
+          word_to_ix: Dict[str, int], batch_size: int = BATCH_SIZE,
+          learning_rate: float = LEARNING_RATE,
+          threads: Optional[int] = None, seed: int = 0,
+          verbose: bool = True) -> LSTMCaption:
+    """Train the model on the trainingdata.
+
+    The sentences are trained on in padded mini-batches, see batches(). The
+    loss is the mean loss of all words in a mini-batch, so with a batch size
+    of 1 this is the original training loop of one SGD step per sentence.
+
+    Args:
+        n_epochs: The number times the model goes over the entire trainingset.
+        training_data: The trainingdata, generated by the create_traindata()
+            function, or a corpus file, built by the corpus module.
+        word_to_ix: The index of every word, see build_vocab(). For a corpus,
+            Corpus.word_to_ix().
+        batch_size: Maximal number of sentences in a mini-batch.
+        learning_rate: The learning rate of SGD.
+        threads: Number of threads torch uses within an operation, the
+            default of torch if not given.
+        seed: Seed of the initial weights and the order of the batches.
+        verbose: Print the loss, time and throughput of every epoch to
+            stderr.
+
+    Returns:
+        The trained model.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    torch.manual_seed(seed)
+    rng = random.Random(seed)
+
+    model = LSTMCaption(EMBEDDING_DIM, HIDDEN_DIM, len(word_to_ix))
+    loss_function = nn.NLLLoss(ignore_index=PAD_TARGET)
+    optimizer = optim.SGD(model.parameters(), lr=learning_rate)
+
+    # The sentences are converted to tensors once, not every epoch
+    if isinstance(training_data, corpus.Corpus):
+        sequences = corpus_sequences(training_data)
+    else:
+        sequences = [prepare_sequence(sentence, word_to_ix)
+                     for sentence in training_data if sentence]
+    n_words = sum(len(seq) for seq in sequences)
+
+    model.train()
+    for epoch in range(n_epochs):
+        start = time.perf_counter()
+        total_loss = 0.0
+
+        for inputs, targets, lengths in batches(sequences, batch_size, rng):
+            # Pytorch accumulates gradients, clear them for every batch
+            model.zero_grad()
 
-            # Step 4. Compute the loss, gradients, and update the parameters by
-            #  calling optimizer.step()
-            loss = loss_function(output_scores[:pad_idx, :], sentence_in[:pad_idx])
+            output_scores = model(inputs, lengths)
+            loss = loss_function(output_scores.view(-1, len(word_to_ix)),
+                                 targets.view(-1))
             loss.backward()
             optimizer.step()
 
-if __name__ == '__main__':
-    # The directory containing the trainingset
-    directory = r'../dataset/srt/'
-    training_data = create_traindata(directory)
+            total_loss += loss.item() * int(lengths.sum())
 
-    # The path to the to be captioned file
-    path = '../asr/sample01.asrOutput.json'
+        seconds = time.perf_counter() - start
+        if verbose:
+            print(f'epoch {epoch + 1}/{n_epochs}: loss '
+                  f'{total_loss / max(n_words, 1):.4f}, {seconds:.1f} s, '
+                  f'{len(sequences) / seconds:.0f} sentences/s, '
+                  f'{n_words / seconds:.0f} words/s', file=sys.stderr)
 
-    groups = asr.ASR(path).groups()
-    eval_data = create_testdata(training_data, groups)
+    model.eval()
+    return model
 
-    # Make an index set of the observed words
-    word_to_ix = {'unk': 0}
-    for sent in training_data:
-        for word in sent:
-            if word not in word_to_ix:
-                word_to_ix[word] = len(word_to_ix)
 
-    # Make a mapping from the index set to the words
-    ix_to_word = {v:k for (k, v) in word_to_ix.items()}
+@dataclass
+class Segmenter:
+    """A trained model with its vocabulary, see load().
 
-    model = LSTMCaption(EMBEDDING_DIM, HIDDEN_DIM, len(word_to_ix))
-    loss_function = nn.NLLLoss()
-    optimizer = optim.SGD(model.parameters(), lr=0.1)
+    Attributes:
+        model: The trained model, in evaluation mode.
+        word_to_ix: The index of every word, see build_vocab().
+        max_len: Length of the longest training sentence. The transcript is
+            captioned in chunks of this many words.
+    """
+    model: nn.Module
+    word_to_ix: Dict[str, int]
+    max_len: int
 
-    train(5, training_data)
+    @property
+    def eoc(self) -> int:
+        """Index of the end of caption tag."""
+        return self.word_to_ix['<eoc>']
 
-    # Caption the file
+
+def save(model: LSTMCaption, word_to_ix: Dict[str, int], max_len: int,
+         filename: str) -> None:
+    """Save a trained model and its vocabulary in a checkpoint.
+
+    The checkpoint only contains tensors, strings and numbers, so it is
+    loaded without unpickling code.
+
+    Args:
+        model: The trained model, see train().
+        word_to_ix: The index of every word, see build_vocab().
+        max_len: Length of the longest training sentence.
+        filename: Name of the checkpoint file.
+    """
+    torch.save({
+        'state_dict': model.state_dict(),
+        'vocab': sorted(word_to_ix, key=word_to_ix.__getitem__),
+        'max_len': max_len,
+        'embedding_dim': model.word_embeddings.embedding_dim,
+        'hidden_dim': model.hidden_dim,
+    }, filename)
+
+
+@functools.lru_cache(maxsize=None)
+def load(filename: str, quantize: bool = False) -> Segmenter:
+    """Load a checkpoint, see save().
+
+    A checkpoint is loaded once per process, later calls return the same
+    segmenter.
+
+    Args:
+        filename: Name of the checkpoint file.
+        quantize: Convert the weights of the LSTM and linear layer to int8
+            with dynamic quantization, which is faster on most CPUs.
+
+    Returns:
+        The model in evaluation mode and its vocabulary.
+    """
+    checkpoint = torch.load(filename, map_location='cpu')
+    vocab = checkpoint['vocab']
+
+    model = LSTMCaption(checkpoint['embedding_dim'],
+                        checkpoint['hidden_dim'], len(vocab))
+    model.load_state_dict(checkpoint['state_dict'])
+    model.eval()
+
+    if quantize:
+        model = torch.quantization.quantize_dynamic(
+            model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
+
+    return Segmenter(model, {word: ix for ix, word in enumerate(vocab)},
+                     checkpoint['max_len'])
+
+
+def segment_ranges(texts: Sequence[str], segmenter: Segmenter,
+                   batch_words: int = INFERENCE_WORDS
+                   ) -> List[Tuple[int, int]]:
+    """Split a transcript into caption groups with the model.
+
+    The transcript is divided into chunks of segmenter.max_len words, see
+    create_testdata(), and the chunks are scored in padded batches of about
+    batch_words words. A caption group ends before every word the model
+    predicts '<eoc>' for.
+
+    Args:
+        texts: The text of every word of the transcript.
+        segmenter: The model and its vocabulary, see load().
+        batch_words: Number of words to score at once.
+
+    Returns:
+        The (start, end) index of every caption group.
+    """
+    if not texts:
+        return []
+
+    word_to_ix = segmenter.word_to_ix
+    ids = torch.tensor([word_to_ix.get(text.lower(), 0) for text in texts],
+                       dtype=torch.long)
+    chunks = torch.split(ids, segmenter.max_len)
+    per_batch = max(1, batch_words // segmenter.max_len)
+
+    ends = []
     with torch.no_grad():
-        ix = 0
-        optimized_groups = []
-        caption_group = []
+        for i in range(0, len(chunks), per_batch):
+            batch = chunks[i:i+per_batch]
+            lengths = torch.tensor([len(chunk) for chunk in batch],
+                                   dtype=torch.long)
+            inputs = nn.utils.rnn.pad_sequence(batch, batch_first=True)
+            predicted = segmenter.model(inputs, lengths).argmax(dim=2)
+
+            # Drop the padding, the words stay in transcript order
+            valid = (torch.arange(inputs.size(1)).unsqueeze(0)
+                     < lengths.unsqueeze(1))
+            ends.append((predicted == segmenter.eoc)[valid])
+
+    starts = torch.cat(ends).nonzero().flatten().tolist()
+    bounds = [0] + [start for start in starts if start] + [len(texts)]
+    return list(zip(bounds, bounds[1:]))
+
 
-        for sentence in eval_data:
-            inputs = prepare_sequence(sentence, word_to_ix)
-            output_scores = model(inputs)
+def create_groups(data: Transcript, segmenter: Segmenter,
+                  tag_cache: Optional[TagCache] = None,
+                  profiler: Optional[instrument.Profiler] = None) -> Groups:
+    """Create caption groups with the model.
 
-            indices = torch.argmax(output_scores, axis=1)
-            modeled = [ix_to_word[index.item()] for index in indices]
+    Like convert.create_groups(), but the caption groups are split by the
+    model. The words are still weighted, to place the line breaks.
 
-            for model_word, word in zip(modeled, groups[ix:]):
-                if model_word == '<eoc>':
-                    optimized_groups.append(caption_group)
-                    caption_group = []
+    Args:
+        data: Input data without weighting.
+        segmenter: The model and its vocabulary, see load().
+        tag_cache: Persistent cache of previously tagged sentences.
+        profiler: Records every stage, see the instrument module.
 
-                else:
-                    caption_group.append(word)
+    Returns:
+        List that contains the caption groups.
+    """
+    with instrument.stage(profiler, 'weights', len(data)):
+        convert.add_weights(data, tag_cache, profiler=profiler)
+
+    with instrument.stage(profiler, 'segment', len(data)) as totals:
+        ranges = segment_ranges(data.texts(), segmenter)
+        if totals is not None:
+            totals.groups += len(ranges)
+
+    groups = [data.words(lo, hi) for lo, hi in ranges]
+
+    with instrument.stage(profiler, 'cps', len(data)):
+        groups = convert.cps(groups)
+
+    with instrument.stage(profiler, 'line_breaks', len(data)):
+        return weighting.line_breaks(groups)
+
+
+def main() -> None:
+    """Train the model, or load a trained one, and caption an ASR file."""
+    parser = argparse.ArgumentParser(description='Train the LSTM segmenter '
+                                     'and caption an ASR file with it.')
+    parser.add_argument('directory', nargs='?', default='../dataset/srt/',
+                        help='The directory containing the trainingset')
+    parser.add_argument('path', nargs='?',
+                        default='../asr/sample01.asrOutput.json',
+                        help='The path to the to be captioned file')
+    parser.add_argument('--corpus',
+                        help='Train on this corpus file instead of the '
+                             'directory, see cap/corpus.py')
+    parser.add_argument('--checkpoint', default='lstm.pt',
+                        help='Load the model from this file if it exists, '
+                             'else save the trained model to it')
+    parser.add_argument('--retrain', action='store_true',
+                        help='Train the model even if the checkpoint exists')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Caption with an int8 quantized model')
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--threads', type=int,
+                        help='Number of threads within an operation')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.retrain or not os.path.isfile(args.checkpoint):
+        training_data: Union[List[List[str]], corpus.Corpus]
+        if args.corpus:
+            training_data = corpus.Corpus(args.corpus)
+            word_to_ix = training_data.word_to_ix()
+            max_len = training_data.max_len
+        else:
+            training_data = create_traindata(args.directory)
+
+            # Make an index set of the observed words
+            word_to_ix = build_vocab(training_data)
+            max_len = max(len(x) for x in training_data)
+
+        model = train(args.epochs, training_data, word_to_ix,
+                      args.batch_size, args.learning_rate, args.threads,
+                      args.seed)
+        save(model, word_to_ix, max_len, args.checkpoint)
+
+    segmenter = load(args.checkpoint, args.quantize)
 
-                ix += 1
+    # Caption the file
+    data = Transcript(asr.ASR(args.path).groups())
+    caption.write(create_groups(data, segmenter), 'lstm_output.srt')
 
-        optimized_groups.append(caption_group)
 
-        # Write a file
-        caption.write(optimized_groups, 'lstm_output.srt')
+if __name__ == '__main__':
+    main()
@@ -4,13 +4,31 @@ This file contains functions which are used by the command line interface. It
 is used by the 'special' file __main__.py.
 """
 import argparse
+import collections
+import concurrent.futures
+import contextlib
+import cProfile
+import functools
+import glob
+import io
+import itertools
 import json
 import os
 import sys
+import tempfile
+import time
 import traceback
-from typing import Any
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Optional, \
+    Tuple, Union
 
-from . import asr, convert, caption
+from . import asr, convert, caption, daemon, instrument, stream, \
+    transcript, weighting
+from .tagcache import TagCache
+
+
+# errors of an ASR file that can't be parsed
+PARSE_ERRORS = (json.decoder.JSONDecodeError, KeyError, TypeError,
+                UnicodeDecodeError)
 
 
 def err_print(*args: Any, **kwargs: Any) -> None:
@@ -19,42 +37,814 @@ def err_print(*args: Any, **kwargs: Any) -> None:
     sys.exit(1)
 
 
+def read_words(filename: str, verbose: bool) -> Iterator[asr.Word]:
+    """Iterate over the words of the ASR file, exit if it can't be parsed.
+
+    Args:
+        filename: The ASR file.
+        verbose: Show the traceback if the file can't be parsed.
+
+    Yields:
+        The Word and Punc instances.
+    """
+    try:
+        yield from asr.ASR(filename).words()
+    except FileNotFoundError:
+        err_print(f'{filename}: No such file')
+    except PARSE_ERRORS:
+        if verbose:
+            err_print(traceback.format_exc())
+        else:
+            err_print('Something went wrong with parsing the ASR file, run',
+                      'with the --verbose option to see the error')
+
+
+def output_names(name: str, args: argparse.Namespace) -> Dict[str, str]:
+    """Name the subtitle file of every --format.
+
+    Args:
+        name: Name of the subtitle files without extension.
+        args: All command line arguments. Run cap -h to see options.
+
+    Returns:
+        The filename of every format, name + the extension of the format.
+    """
+    return {fmt: name + caption.FORMATS[fmt].extension
+            for fmt in args.format or ['srt']}
+
+
+def load_segmenter(args: argparse.Namespace) -> Any:
+    """Load the --checkpoint of --model lstm.
+
+    The checkpoint is loaded once per process, see caption_segmentation.load().
+    A daemon started with the same --checkpoint and --quantize has loaded it
+    already, before forking the job. torch is only imported when this model
+    is used.
+
+    Args:
+        args: All command line arguments. Run cap -h to see options.
+
+    Returns:
+        The model and its vocabulary, a caption_segmentation.Segmenter.
+    """
+    try:
+        # pylint: disable=import-outside-toplevel
+        from . import caption_segmentation
+    except ImportError:
+        err_print('--model lstm needs torch, install it with: '
+                  'pip install cap[lstm]')
+
+    if not os.path.isfile(args.checkpoint):
+        err_print(f'{args.checkpoint}: No such file, train the model with: '
+                  'python -m cap.caption_segmentation --checkpoint '
+                  f'{args.checkpoint}')
+
+    # the same checkpoint is cached under one name, whatever the cwd
+    return caption_segmentation.load(os.path.abspath(args.checkpoint),
+                                     args.quantize)
+
+
+def write_captions(words: Iterator[asr.Word], outputs: Mapping[str, str],
+                   args: argparse.Namespace, tag_cache: Optional[TagCache],
+                   pool: Optional[concurrent.futures.Executor] = None,
+                   profiler: Optional[instrument.Profiler] = None) -> None:
+    """Create the caption groups of the words and write the subtitle files.
+
+    All formats are written in a single pass over the caption groups.
+
+    Args:
+        words: The Word and Punc instances of an ASR file.
+        outputs: The filename of every format, see output_names().
+        args: All command line arguments. Run cap -h to see options.
+        tag_cache: Persistent cache of previously tagged sentences.
+        pool: Worker processes to caption the words in parallel, see
+            convert.create_groups(). Not used with --stream.
+        profiler: Records every stage, see the instrument module.
+    """
+    if args.stream:
+        # report a missing or invalid ASR file before creating the files
+        first = next(words, None)
+        if first is not None:
+            words = itertools.chain([first], words)
+
+        with contextlib.ExitStack() as stack:
+            files = {fmt: stack.enter_context(open(filename, 'w'))
+                     for fmt, filename in outputs.items()}
+            with instrument.stage(profiler, 'stream'):
+                caption.write_stream(
+                    stream.stream_groups(words, args.latency,
+                                         tag_cache=tag_cache, mode=args.mode,
+                                         profiler=profiler), files)
+    else:
+        with instrument.stage(profiler, 'read') as totals:
+            data = transcript.Transcript(words)
+            if totals is not None:
+                totals.words += len(data)
+
+        if args.model == 'lstm':
+            # pylint: disable=import-outside-toplevel
+            from . import caption_segmentation
+            groups = caption_segmentation.create_groups(
+                data, load_segmenter(args), tag_cache, profiler)
+        else:
+            groups = convert.create_groups(data, tag_cache=tag_cache,
+                                           mode=args.mode, pool=pool,
+                                           profiler=profiler)
+
+        with instrument.stage(profiler, 'write', len(data)):
+            caption.write_formats(groups, outputs)
+
+
+def expand_inputs(inputs: List[str]) -> List[Tuple[str, str]]:
+    """Find the ASR files given on the command line.
+
+    Args:
+        inputs: ASR files, directories (searched recursively for .json files)
+            or glob patterns. A pattern that matches nothing is kept as is, so
+            it's reported as a missing file.
+
+    Returns:
+        Every ASR file once, with its path relative to the directory or
+        pattern it was found in, which is its name in --output-dir.
+    """
+    found: Dict[str, str] = {}
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = glob.glob(os.path.join(glob.escape(pattern), '**',
+                                           '*.json'), recursive=True)
+            for path in sorted(paths):
+                found.setdefault(path, os.path.relpath(path, pattern))
+        else:
+            paths = glob.glob(pattern, recursive=True) or [pattern]
+            for path in sorted(paths):
+                found.setdefault(path, os.path.basename(path))
+
+    return list(found.items())
+
+
+def output_files(files: List[Tuple[str, str]], output_dir: Optional[str]
+                 ) -> List[Tuple[str, str]]:
+    """Name the subtitle files of the ASR files, exit if names collide.
+
+    Args:
+        files: The ASR files and their names in output_dir, see
+            expand_inputs().
+        output_dir: Directory to write the subtitle files to. If None, they
+            are written next to their ASR file.
+
+    Returns:
+        The ASR files with the names of their subtitle files without
+        extension, see output_names().
+    """
+    # default name: sample.json -> sample.srt
+    out_files = []
+    for filename, name in files:
+        name = os.path.join(output_dir, name) if output_dir else filename
+        out_files.append((filename, os.path.splitext(name)[0]))
+
+    counts = collections.Counter(out_file for _, out_file in out_files)
+    duplicates = [out_file for out_file, count in counts.items() if count > 1]
+    if duplicates:
+        err_print('multiple ASR files would be written to',
+                  ', '.join(duplicates))
+
+    return out_files
+
+
+def _prefetch(files: List[Tuple[str, str]], ahead: int
+              ) -> Iterator[Tuple[str, str, Union[bytes, OSError]]]:
+    """Read files in a background thread, ahead of their use.
+
+    Args:
+        files: The (filename, output filename) pairs.
+        ahead: Maximum number of files to read ahead.
+
+    Yields:
+        The filename, output filename and content of every file, or the
+        error if it couldn't be read.
+    """
+    def read(filename: str) -> Union[bytes, OSError]:
+        try:
+            with open(filename, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            return e
+
+    with concurrent.futures.ThreadPoolExecutor(1) as reader:
+        pending: Deque[Tuple[str, str, concurrent.futures.Future]] = \
+            collections.deque()
+        for filename, out_file in files:
+            pending.append((filename, out_file,
+                            reader.submit(read, filename)))
+            if len(pending) > ahead:
+                filename, out_file, content = pending.popleft()
+                yield filename, out_file, content.result()
+
+        for filename, out_file, content in pending:
+            yield filename, out_file, content.result()
+
+
+# tag cache of a batch worker process, see _init_worker()
+_tag_cache: Optional[TagCache] = None
+
+
+def _init_worker(tag_cache: Optional[str]) -> None:
+    """Load the tagger and open the tag cache in a batch worker process.
+
+    Args:
+        tag_cache: Filename of the tag cache, or None.
+    """
+    global _tag_cache  # pylint: disable=global-statement
+
+    weighting.load_tagger()
+    _tag_cache = TagCache(tag_cache) if tag_cache else None
+
+
+def _caption_job(content: bytes, name: str,
+                 args: argparse.Namespace) -> None:
+    """Caption the content of an ASR file, in a batch worker process.
+
+    Args:
+        content: The content of the ASR file.
+        name: Name of the subtitle files without extension.
+        args: All command line arguments. Run cap -h to see options.
+    """
+    words = asr.ASR(io.StringIO(content.decode())).words()
+    write_captions(words, output_names(name, args), args, _tag_cache)
+
+
+def _error_message(filename: str, error: BaseException, verbose: bool
+                   ) -> str:
+    """Describe why an ASR file couldn't be captioned.
+
+    Args:
+        filename: The ASR file.
+        error: The exception raised while captioning it.
+        verbose: Include the traceback.
+
+    Returns:
+        The error message.
+    """
+    if isinstance(error, FileNotFoundError):
+        return f'{filename}: No such file'
+
+    if isinstance(error, PARSE_ERRORS):
+        message = f'{filename}: could not parse the ASR file'
+    else:
+        message = f'{filename}: {type(error).__name__}: {error}'
+
+    if verbose:
+        message += '\n' + ''.join(traceback.format_exception(
+            type(error), error, error.__traceback__))
+
+    return message
+
+
+def batch(files: List[Tuple[str, str]], args: argparse.Namespace) -> None:
+    """Caption many ASR files in parallel.
+
+    The files are captioned by a pool of --jobs worker processes, which keep
+    the tagger loaded. Files are read in a background thread while the
+    workers caption the files before them. A file that can't be captioned
+    doesn't stop the others: all errors are reported at the end, together
+    with the throughput.
+
+    Args:
+        files: The ASR files and their names in --output-dir, see
+            expand_inputs().
+        args: All command line arguments. Run cap -h to see options.
+    """
+    jobs = args.jobs or os.cpu_count() or 1
+    errors: List[str] = []
+    captioned = 0
+    size = 0
+
+    def collect(filename: str, future: concurrent.futures.Future) -> None:
+        nonlocal captioned
+        error = future.exception()
+        if error is None:
+            captioned += 1
+        else:
+            errors.append(_error_message(filename, error, args.verbose))
+
+    out_files = output_files(files, args.output_dir)
+
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_init_worker,
+            initargs=(args.tag_cache,)) as pool:
+        running: Dict[concurrent.futures.Future, str] = {}
+
+        for filename, name, content in _prefetch(out_files, 2 * jobs):
+            if isinstance(content, OSError):
+                errors.append(_error_message(filename, content, args.verbose))
+                continue
+
+            # keep every worker busy, without reading all files into memory
+            if len(running) >= 2 * jobs:
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    collect(running.pop(future), future)
+
+            if os.path.dirname(name):
+                os.makedirs(os.path.dirname(name), exist_ok=True)
+            running[pool.submit(_caption_job, content, name, args)] = \
+                filename
+            size += len(content)
+
+        for future in concurrent.futures.as_completed(running):
+            collect(running[future], future)
+
+    seconds = time.perf_counter() - start
+    print(f'captioned {captioned} of {len(files)} files '
+          f'({size / 1e6:.1f} MB) in {seconds:.2f} s (--jobs {jobs}): '
+          f'{captioned / seconds:.1f} files/s, {size / 1e6 / seconds:.2f} '
+          'MB/s', file=sys.stderr)
+
+    if errors:
+        print('failed:', *errors, sep='\n', file=sys.stderr)
+        sys.exit(1)
+
+
+def report_profile(profiler: instrument.Profiler,
+                   args: argparse.Namespace) -> None:
+    """Print the profile to stderr and write it to --profile-output.
+
+    Args:
+        profiler: The profiler that recorded the stages.
+        args: All command line arguments. Run cap -h to see options.
+    """
+    if args.profile == 'table':
+        print(profiler.table(), file=sys.stderr)
+    elif args.profile == 'json':
+        print(json.dumps(profiler.json(), indent=2), file=sys.stderr)
+
+    if args.profile_output and not args.profile_output.endswith('.prof'):
+        profiler.write_speedscope(args.profile_output)
+
+
 def cli(args: argparse.Namespace) -> None:
     """The command line interface for cap.
 
     This function first parses the provided ASR data using
     the ASR class from the asr module. It then creates caption groups using
     create_groups() from the convert module. After that, it's converted to a
-    SRT file using the write() function from the caption module.
+    SRT file (or any other --format) using the write_formats() function from
+    the caption module.
+
+    With --stream, the caption groups are created by the stream module and
+    written to the subtitle files while the ASR file is read.
+
+    Multiple files, directories or glob patterns are captioned in parallel,
+    see batch().
 
     Args:
         args: All command line arguments. Run cap -h to see options.
     """
+    if args.model == 'lstm':
+        if args.stream:
+            err_print('--stream does not work with --model lstm')
+
+        # load the model before forking, so batch workers share it
+        load_segmenter(args)
+
+    filename = args.files[0]
+    if (len(args.files) > 1 or os.path.isdir(filename) or
+            any(c in filename for c in '*?[')):
+        if args.output:
+            err_print('--output only works with a single ASR file, use '
+                      '--output-dir')
+        if args.profile or args.profile_output:
+            err_print('--profile only works with a single ASR file')
+        batch(expand_inputs(args.files), args)
+        return
+
+    words = read_words(filename, args.verbose)
+
+    # default name: sample.json -> sample.srt
+    name, _ = os.path.splitext(filename)
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        name = os.path.join(args.output_dir, os.path.basename(name))
+    outputs = output_names(name, args)
+
+    if args.output and len(outputs) == 1:
+        outputs = {fmt: args.output for fmt in outputs}
+    elif args.output:
+        outputs = output_names(os.path.splitext(args.output)[0], args)
+
+    tag_cache = TagCache(args.tag_cache) if args.tag_cache else None
+
+    # a single long file is tagged and segmented by multiple processes
+    pool = None
+    if args.jobs and args.jobs > 1 and not args.stream:
+        pool = concurrent.futures.ProcessPoolExecutor(
+            args.jobs, initializer=weighting.load_tagger)
+
+    profiler = None
+    if args.profile or args.profile_output:
+        profiler = instrument.Profiler(memory=args.profile_memory)
+
+    # a .prof file gets a cProfile profile of every function call
+    python_profiler = None
+    if args.profile_output and args.profile_output.endswith('.prof'):
+        python_profiler = cProfile.Profile()
+        python_profiler.enable()
+
     try:
-        data = asr.ASR(args.file).groups()
-    except FileNotFoundError:
-        err_print(f'{args.file}: No such file')
-    except (json.decoder.JSONDecodeError, KeyError, TypeError):
+        write_captions(words, outputs, args, tag_cache, pool, profiler)
+    finally:
+        if python_profiler is not None:
+            python_profiler.disable()
+        if pool is not None:
+            pool.shutdown()
+
+    if profiler is not None:
+        report_profile(profiler, args)
+        if python_profiler is not None:
+            python_profiler.dump_stats(args.profile_output)
+
+    if tag_cache is not None:
         if args.verbose:
-            err_print(traceback.format_exc())
+            print('tag cache:', tag_cache.stats(), file=sys.stderr)
+        tag_cache.close()
+
+
+def download(argv: List[str]) -> None:
+    """Download the tagger models, so captioning never has to.
+
+    Args:
+        argv: The command line arguments after 'cap download'.
+    """
+    parser = argparse.ArgumentParser(prog='cap download',
+                                     description='Download the models used '
+                                     'for POS-tagging.')
+    parser.add_argument('-d', '--download-dir',
+                        help='Directory to save the models in')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="Don't show download progress")
+    args = parser.parse_args(argv)
+
+    if not weighting.download_models(args.download_dir, args.quiet):
+        err_print('Could not download the models')
+
+
+def serve(argv: List[str]) -> None:
+    """Run the HTTP captioning service, see the server module.
+
+    Args:
+        argv: The command line arguments after 'cap serve'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cap serve',
+        description='Run the captioning service. POST an ASR file to '
+                    '/caption to get the SRT file, GET /metrics for latency '
+                    'histograms.')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Host to listen on (default: %(default)s)')
+    parser.add_argument('-p', '--port', type=int, default=8000,
+                        help='Port to listen on (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='Number of worker processes (default: number of '
+                             'CPUs)')
+    parser.add_argument('--queue-size', type=int, default=256,
+                        help='Maximum number of requests in progress, more '
+                             'are refused with 503 (default: %(default)s)')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        help='Maximum number of requests that are tagged '
+                             'together (default: %(default)s)')
+    parser.add_argument('--batch-delay', type=float, default=0.005,
+                        metavar='SECONDS',
+                        help='Maximum time to wait for requests to batch '
+                             'together (default: %(default)s)')
+    parser.add_argument('--tag-cache', metavar='FILE',
+                        help='Cache POS-tags in this file to reuse them in '
+                             'later runs')
+    args = parser.parse_args(argv)
+
+    # imported here, as asyncio slows down the startup of the other commands
+    from . import server  # pylint: disable=import-outside-toplevel
+
+    print(f'serving on http://{args.host}:{args.port}', file=sys.stderr)
+    server.serve(args.host, args.port, workers=args.workers,
+                 queue_size=args.queue_size, batch_size=args.batch_size,
+                 batch_delay=args.batch_delay, tag_cache=args.tag_cache)
+
+
+def run_daemon(argv: List[str]) -> None:
+    """Run the warm daemon that captions for later cap invocations.
+
+    Args:
+        argv: The command line arguments after 'cap daemon'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cap daemon',
+        description='Keep the tagger loaded and caption for later cap '
+                    'invocations, which forward their job to this daemon.')
+    parser.add_argument('-s', '--socket', default=daemon.socket_path(),
+                        help='Unix socket to listen on (default: '
+                             '%(default)s, or $CAP_SOCKET)')
+    parser.add_argument('--checkpoint', metavar='FILE',
+                        help='Also load this LSTM model, for jobs with '
+                             '--model lstm and the same --checkpoint')
+    parser.add_argument('--quantize', action='store_true',
+                        help='Load the --checkpoint with int8 weights, for '
+                             'jobs with --quantize')
+    args = parser.parse_args(argv)
+
+    preload = None
+    if args.checkpoint:
+        preload = functools.partial(load_segmenter, args)
+
+    print(f'listening on {args.socket}', file=sys.stderr)
+    try:
+        daemon.serve(run, args.socket, preload)
+    except RuntimeError as e:
+        err_print(e)
+
+
+def run_eval(argv: List[str]) -> None:
+    """Score generated SRT files against manual ones, see the evaluate module.
+
+    Args:
+        argv: The command line arguments after 'cap eval'.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cap eval',
+        description='Compare generated SRT files with manual SRT files: '
+                    'boundary precision and recall, reading speed and line '
+                    'length violations. Directories are compared file by '
+                    'file, in parallel.')
+    parser.add_argument('generated',
+                        help='Generated SRT file, or directory with SRT files')
+    parser.add_argument('manual',
+                        help='Manual SRT file, or directory with the manual '
+                             'SRT files at the same relative paths')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of files to evaluate in parallel '
+                             '(default: number of CPUs)')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        metavar='SECONDS',
+                        help='Maximal time between matching boundaries '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-cps', type=float, default=15,
+                        help='Maximal characters per second '
+                             '(default: %(default)s)')
+    parser.add_argument('--max-width', type=int, default=42,
+                        help='Maximal characters per line '
+                             '(default: %(default)s)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Also print the results of every file')
+    args = parser.parse_args(argv)
+
+    # imported here, only this command needs it
+    from . import evaluate  # pylint: disable=import-outside-toplevel
+
+    file_pairs, missing = evaluate.pairs(args.generated, args.manual)
+    for filename in missing:
+        print(f'warning: no manual file for {filename}', file=sys.stderr)
+
+    results, errors = evaluate.evaluate_corpus(
+        file_pairs, args.jobs, args.tolerance, args.max_cps, args.max_width)
+    total = sum(results.values(), evaluate.Evaluation())
+
+    if args.json:
+        output: Dict[str, Any] = {'total': total.metrics(), 'errors': errors}
+        if args.verbose:
+            output['files'] = {filename: results[filename].metrics()
+                               for filename in sorted(results)}
+        print(json.dumps(output, indent=2))
+    else:
+        rows = [(filename, results[filename]) for filename in sorted(results)
+                if args.verbose]
+        rows.append(('total', total))
+
+        print(f'{"file":<40} {"subs":>6} {"prec":>6} {"recall":>6} '
+              f'{"f1":>6} {"cps":>5} {"lines":>5} {"basic":>7}')
+        for filename, result in rows:
+            print(f'{filename:<40} {result.generated:6d} '
+                  f'{result.precision:6.3f} {result.recall:6.3f} '
+                  f'{result.f1:6.3f} {result.cps_violations:5d} '
+                  f'{result.line_violations:5d} {result.basic_error:7d}')
+
+    if errors:
+        print('failed:', *(f'{filename}: {error}' for filename, error
+                           in sorted(errors.items())),
+              sep='\n', file=sys.stderr)
+        sys.exit(1)
+
+
+def run_tune(argv: List[str]) -> None:
+    """Tune the weighting parameters, see the tune module.
+
+    Args:
+        argv: The command line arguments after 'cap tune'.
+    """
+    # imported here, only this command needs it
+    from . import tune  # pylint: disable=import-outside-toplevel
+
+    names = [param.name for param in tune.parameters()]
+    parser = argparse.ArgumentParser(
+        prog='cap tune',
+        description='Search the weighting parameters that minimize the '
+                    'basic_error against manual SRT files. Finished trials '
+                    'are saved, so an interrupted search resumes when it is '
+                    'run again.')
+    parser.add_argument('asr_dir', help='Directory with ASR files')
+    parser.add_argument('manual_dir',
+                        help='Directory with the manual SRT files, at the '
+                             'same relative paths as the ASR files')
+    parser.add_argument('--search', choices=('grid', 'random', 'coordinate'),
+                        default='coordinate',
+                        help='Search strategy (default: %(default)s)')
+    parser.add_argument('--params', nargs='+', choices=names, metavar='NAME',
+                        help='Parameters to tune (default: all): '
+                             + ', '.join(names))
+    parser.add_argument('--trials', type=int, default=200,
+                        help='Number of trials of the random search '
+                             '(default: %(default)s)')
+    parser.add_argument('--rounds', type=int, default=2,
+                        help='Maximal number of rounds of the coordinate '
+                             'search (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the random search')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of worker processes (default: number of '
+                             'CPUs)')
+    parser.add_argument('--tag-cache', metavar='FILE',
+                        help='Cache POS-tags in this file to reuse them in '
+                             'later runs')
+    parser.add_argument('--results', default='tune.jsonl', metavar='FILE',
+                        help='File to save the trials in, and to resume from '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    tuned = [param for param in tune.parameters()
+             if not args.params or param.name in args.params]
+
+    if args.search == 'grid':
+        size = 1
+        for param in tuned:
+            size *= len(param.values)
+        if size > tune.MAX_GRID:
+            err_print(f'the grid has {size} trials, select fewer parameters '
+                      'with --params or use another --search')
+
+    file_pairs, missing = tune.pairs(args.asr_dir, args.manual_dir)
+    for filename in missing:
+        print(f'warning: no manual file for {filename}', file=sys.stderr)
+    if not file_pairs:
+        err_print(f'no ASR files with a manual file in {args.asr_dir}')
+
+    def report(params: Dict[str, float], error: int) -> None:
+        changed = {name: value for name, value in params.items()
+                   if value != default[name]}
+        print(f'basic_error {error:7d} with {changed or "the defaults"}',
+              file=sys.stderr)
+
+    default = tune.defaults()
+    with contextlib.ExitStack() as stack:
+        # the workers of the search read the tags of prepare() from the cache
+        tag_cache = args.tag_cache
+        if tag_cache is None:
+            tag_cache = os.path.join(
+                stack.enter_context(tempfile.TemporaryDirectory()),
+                'tags.sqlite')
+
+        start = time.perf_counter()
+        tune.prepare(file_pairs, tag_cache, args.jobs)
+        print(f'prepared {len(file_pairs)} files in '
+              f'{time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+        search = stack.enter_context(tune.Search(
+            file_pairs, tag_cache, args.results, args.jobs, report,
+            tune.corpus_fingerprint(file_pairs)))
+        if search.ignored:
+            print(f'warning: ignoring {search.ignored} trials in '
+                  f'{args.results} of other files or another version of '
+                  'cap', file=sys.stderr)
+        if search.best is not None:
+            print(f'resuming from {len(search.errors)} recorded trials, best '
+                  f'basic_error {search.best[1]}', file=sys.stderr)
+
+        default_error = search.run([default])[0]
+
+        start = time.perf_counter()
+        if args.search == 'grid':
+            search.run(tune.grid(tuned, default))
+        elif args.search == 'random':
+            search.run(tune.random_search(tuned, default, args.trials,
+                                          args.seed))
         else:
-            err_print('Something went wrong with parsing the ASR file, run',
-                      'with the --verbose option to see the error')
+            tune.coordinate_search(search, tuned, default, args.rounds)
+        seconds = time.perf_counter() - start
 
-    groups = convert.create_groups(data)
+    best, error = search.best or (default, default_error)
+    print(f'{len(search.errors)} trials ({seconds:.1f} s in this run), '
+          f'basic_error {default_error} with the defaults, {error} with:')
+    for name, value in best.items():
+        changed = '' if value == default[name] else \
+            f'   (default {default[name]:g})'
+        print(f'  {name:<28} {value:g}{changed}')
 
-    # default name: sample.json -> sample.srt
-    name, _ = os.path.splitext(args.file)
-    out_file = args.output or name + '.srt'
 
-    caption.write(groups, out_file)
+# subcommands: cap <command> [args]
+COMMANDS = {
+    'daemon': run_daemon,
+    'download': download,
+    'eval': run_eval,
+    'serve': serve,
+    'tune': run_tune,
+}
 
 
-def parse_args() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-o', '--output', help='Name of the srt file')
-    parser.add_argument('file', help='The ASR file to extract data from')
+def run(argv: List[str]) -> None:
+    """Caption ASR files, the main command of cap.
+
+    Args:
+        argv: The command line arguments, run cap -h to see options.
+    """
+    parser = argparse.ArgumentParser(
+        prog='cap',
+        epilog='other commands: ' + ', '.join(f'cap {cmd}' for cmd in COMMANDS)
+    )
+    parser.add_argument('-o', '--output',
+                        help='Name of the srt file. With multiple formats, '
+                             'the extension is replaced by the extension of '
+                             'every format')
+    parser.add_argument('files', nargs='+', metavar='file',
+                        help='The ASR file to extract data from. Multiple '
+                             'files, directories or glob patterns are '
+                             'captioned in parallel')
+    parser.add_argument('-f', '--format', action='append',
+                        choices=caption.FORMATS,
+                        help='Output format, repeat to write multiple formats '
+                             'in one run (default: srt)')
+    parser.add_argument('-d', '--output-dir', metavar='DIR',
+                        help='Write the output files to this directory '
+                             'instead of next to the ASR files')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of files to caption in parallel '
+                             '(default: number of CPUs), or the number of '
+                             'processes for a single file (default: 1)')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Show traceback if error occurs')
+    parser.add_argument('--tag-cache', metavar='FILE',
+                        help='Cache POS-tags in this file to reuse them in '
+                             'later runs')
+    parser.add_argument('--mode', choices=convert.SEGMENTERS,
+                        default='greedy',
+                        help='How to create caption groups: split greedily at '
+                             'the highest weights, or choose the groups with '
+                             'the lowest total cost (default: %(default)s)')
+    parser.add_argument('--model', choices=('rules', 'lstm'), default='rules',
+                        help='Split caption groups with the weighting rules, '
+                             'or with a trained LSTM model (needs torch) '
+                             '(default: %(default)s)')
+    parser.add_argument('--checkpoint', metavar='FILE', default='lstm.pt',
+                        help='With --model lstm, the trained model, see '
+                             'cap/caption_segmentation.py '
+                             '(default: %(default)s)')
+    parser.add_argument('--quantize', action='store_true',
+                        help='With --model lstm, use int8 weights, which is '
+                             'faster on most CPUs')
+    parser.add_argument('--stream', action='store_true',
+                        help='Write caption groups while reading the ASR '
+                             'file, as soon as they are final')
+    parser.add_argument('--latency', type=float, default=10, metavar='SECONDS',
+                        help='With --stream, the maximal time between the end '
+                             'of a caption group and the last word read '
+                             'before it is written (default: %(default)s)')
+
+    parser.add_argument('--profile', nargs='?', const='table',
+                        choices=('table', 'json'),
+                        help='Print the time, words and groups of every stage '
+                             'to stderr, as a table (default) or JSON')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='With --profile, also trace the memory '
+                             'allocated by every stage (slow)')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='Write a cProfile profile of all function calls '
+                             'if FILE ends with .prof, else the stages as a '
+                             'speedscope profile (speedscope.app)')
+
+    cli(parser.parse_args(argv))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+        return
+
+    # let a warm daemon do the work, if one is running
+    status = daemon.forward(argv)
+    if status is not None:
+        sys.exit(status)
 
-    cli(parser.parse_args())
+    run(argv)
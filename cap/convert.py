@@ -5,17 +5,30 @@ Module for converting the input data, consisting of words with time stamps and
 POS-tags, to caption groups.  The error between the created output and the
 manual-subtitles can also be measured by basic_error.
 """
-from typing import List, Union
+from array import array
+import concurrent.futures
+import functools
+import itertools
+import math
+import operator
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
 
 import srt
 
 from . import asr
+from . import instrument
 from . import weighting
+from .tagcache import TagCache
+from .transcript import Transcript
+from .weighting import Rule
 
 
 Caption = List[Union[asr.Word, asr.Punc]]
 Groups = List[Caption]
 
+# minimal number of words that are segmented per job by parallel_groups()
+CHUNK_WORDS = 2000
+
 
 def check_cps(data: Caption, max_cps: float = 15,
               deviation: float = 1.5) -> int:
@@ -47,15 +60,135 @@ def check_cps(data: Caption, max_cps: float = 15,
     return 0
 
 
-def cps(data: Groups, threshold: float = 0.75) -> Groups:
+def _after(value: float, step: float, k: int) -> float:
+    """
+    Adds step to value k times. The additions are done one after another, so
+    the result is rounded like the time of a caption group after k steps of
+    the original cps() loop.
+
+    Args:
+        value: The initial value.
+        step: The value to add.
+        k: The number of steps.
+
+    Returns:
+        The value after k steps.
+    """
+    return functools.reduce(operator.add, itertools.repeat(step, k), value)
+
+
+def _first(cond: Callable[[int], bool], estimate: float, last: int) -> int:
+    """
+    Finds the first step for which a condition holds from an estimate. The
+    estimate is exact, except for rounding, so the first step is the step
+    after it or the one before that.
+
+    Args:
+        cond: The condition, False up to some step and True after it.
+        estimate: The (fractional) step at which the condition becomes True.
+        last: The last step.
+
+    Returns:
+        The first step for which the condition holds, or last if there's none.
+    """
+    k = min(max(math.ceil(estimate), 0), last)
+    if k > 0 and cond(k - 1):
+        return k - 1
+
+    if k < last and not cond(k):
+        return k + 1
+
+    return k
+
+
+def _retime(chars: int, start: float, end: float,
+            next_start: Optional[float], threshold: float, max_it: int,
+            max_cps: float, deviation: float) -> Tuple[float, float]:
+    """
+    Computes the times of one caption group after cps(). The number of 0.05
+    second steps follows directly from the characters per second limits and
+    the gap with the next caption group.
+
+    A single step can change the characters per second from too low to too
+    high, or the other way around, if the caption group has fewer than 0.05
+    / (1 / (max_cps - deviation) - 1 / (max_cps + deviation)) characters
+    (3.7 with the defaults). Then the caption group is alternately shortened
+    and lengthened, one step at a time, until the characters per second are
+    right, the gap with the next caption group is too small or there have
+    been max_it steps.
+
+    Args:
+        chars: Number of characters in the caption group.
+        start: Start time of the caption group.
+        end: End time of the caption group.
+        next_start: Start time of the next caption group, None for the last.
+        threshold: Indicates the maximum time difference.
+        max_it: Maximum number of steps.
+        max_cps: Indicates the optimal characters per second.
+        deviation: Indicates how much it can deviate from max_cps.
+
+    Returns:
+        The new start and end time. Caption groups without a positive
+        duration keep their times.
+    """
+    low, high = max_cps - deviation, max_cps + deviation
+
+    def rate(start: float, end: float) -> float:
+        return chars / (end - start) if end > start else math.inf
+
+    if end <= start or max_it <= 0:
+        return start, end
+
+    k = 0
+    if rate(start, end) < low:
+        # shorten until the characters per second are at least low
+        k = _first(lambda j: rate(_after(start, 0.015, j),
+                                  _after(end, -0.035, j)) >= low,
+                   (end - start - chars / low) / 0.05, max_it)
+        start, end = _after(start, 0.015, k), _after(end, -0.035, k)
+
+    elif rate(start, end) > high and next_start is not None:
+        # lengthen until the characters per second are at most high, as long
+        # as the gap with the next caption group is larger than threshold
+        k = min(_first(lambda j: rate(start, _after(end, 0.05, j)) <= high,
+                       (chars / high - (end - start)) / 0.05, max_it),
+                _first(lambda j: next_start - _after(end, 0.05, j)
+                       <= threshold,
+                       (next_start - end - threshold) / 0.05, max_it))
+        end = _after(end, 0.05, k)
+
+    # the steps of the original loop, after a step that jumped over the
+    # limits or to stop at a small gap
+    while k < max_it and not low <= rate(start, end) <= high:
+        if rate(start, end) < low:
+            start, end = start + 0.015, end - 0.035
+        elif next_start is not None and next_start - end > threshold:
+            end += 0.05
+        else:
+            break
+        k += 1
+
+    return start, end
+
+
+def cps(data: Groups, threshold: float = 0.75,
+        next_start: Optional[float] = None) -> Groups:
     """
     Adjusts the time of the caption group so the subtitles stay shorter or
     longer on the screen. It adjusts it according to the 15 characters per
     second limit.
 
+    Caption groups that are too slow are shortened in steps of 0.05 seconds,
+    caption groups that are too fast are lengthened in steps of 0.05 seconds
+    as long as there's a large enough gap with the next caption group. The
+    number of steps is computed directly for all caption groups, in one pass.
+    Caption groups without a positive duration keep their times.
+
     Args:
         data: Caption group according to our custom Caption-list datastructure.
         threshold: Indicates the maximum time difference.
+        next_start: Start time of the caption group after the last one in
+            data, if the transcript continues after data.
 
     Returns:
         The data with changed a changed start time for the first word of the
@@ -63,30 +196,17 @@ def cps(data: Groups, threshold: float = 0.75) -> Groups:
         group
     """
     max_it = int((threshold / 0.05) - 1)
-    for i, group in enumerate(data):
-        it = 0
-        check = check_cps(group)
 
-        while check != 0 and it != max_it:
-            if check == -1:
-                group[-1].end -= 0.035
-                group[0].start += 0.015
-                check = check_cps(group)
-                it += 1
+    chars = [len(' '.join(word.text for word in group)) for group in data]
 
-            else:
-                try:
-                    strt = data[i+1][0].start
-                except IndexError:
-                    break
+    # the start times before they're changed
+    next_starts: List[Optional[float]] = [group[0].start for group in data[1:]]
+    next_starts.append(next_start)
 
-                if strt - group[-1].end > threshold:
-                    group[-1].end += 0.05
-                    check = check_cps(group)
-                    it += 1
-
-                else:
-                    check = 0
+    for i, group in enumerate(data):
+        group[0].start, group[-1].end = _retime(
+            chars[i], group[0].start, group[-1].end, next_starts[i],
+            threshold, max_it, 15, 1.5)
 
     return data
 
@@ -110,14 +230,22 @@ def basic_error(input_subs: List[srt.Subtitle], manual_subs: List[srt.Subtitle],
         Amount of correctly created caption groups, and amount of times
         max_width was exceeded.
     """
+    # the (last word, first word of the next) boundary of every subtitle
+    first = [(sub.content.split() or [''])[0] for sub in manual_subs]
+    last = [(sub.content.split() or [''])[-1] for sub in manual_subs]
+
+    # a generated boundary is correct if it's the boundary of a manual
+    # subtitle at the same index or later, so only the last index of every
+    # boundary matters
+    latest = {boundary: i for i, boundary in enumerate(zip(last, first[1:]))}
+
     good = 0
     penalty = 0
     for i, (sub1, next_sub1) in enumerate(zip(input_subs, input_subs[1:])):
-        for sub2, next_sub2 in zip(manual_subs[i:], manual_subs[i+1:]):
-            if sub1.content.split()[-1] == sub2.content.split()[-1] and \
-               next_sub1.content.split()[0] == next_sub2.content.split()[0]:
-                good += 1
-                break
+        boundary = ((sub1.content.split() or [''])[-1],
+                    (next_sub1.content.split() or [''])[0])
+        if latest.get(boundary, -1) >= i:
+            good += 1
 
         if max_width and len(sub1.content) > max_width:
             penalty += 1
@@ -125,18 +253,476 @@ def basic_error(input_subs: List[srt.Subtitle], manual_subs: List[srt.Subtitle],
     return -(good - penalty)
 
 
-def split_weights(subs: Caption, result: Groups = [],
+def _range_max_table(weights: Sequence[float]) -> List[List[int]]:
+    """Create a sparse table for range-maximum queries.
+
+    Row k of the table contains, for every index i, the index of the leftmost
+    maximum of weights[i:i+2**k].
+
+    Args:
+        weights: The weights of the words.
+
+    Returns:
+        The sparse table.
+    """
+    table = [list(range(len(weights)))]
+    width = 1
+    while 2 * width <= len(weights):
+        row = table[-1]
+        table.append([a if weights[a] >= weights[b] else b
+                      for a, b in zip(row, row[width:])])
+        width *= 2
+
+    return table
+
+
+def _range_max(table: List[List[int]], weights: Sequence[float], lo: int,
+               hi: int) -> int:
+    """Return the index of the leftmost maximum of weights[lo:hi].
+
+    Args:
+        table: The sparse table of the weights, see _range_max_table().
+        weights: The weights of the words.
+        lo: Index of the first word, lo < hi.
+        hi: Index after the last word.
+
+    Returns:
+        The index of the leftmost maximum weight.
+    """
+    k = (hi - lo).bit_length() - 1
+    a = table[k][lo]
+    b = table[k][hi - (1 << k)]
+    return a if weights[a] >= weights[b] else b
+
+
+def _first_equal(data: Transcript, lo: int, index: int) -> int:
+    """Find the first word from lo on that is equal to the word at index.
+
+    split_weights() finds the word with the highest weight with list.index(),
+    which returns the first Word or Punc instance that is equal to it, even
+    before the words it was chosen from. With ordered times, only punctuation
+    after the same word can be equal, so the words with the same start time
+    are searched.
+
+    Args:
+        data: The transcript with added weights.
+        lo: Index of the first word of the caption group that is split.
+        index: Index of the word.
+
+    Returns:
+        The index of the first equal word.
+    """
+    start, end, weight = data.start, data.end, data.weight
+    text = data.text_at(index)
+
+    first = index
+    k = index - 1
+    while k >= lo and start[k] == start[index]:
+        if end[k] == end[index] and weight[k] == weight[index] and \
+                data.punc[k] == data.punc[index] and \
+                data.line_break[k] == data.line_break[index] and \
+                data.text_at(k) == text:
+            first = k
+        k -= 1
+
+    return first
+
+
+def split_ranges(data: Transcript, char_limit: int = 81,
+                 char_limit_div: int = 5) -> List[Tuple[int, int]]:
+    """
+    Function that splits the transcript based on the highest weights. See
+    split_weights(), this function works on index ranges instead of lists.
+
+    The ranges are split iteratively in the same order as split_weights()
+    does. The text lengths come from the offsets of the transcript and the
+    split points from a sparse table, so this takes O(n log n) time.
+
+    Args:
+        data: The transcript with added weights.
+        char_limit: Maximal number of characters for one caption group, which is
+            standard 81.
+        char_limit_div: The diviation of the maximal characters in a caption
+            group.
+
+    Returns:
+        List that contains the (begin, end) index of every caption group.
+    """
+    weights = data.weight
+    table = _range_max_table(weights)
+
+    result = []
+    todo = [(0, len(data))]
+    while todo:
+        lo, hi = todo.pop()
+        if data.chars(lo, hi) <= char_limit:
+            result.append((lo, hi))
+            continue
+
+        # the words that can be split on, as in subs[div:-div]
+        div = char_limit_div
+        first, last, _ = slice(div, -div).indices(hi - lo)
+        if first >= last:
+            continue
+
+        max_index = _first_equal(
+            data, lo, _range_max(table, weights, lo + first, lo + last))
+
+        # split the left part first
+        todo.append((max_index+1, hi))
+        todo.append((lo, max_index+1))
+
+    return result
+
+
+def _line_fits(data: Transcript, width: int) -> List[int]:
+    """Find the longest first line that starts at every word.
+
+    Args:
+        data: The transcript.
+        width: The maximal length of a line.
+
+    Returns:
+        For every word i, the largest index k such that the words i..k fit on
+        one line.
+    """
+    result = []
+    k = 0
+    for i in range(len(data)):
+        k = max(k, i)
+        while k < len(data) and data.chars(i, k + 1) <= width:
+            k += 1
+        result.append(k)
+
+    return result
+
+
+def optimal_ranges(data: Transcript, char_limit: int = 81,
+                   line_width: int = 42, group_penalty: float = 6,
+                   cps_factor: float = 1, line_penalty: float = 2,
+                   max_cps: float = 15, deviation: float = 1.5
+                   ) -> List[Tuple[int, int]]:
+    """
+    Function that splits the transcript at the caption group boundaries with
+    the lowest total cost, using dynamic programming. Unlike split_ranges(),
+    all boundaries are chosen at once.
+
+    The cost of a caption group is the sum of:
+        - group_penalty, so fewer caption groups are preferred.
+        - minus the weight of the last word, so splitting after words with a
+          high weight is preferred. The last caption group doesn't get this.
+        - the relative deviation of the characters per second from max_cps,
+          see check_cps(), times cps_factor.
+        - line_penalty if the caption group can't be split into two lines
+          of at most line_width characters, see weighting.line_breaks().
+    Caption groups longer than char_limit characters are not allowed, unless
+    they consist of a single word. So a caption group spans a bounded number
+    of words and this takes linear time in the length of the transcript.
+
+    Splitting a caption group after a word with a weight above group_penalty
+    + 2 * (cps_factor + line_penalty), like a speech gap, always lowers the
+    cost. So the caption groups always end after these words, see
+    forced_splits(), and the words between them are segmented independently.
+
+    Args:
+        data: The transcript with added weights.
+        char_limit: Maximal number of characters for one caption group, which is
+            standard 81.
+        line_width: The maximal length of a line.
+        group_penalty: Cost of every caption group.
+        cps_factor: Importance of the characters per second.
+        line_penalty: Cost of a caption group that doesn't fit on two lines.
+        max_cps: Indicates the optimal characters per second, which is 15.
+        deviation: Indicates how much it can deviate from the optimal 15
+            characters per second.
+
+    Returns:
+        List that contains the (begin, end) index of every caption group.
+    """
+    n = len(data)
+    start, end, weight = data.start, data.end, data.weight
+    offsets = data.offsets
+    fits = _line_fits(data, line_width)
+    forced = set(forced_splits(data, group_penalty, cps_factor, line_penalty))
+
+    # best[j] is the lowest cost of the words before j, split after prev[j],
+    # counted from the last forced split before j
+    best = [0.0] * (n + 1)
+    prev = [0] * (n + 1)
+    first = 0
+
+    for j in range(1, n + 1):
+        best[j] = math.inf
+
+        for i in range(j - 1, first - 1, -1):
+            chars = offsets[j] - offsets[i] + j - i - 1
+            if chars > char_limit and i < j - 1:
+                break
+
+            # the relative deviation from max_cps, at most 1
+            cost = best[i]
+            duration = end[j-1] - start[i]
+            if duration <= 0:
+                cost += cps_factor
+            else:
+                dev = abs(chars / duration - max_cps) - deviation
+                if dev > 0:
+                    cost += cps_factor * min(dev / max_cps, 1)
+
+            # the longest first line leaves a too long second line
+            k = fits[i]
+            if k < j and offsets[j] - offsets[k] + j - k - 1 > line_width:
+                cost += line_penalty
+
+            if cost < best[j]:
+                best[j] = cost
+                prev[j] = i
+
+        # the part of the cost that is the same for every choice of i
+        best[j] += group_penalty - weight[j-1] if j < n else group_penalty
+
+        if j in forced:
+            best[j] = 0.0
+            first = j
+
+    result = []
+    j = n
+    while j > 0:
+        result.append((prev[j], j))
+        j = prev[j]
+
+    return result[::-1]
+
+
+def forced_splits(data: Transcript, group_penalty: float = 6,
+                  cps_factor: float = 1, line_penalty: float = 2
+                  ) -> List[int]:
+    """
+    Function that finds where optimal_ranges() always splits the transcript:
+    after the words with a weight above group_penalty + 2 * (cps_factor +
+    line_penalty), except the last word. With the default parameters, this
+    includes all speech gaps.
+
+    Args:
+        data: The transcript with added weights.
+        group_penalty: See optimal_ranges().
+        cps_factor: See optimal_ranges().
+        line_penalty: See optimal_ranges().
+
+    Returns:
+        The indices of the words that start a caption group after a forced
+        split.
+    """
+    bound = group_penalty + 2 * (cps_factor + line_penalty)
+    return [j for j in range(1, len(data)) if data.weight[j-1] > bound]
+
+
+def greedy_cuts(data: Transcript, char_limit: int = 81,
+                char_limit_div: int = 5, threshold: float = 1.5
+                ) -> List[int]:
+    """
+    Function that finds the speech gaps where split_ranges() always splits
+    the transcript, if the words before speech gaps have higher weights than
+    all other words (as with the weights of add_weights()). The words between
+    these speech gaps are segmented independently, so they can be segmented
+    on their own.
+
+    A range of words that is split contains a speech gap in its middle words
+    (all but the first and last char_limit_div), so it's split at a speech
+    gap. A speech gap is returned if the previous and next speech gaps (or
+    the ends of the transcript) are more than char_limit_div words and
+    char_limit characters away from it. Then every range around it is split,
+    with the speech gap in its middle words, until it's split at the speech
+    gap itself. The splits before that, at other speech gaps, are the same as
+    the first splits of the words before or after the speech gap on their
+    own.
+
+    Args:
+        data: The transcript, with or without weights.
+        char_limit: See split_ranges().
+        char_limit_div: See split_ranges().
+        threshold: The length of a speech gap, see weighting.speech_gaps().
+
+    Returns:
+        The indices of the words after these speech gaps.
+    """
+    div = char_limit_div
+    gaps = speech_gap_starts(data, threshold)
+    bounds = [0] + gaps + [len(data)]
+
+    return [c for p, c, q in zip(bounds, bounds[1:], bounds[2:])
+            if c - p > div and q - c > div
+            and data.chars(p, c) > char_limit
+            and data.chars(c, q) > char_limit]
+
+
+def speech_gap_starts(data: Transcript, threshold: float = 1.5) -> List[int]:
+    """Find the words after the speech gaps of weighting.speech_gaps().
+
+    Args:
+        data: The transcript.
+        threshold: The length of a speech gap.
+
+    Returns:
+        The indices of the words after a speech gap.
+    """
+    start, end = data.start, data.end
+    return [j for j in range(1, len(data))
+            if start[j] - end[j-1] > threshold]
+
+
+def _gaps_outweigh(weights: Sequence[float], gaps: List[int]) -> bool:
+    """Check if the words before speech gaps outweigh the other words.
+
+    Args:
+        weights: The weights of the words.
+        gaps: The indices of the words after the speech gaps.
+
+    Returns:
+        Whether the weight of every word before a speech gap is higher than
+        the weight of every other word except the last, see greedy_cuts().
+    """
+    if not gaps:
+        return True
+
+    others = array('d', weights[:-1])
+    for j in gaps:
+        others[j-1] = -math.inf
+
+    return max(others) < min(weights[j-1] for j in gaps)
+
+
+def _chunk_groups(job: Tuple[Transcript, Tuple[Rule, ...], Tuple[bytes, bytes],
+                             Optional[float], str]
+                  ) -> Tuple['array[float]', Groups]:
+    """Create the caption groups of a tagged chunk, see parallel_groups().
+
+    Args:
+        job: The tagged chunk of the transcript, the POS rules, the tag ids
+            of the words around the chunk (see weighting.pos_rules()), the
+            start time of the word after the chunk and the segmentation mode.
+
+    Returns:
+        The weights of the words and the caption groups of the chunk.
+    """
+    data, rules, context, next_start, mode = job
+
+    # like add_weights(), with the words around the chunk
+    weighting.speech_gaps(data, next_start=next_start)
+    weighting.punctuation(data)
+    weighting.pos_rules(data, rules, context=context)
+    weights = data.weight
+
+    groups = [data.words(lo, hi) for lo, hi in SEGMENTERS[mode](data)]
+    groups = cps(groups, next_start=next_start)
+    return weights, weighting.line_breaks(groups)
+
+
+def parallel_groups(data: Transcript, pool: concurrent.futures.Executor,
+                    tag_cache: Optional[TagCache] = None,
+                    mode: str = 'greedy',
+                    tags: Optional[Sequence[str]] = None,
+                    chunk_words: int = CHUNK_WORDS,
+                    profiler: Optional[instrument.Profiler] = None
+                    ) -> Groups:
+    """
+    Function that creates the caption groups like create_groups(), in
+    parallel. The transcript is tagged in parallel and then cut into chunks
+    of at least chunk_words words at speech gaps, where the caption groups
+    of the chunks are the same as those of the whole transcript: the speech
+    gaps of greedy_cuts() in 'greedy' mode and all speech gaps (which are
+    forced splits, see forced_splits()) in 'dp' mode. The worker processes
+    weight the chunks with the tags around them, segment them, retime them
+    with the start time of the next chunk and add the line breaks.
+
+    The conditions of the cuts are checked on the weights afterwards. If
+    they don't hold, which doesn't happen with the weights of add_weights(),
+    the whole transcript is segmented again.
+
+    Args:
+        data: Input data without weighting.
+        pool: The worker processes, which preferably have the tagger loaded
+            (initializer=weighting.load_tagger).
+        tag_cache: Persistent cache of previously tagged sentences.
+        mode: The segmentation mode, 'greedy' or 'dp'.
+        tags: The POS-tags of the words, if they are tagged already.
+        chunk_words: Minimal number of words of a chunk.
+        profiler: Records the tagging and the chunks as stages, see the
+            instrument module.
+
+    Returns:
+        List that contains the caption groups.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in SEGMENTERS:
+        raise ValueError(f'unknown segmentation mode {mode!r}, choose from '
+                         + ', '.join(SEGMENTERS))
+
+    with instrument.stage(profiler, 'pos_tags', len(data)):
+        if tags is None:
+            weighting.pos_tags(data, cache=tag_cache, pool=pool)
+        else:
+            data.set_tags(tags)
+
+    gaps = speech_gap_starts(data)
+    cuts = [0]
+    for j in greedy_cuts(data) if mode == 'greedy' else gaps:
+        if j - cuts[-1] >= chunk_words and len(data) - j >= chunk_words:
+            cuts.append(j)
+    chunks = list(zip(cuts, cuts[1:] + [len(data)]))
+
+    rules = tuple(weighting.RULES)
+    before, after = weighting.rule_context(rules)
+    tag_ids = data.tag.tobytes()
+    jobs = [(data.slice(lo, hi), rules,
+             (tag_ids[max(lo - before, 0):lo],
+              tag_ids[hi:None if after is None else hi + after]),
+             data.start[hi] if hi < len(data) else None, mode)
+            for lo, hi in chunks]
+
+    with instrument.stage(profiler, 'chunks', len(data)) as totals:
+        results = list(pool.map(_chunk_groups, jobs)) if len(jobs) > 1 \
+            else [_chunk_groups(jobs[0])]
+
+        data.weight = array('d')
+        for weights, _ in results:
+            data.weight.extend(weights)
+        groups = [group for _, part in results for group in part]
+
+        if totals is not None:
+            totals.groups += len(groups)
+
+    if len(chunks) == 1:
+        exact = True
+    elif mode == 'greedy':
+        exact = _gaps_outweigh(data.weight, gaps)
+    else:
+        exact = set(cuts[1:]) <= set(forced_splits(data))
+
+    if not exact:
+        ranges = SEGMENTERS[mode](data)
+        groups = cps([data.words(lo, hi) for lo, hi in ranges])
+        groups = weighting.line_breaks(groups)
+
+    return groups
+
+
+def split_weights(subs: Caption, result: Optional[Groups] = None,
                   char_limit: int = 81, char_limit_div: int = 5) -> Groups:
     """
     Function that splits the input data based on the highest weights.
-    Recursively go trough the input data and split at the word after the
-    highest weight. For every caption group created is checked if the caption
-    group doesn't exceed the maximum characters. If it doesn't exceed the
-    maximum characters, append the caption group to the result list.
+    Go trough the input data and split at the word after the highest weight.
+    For every caption group created is checked if the caption group doesn't
+    exceed the maximum characters. If it doesn't exceed the maximum
+    characters, append the caption group to the result list. Caption groups
+    that exceed the maximum characters but are too short to split are left
+    out.
 
     Args:
         subs: The caption-list with added weights.
-        result: Empty list for the caption groups.
+        result: List to append the caption groups to, a new list by default.
         char_limit: Maximal number of characters for one caption group, which is
             standard 81.
         char_limit_div: The diviation of the maximal characters in a caption
@@ -145,47 +731,164 @@ def split_weights(subs: Caption, result: Groups = [],
     Returns:
         List that contains the caption groups.
     """
-    if len(' '.join(x.text for x in subs)) <= char_limit:
-        result.append(subs)
-        return result
+    result = [] if result is None else result
+    ranges = split_ranges(Transcript(subs), char_limit, char_limit_div)
+    result.extend(subs[lo:hi] for lo, hi in ranges)
+    return result
 
-    try:
-        max_weight = max(subs[char_limit_div:-char_limit_div],
-                         key=lambda t: t.weight)
-    except ValueError:
-        return result
 
-    max_index = subs.index(max_weight)
+# segmentation modes of create_groups()
+SEGMENTERS: Dict[str, Callable[[Transcript], List[Tuple[int, int]]]] = {
+    'greedy': split_ranges,
+    'dp': optimal_ranges,
+}
 
-    split_weights(subs[:max_index+1])
-    split_weights(subs[max_index+1:])
 
-    return result
+def add_weights(data: Transcript, tag_cache: Optional[TagCache] = None,
+                tags: Optional[Sequence[str]] = None,
+                pool: Optional[concurrent.futures.Executor] = None,
+                profiler: Optional[instrument.Profiler] = None
+                ) -> Transcript:
+    """
+    Function that adds the weights to the words in the transcript, using the
+    functions for adding weight in weighting.py. The words are POS-tagged
+    once and the tags are shared by all POS weighting functions.
 
+    Args:
+        data: Input data without weighting.
+        tag_cache: Persistent cache of previously tagged sentences.
+        tags: The POS-tags of the words, if they are tagged already. See
+            weighting.tag_sentences() and weighting.sentence_tokens().
+        pool: Worker processes to tag the words in parallel.
+        profiler: Records every weighting function as a stage, see the
+            instrument module.
 
-def create_groups(subs: Caption) -> Groups:
+    Returns:
+        The transcript with added weights.
+    """
+    with instrument.stage(profiler, 'speech_gaps', len(data)):
+        data = weighting.speech_gaps(data)
+    with instrument.stage(profiler, 'punctuation', len(data)):
+        data = weighting.punctuation(data)
+
+    # all POS weighting functions at once, see weighting.RULES
+    with instrument.stage(profiler, 'pos_tags', len(data)):
+        if tags is None:
+            weighting.pos_tags(data, cache=tag_cache, pool=pool)
+        else:
+            data.set_tags(tags)
+
+    with instrument.stage(profiler, 'pos_rules', len(data)) as totals:
+        data = weighting.pos_rules(data)
+
+    # the rules share a single scan, so only their matches are counted
+    if totals is not None:
+        for name, matches in weighting.rule_matches(data).items():
+            totals.counts[name] = totals.counts.get(name, 0) + matches
+
+    return data
+
+
+def create_ranges(data: Transcript, tag_cache: Optional[TagCache] = None,
+                  mode: str = 'greedy',
+                  pool: Optional[concurrent.futures.Executor] = None,
+                  profiler: Optional[instrument.Profiler] = None,
+                  tags: Optional[Sequence[str]] = None
+                  ) -> List[Tuple[int, int]]:
+    """
+    Function that adds the weights to the words in the transcript with
+    add_weights() and then splits it into caption groups, see
+    create_groups(). The caption groups aren't retimed and don't have line
+    breaks yet.
+
+    Args:
+        data: Input data without weighting.
+        tag_cache: Persistent cache of previously tagged sentences.
+        mode: The segmentation mode, 'greedy' or 'dp'.
+        pool: Worker processes to tag in parallel.
+        profiler: Records the weighting and segmentation stages, see the
+            instrument module.
+        tags: The POS-tags of the words, if they are tagged already.
+
+    Returns:
+        List that contains the (begin, end) index of every caption group.
+
+    Raises:
+        ValueError: If the mode is unknown.
+    """
+    if mode not in SEGMENTERS:
+        raise ValueError(f'unknown segmentation mode {mode!r}, choose from '
+                         + ', '.join(SEGMENTERS))
+
+    with instrument.stage(profiler, 'weights', len(data)):
+        add_weights(data, tag_cache, tags, pool, profiler)
+
+    with instrument.stage(profiler, 'segment', len(data)) as totals:
+        ranges = SEGMENTERS[mode](data)
+        if totals is not None:
+            totals.groups += len(ranges)
+
+    return ranges
+
+
+def create_groups(subs: Union[Caption, Transcript],
+                  tag_cache: Optional[TagCache] = None,
+                  mode: str = 'greedy',
+                  pool: Optional[concurrent.futures.Executor] = None,
+                  profiler: Optional[instrument.Profiler] = None,
+                  tags: Optional[Sequence[str]] = None
+                  ) -> Groups:
     """
     Function that first adds the weights to the words in the caption-list and
     then uses the split_weight function to create caption groups. Adding
     weight is done by using the functions for adding weight in weighting.py.
-    They are listed in order of importance. Now that the words have weights,
-    the function split_weight can be used to create the caption groups.
+    They are listed in order of importance. The words are POS-tagged once and
+    the tags are shared by all POS weighting functions. Now that the words have
+    weights, the function split_weight can be used to create the caption
+    groups.
+
+    The weights are added to a columnar Transcript, a Caption-list is converted
+    to one first.
+
+    The mode selects how the caption groups are created: 'greedy' splits at
+    the highest weights with split_ranges(), 'dp' chooses the caption groups
+    with the lowest total cost with optimal_ranges().
+
+    With a pool of worker processes, which preferably have the tagger loaded
+    (initializer=weighting.load_tagger), long transcripts are tagged in
+    parallel and the parts between speech gaps are weighted, segmented and
+    given line breaks in parallel, see parallel_groups(). The caption groups
+    are the same as without a pool.
 
     Args:
-        subs: Input data without weighting.
+        subs: Input data without weighting, a Caption-list or Transcript.
+        tag_cache: Persistent cache of previously tagged sentences.
+        mode: The segmentation mode, 'greedy' or 'dp'. A ValueError is
+            raised for other modes.
+        pool: Worker processes to tag and segment in parallel.
+        profiler: Records the wall time, words and groups of every stage,
+            see the instrument module.
+        tags: The POS-tags of the words, if they are tagged already.
 
     Returns:
         List that contains the caption groups.
     """
-    subs = weighting.speech_gaps(subs)
-    subs = weighting.punctuation(subs)
-    subs = weighting.pos_pron_verb(subs)
-    subs = weighting.pos_det_noun(subs)
-    subs = weighting.pos_prep_phrase(subs)
-    subs = weighting.pos_conj_phrase(subs)
-    subs = weighting.complex_verbs(subs)
+    data = subs if isinstance(subs, Transcript) else Transcript(subs)
+
+    if pool is not None:
+        return parallel_groups(data, pool, tag_cache, mode, tags,
+                               profiler=profiler)
+
+    ranges = create_ranges(data, tag_cache, mode, profiler=profiler,
+                           tags=tags)
+
+    with instrument.stage(profiler, 'groups', len(data)) as totals:
+        groups = [data.words(lo, hi) for lo, hi in ranges]
+        if totals is not None:
+            totals.groups += len(groups)
 
-    groups = split_weights(subs)
-    groups = cps(groups)
+    with instrument.stage(profiler, 'cps', len(data)):
+        groups = cps(groups)
 
-    return weighting.line_breaks(groups)
+    with instrument.stage(profiler, 'line_breaks', len(data)):
+        return weighting.line_breaks(groups)
@@ -0,0 +1,254 @@
+"""A preprocessed training corpus for the LSTM segmenter.
+
+Tokenizing manual subtitles (parsing the SRT files and splitting off
+punctuation and line breaks) takes longer than training on them once there
+are many files. build() tokenizes all SRT files of a directory once, in
+parallel, and writes the token ids of every subtitle to a binary corpus file
+with its vocabulary next to it. Corpus memory-maps the file, so training reads
+the token ids without parsing or copying them.
+
+The corpus file consists of a header, the offset of every subtitle in the
+token ids (n_sentences + 1 int64 values) and the token ids (n_tokens int32
+values), in native byte order. The vocabulary file has one word per line, the
+word of token id i on line i. Id 0 is 'unk', like caption_segmentation's
+build_vocab().
+
+Usage:
+    $ python -m cap.corpus srt/ corpus.bin [--jobs 8]
+
+Example:
+    >>> from cap import corpus
+    >>> data = corpus.Corpus('corpus.bin')
+    >>> [data.vocab[ix] for ix in data[0]]
+    ['thanks', 'to', 'last', 'past', 'for', '<nl>', 'sponsoring', '<eoc>']
+"""
+import argparse
+from array import array
+import concurrent.futures
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import srt
+
+
+# magic, number of subtitles, number of tokens, length of the longest subtitle
+HEADER = struct.Struct('=8sQQQ')
+MAGIC = b'CAPCORP1'
+
+# punctuation is split off words, line breaks are replaced by a tag
+_TOKENS = str.maketrans({
+    '\n': ' <nl> ',
+    '.': ' .',
+    '?': ' ?',
+    '!': ' !',
+    ',': ' ,',
+    ';': ' ;',
+    ':': ' :',
+})
+
+
+def tokenize(content: str) -> List[str]:
+    """Split the content of a subtitle into tokens.
+
+    Punctuation marks become separate tokens, line breaks become '<nl>' and
+    the subtitle ends with '<eoc>'. The tokens are lowercased.
+
+    Args:
+        content: The content of a subtitle.
+
+    Returns:
+        The tokens of the subtitle.
+    """
+    tokens = content.translate(_TOKENS).lower().split()
+    tokens.append('<eoc>')
+    return tokens
+
+
+def tokenize_file(filename: str) -> List[List[str]]:
+    """Tokenize the subtitles of an SRT file.
+
+    Args:
+        filename: Name of the SRT file.
+
+    Returns:
+        The tokens of every subtitle, see tokenize().
+    """
+    with open(filename, encoding='utf-8-sig') as f:
+        return [tokenize(sub.content) for sub in srt.parse(f.read())]
+
+
+def _tokenize_file(filename: str) -> Union[List[List[str]], str]:
+    """Tokenize an SRT file in a worker process, see tokenize_file().
+
+    Args:
+        filename: Name of the SRT file.
+
+    Returns:
+        The tokens of every subtitle, or the error message if the file
+        couldn't be read. Some srt errors can't be pickled, so they aren't
+        raised.
+    """
+    try:
+        return tokenize_file(filename)
+    except (OSError, ValueError, srt.SRTParseError) as e:
+        return f'{type(e).__name__}: {e}'
+
+
+def srt_files(directory: str) -> List[str]:
+    """Find the SRT files in a directory.
+
+    Args:
+        directory: The directory, searched recursively.
+
+    Returns:
+        The SRT files, sorted by path.
+    """
+    found: List[str] = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.endswith('.srt'))
+
+    return found
+
+
+def vocab_name(filename: str) -> str:
+    """Return the name of the vocabulary file of a corpus file."""
+    return filename + '.vocab'
+
+
+def build(directory: str, filename: str, jobs: Optional[int] = None
+          ) -> Tuple[int, Dict[str, str]]:
+    """Tokenize the SRT files of a directory into a corpus file.
+
+    The files are tokenized in parallel, the token ids are assigned in file
+    order. The token ids are kept in a compact array until they are written,
+    the tokens of one file at a time.
+
+    Args:
+        directory: The directory with SRT files, searched recursively.
+        filename: Name of the corpus file. The vocabulary is written to
+            vocab_name(filename).
+        jobs: Number of worker processes, defaults to the number of CPUs.
+
+    Returns:
+        The number of subtitles, and the error of every SRT file that
+        couldn't be tokenized.
+    """
+    word_to_ix = {'unk': 0}
+    offsets = array('q', [0])
+    tokens = array('i')
+    errors: Dict[str, str] = {}
+    max_len = 0
+
+    files = srt_files(directory)
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        for path, result in zip(files, pool.map(_tokenize_file, files,
+                                                chunksize=8)):
+            if isinstance(result, str):
+                errors[path] = result
+                continue
+
+            for sentence in result:
+                tokens.extend(word_to_ix.setdefault(word, len(word_to_ix))
+                              for word in sentence)
+                offsets.append(len(tokens))
+                max_len = max(max_len, len(sentence))
+
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(offsets) - 1, len(tokens), max_len))
+        offsets.tofile(f)
+        tokens.tofile(f)
+
+    with open(vocab_name(filename), 'w', encoding='utf-8') as f:
+        f.writelines(word + '\n' for word in word_to_ix)
+
+    return len(offsets) - 1, errors
+
+
+class Corpus:
+    """A memory-mapped corpus file, see build().
+
+    The file is mapped copy-on-write, so the token ids can be wrapped in a
+    writable buffer (for example with torch.frombuffer()) without copying
+    them or changing the file.
+
+    Args:
+        filename: Name of the corpus file.
+
+    Attributes:
+        offsets: The start of every subtitle in the tokens, and the end of
+            the last one.
+        tokens: The token ids of all subtitles.
+        vocab: The word of every token id.
+        max_len: Number of tokens of the longest subtitle.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        magic, n_sentences, n_tokens, self.max_len = \
+            HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f'{filename} is not a corpus file')
+
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        end = start + 8 * (n_sentences + 1)
+        self.offsets = view[start:end].cast('q')
+        self.tokens = view[end:end + 4 * n_tokens].cast('i')
+
+        with open(vocab_name(filename), encoding='utf-8') as f:
+            self.vocab = f.read().split('\n')[:-1]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> memoryview:
+        """Return the token ids of a subtitle, without copying them."""
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def lengths(self) -> List[int]:
+        """Return the number of tokens of every subtitle."""
+        offsets = self.offsets
+        return [offsets[i + 1] - offsets[i] for i in range(len(self))]
+
+    def word_to_ix(self) -> Dict[str, int]:
+        """Return the index of every word, like build_vocab()."""
+        return {word: ix for ix, word in enumerate(self.vocab)}
+
+    def close(self) -> None:
+        """Release the views and unmap the file."""
+        self.offsets.release()
+        self.tokens.release()
+        self._mmap.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Tokenize SRT files into a corpus for the LSTM segmenter')
+    parser.add_argument('directory',
+                        help='Directory with SRT files, searched recursively')
+    parser.add_argument('corpus', help='Name of the corpus file')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of worker processes (default: number '
+                             'of CPUs)')
+    args = parser.parse_args()
+
+    sentences, errors = build(args.directory, args.corpus, args.jobs)
+    for path, error in errors.items():
+        print(f'{path}: {error}', file=sys.stderr)
+
+    print(f'{sentences} subtitles written to {args.corpus}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Warm daemon for the command line interface.
+
+Every `cap <asr-file>` process imports the tagger modules and loads the tagger
+model, which takes much longer than captioning a short clip. `cap daemon`
+keeps a warm process listening on a Unix socket. When it runs, `cap` forwards
+its command line arguments and working directory to the daemon instead of
+captioning in-process:
+
+- The daemon forks a child for every job, so jobs run in parallel and start
+  with the tagger already loaded.
+- The child runs the same code as an in-process run, in the working directory
+  and with the environment and umask of the client, and sends back what it
+  printed and its exit status.
+- If no daemon is running, `cap` captions in-process as usual. So does a
+  client whose NLTK_DATA differs from the daemon's, because the daemon has a
+  tagger loaded already.
+- The client only connects to a socket that is owned by the same user and
+  not accessible to others. Where the platform supports it, it also checks
+  that the daemon itself runs as the same user.
+
+The socket is $CAP_SOCKET if set, else cap-<uid>.sock in $XDG_RUNTIME_DIR or
+$TMPDIR. Set CAP_DAEMON=0 to never forward jobs.
+
+Example:
+    $ cap daemon &
+    $ cap file.json -o file.srt
+"""
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import traceback
+from typing import Any, Callable, Dict, List, Optional, cast
+
+from . import weighting
+
+
+# maximum time to wait for the daemon to accept a job
+CONNECT_TIMEOUT = 1
+
+# environment variables that must be the same for the client and the daemon,
+# because the daemon used them before the job started
+PRELOADED = ('NLTK_DATA',)
+
+
+def socket_path() -> str:
+    """Return the path of the daemon socket."""
+    if 'CAP_SOCKET' in os.environ:
+        return os.environ['CAP_SOCKET']
+
+    directory = (os.environ.get('XDG_RUNTIME_DIR') or
+                 os.environ.get('TMPDIR') or '/tmp')
+    return os.path.join(directory, f'cap-{os.getuid()}.sock')
+
+
+def _owned(path: str) -> bool:
+    """Check that a socket belongs to this user and nobody else can use it.
+
+    Args:
+        path: Path of the socket.
+
+    Returns:
+        Whether the path is a socket of this user, without permissions for
+        the group or others.
+    """
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+
+    return (stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid() and
+            not info.st_mode & 0o077)
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    """Return the user id of the process on the other end of a socket.
+
+    Args:
+        sock: A connected Unix socket.
+
+    Returns:
+        The user id, or None if the platform doesn't support SO_PEERCRED.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+
+    credentials = struct.Struct('3i')
+    _, uid, _ = credentials.unpack(sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+    return int(uid)
+
+
+def _umask() -> int:
+    """Return the umask of this process."""
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return umask
+
+
+def forward(argv: List[str], path: Optional[str] = None) -> Optional[int]:
+    """Run a job in the daemon, if one is running.
+
+    What the job prints is printed to stdout and stderr of this process.
+    Jobs are only sent to a daemon of the same user, see _owned(), because the
+    request contains the environment of this process.
+
+    Args:
+        argv: The command line arguments of the job.
+        path: Path of the daemon socket, see socket_path().
+
+    Returns:
+        The exit status of the job, or None if no daemon handled it.
+    """
+    if (not hasattr(socket, 'AF_UNIX') or
+            os.environ.get('CAP_DAEMON', '1') == '0'):
+        return None
+
+    path = path or socket_path()
+    if not _owned(path):
+        return None
+
+    request = json.dumps({
+        'argv': argv,
+        'cwd': os.getcwd(),
+        'env': dict(os.environ),
+        'umask': _umask(),
+    }).encode()
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(CONNECT_TIMEOUT)
+            sock.connect(path)
+            if _peer_uid(sock) not in (None, os.getuid()):
+                return None
+
+            sock.settimeout(None)
+            sock.sendall(request)
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile('rb') as f:
+                response = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+    if response.get('refused'):
+        return None
+
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Run a single job, in a child process of the daemon."""
+
+    def handle(self) -> None:
+        request = json.loads(self.rfile.read())
+        server = cast(_Server, self.server)
+
+        env = request['env']
+        if any(env.get(key) != server.environ.get(key) for key in PRELOADED):
+            self._respond({'refused': 'the environment of the daemon differs'})
+            return
+
+        os.environ.clear()
+        os.environ.update(env)
+        os.umask(request['umask'])
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(request['cwd'])
+                server.run(request['argv'])
+            except SystemExit as e:
+                if isinstance(e.code, int):
+                    status = e.code
+                elif e.code is not None:
+                    print(e.code, file=sys.stderr)
+                    status = 1
+            except Exception:  # pylint: disable=broad-except
+                traceback.print_exc()
+                status = 1
+
+        self._respond({
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+            'status': status,
+        })
+
+    def _respond(self, response: Dict[str, Any]) -> None:
+        """Send the response to the client.
+
+        Args:
+            response: The output and exit status of the job, or why it was
+                refused.
+        """
+        self.wfile.write(json.dumps(response).encode())
+
+
+class _Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server that forks a child for every job.
+
+    Args:
+        path: Path of the socket.
+        run: Function that runs a job given its command line arguments.
+
+    Attributes:
+        environ: The environment of the daemon when it started.
+    """
+
+    def __init__(self, path: str, run: Callable[[List[str]], None]) -> None:
+        super().__init__(path, _Handler)
+        self.run = run
+        self.environ = dict(os.environ)
+
+
+def serve(run: Callable[[List[str]], None], path: Optional[str] = None,
+          preload: Optional[Callable[[], None]] = None) -> None:
+    """Run the daemon until interrupted or terminated.
+
+    Args:
+        run: Function that runs a job in-process given its command line
+            arguments, for example cli.run().
+        path: Path of the daemon socket, see socket_path().
+        preload: Function that loads other models before serving, so the
+            forked children inherit them like the tagger.
+
+    Raises:
+        RuntimeError: If a daemon is already listening on the socket.
+    """
+    path = path or socket_path()
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(path)
+            except OSError:
+                os.unlink(path)  # left behind by a daemon that was killed
+            else:
+                raise RuntimeError(f'a daemon is already running on {path}')
+
+    # forked children inherit the loaded tagger
+    weighting.load_tagger()
+    if preload is not None:
+        preload()
+
+    # stop on SIGTERM just like on ctrl-c, so the socket is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    old_umask = os.umask(0o177)
+    try:
+        server = _Server(path, run)
+    finally:
+        os.umask(old_umask)
+
+    try:
+        with server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
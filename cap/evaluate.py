@@ -0,0 +1,361 @@
+"""Evaluate generated subtitles against manual subtitles.
+
+The boundaries between consecutive subtitles are compared in time: a
+generated boundary matches a manual boundary if both are within a tolerance
+of each other and the words around them are the same. The boundaries of both
+files are sorted by time, so they are matched in a single two-pointer sweep,
+in O(n + m) time for n generated and m manual subtitles.
+
+Besides boundary precision, recall and F1, the generated subtitles are
+checked for reading speed (characters per second) and line length
+violations. convert.basic_error() is reported too, to compare with older
+results.
+
+Example:
+    >>> from cap import evaluate
+    >>> result = evaluate.evaluate_files('generated.srt', 'manual.srt')
+    >>> result.precision, result.recall
+    (0.82, 0.79)
+"""
+import concurrent.futures
+from dataclasses import dataclass, fields
+import os
+import string
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, \
+    Tuple, Union
+
+import srt
+
+from . import convert
+
+
+# characters stripped from the words around a boundary before comparing them
+_STRIP = string.punctuation + '‘’“”…'
+
+
+@dataclass
+class Evaluation:
+    """Counts of an evaluation, see evaluate().
+
+    Evaluations of multiple files are combined by adding them, so the metrics
+    of a corpus are computed from the total counts (micro-averaged).
+
+    Attributes:
+        files: Number of evaluated file pairs.
+        generated: Number of generated subtitles.
+        manual: Number of manual subtitles.
+        boundaries: Number of boundaries between generated subtitles.
+        manual_boundaries: Number of boundaries between manual subtitles.
+        matched: Number of generated boundaries that match a manual boundary.
+        cps_violations: Number of generated subtitles that are read faster
+            than the maximal characters per second.
+        line_violations: Number of generated subtitles with a line longer
+            than the maximal width, or with more than two lines.
+        basic_error: The convert.basic_error() of the subtitles.
+    """
+    files: int = 0
+    generated: int = 0
+    manual: int = 0
+    boundaries: int = 0
+    manual_boundaries: int = 0
+    matched: int = 0
+    cps_violations: int = 0
+    line_violations: int = 0
+    basic_error: int = 0
+
+    def __add__(self, other: 'Evaluation') -> 'Evaluation':
+        return Evaluation(*(getattr(self, f.name) + getattr(other, f.name)
+                            for f in fields(self)))
+
+    @property
+    def precision(self) -> float:
+        """Share of the generated boundaries that match."""
+        return self.matched / self.boundaries if self.boundaries else 0.0
+
+    @property
+    def recall(self) -> float:
+        """Share of the manual boundaries that are matched."""
+        if not self.manual_boundaries:
+            return 0.0
+
+        return self.matched / self.manual_boundaries
+
+    @property
+    def f1(self) -> float:
+        """Harmonic mean of the precision and recall."""
+        total = self.precision + self.recall
+        return 2 * self.precision * self.recall / total if total else 0.0
+
+    def metrics(self) -> Dict[str, float]:
+        """Return the counts and metrics.
+
+        Returns:
+            All attributes and the precision, recall and F1.
+        """
+        result: Dict[str, float] = {f.name: getattr(self, f.name)
+                                    for f in fields(self)}
+        result.update(precision=self.precision, recall=self.recall,
+                      f1=self.f1)
+        return result
+
+
+def _word(text: str, index: int) -> str:
+    """Return the normalized first or last word of a subtitle.
+
+    Args:
+        text: The content of the subtitle.
+        index: 0 for the first word, -1 for the last word.
+
+    Returns:
+        The word lowercased without punctuation, '' for an empty subtitle.
+    """
+    words = text.split()
+    return words[index].strip(_STRIP).lower() if words else ''
+
+
+def boundaries(subs: Sequence[srt.Subtitle]
+               ) -> List[Tuple[float, str, str]]:
+    """Find the boundaries between consecutive subtitles.
+
+    Args:
+        subs: The subtitles, sorted by start time.
+
+    Returns:
+        The time of every boundary (halfway between the end of a subtitle and
+        the start of the next) and the normalized words before and after it,
+        sorted by time.
+    """
+    firsts = [_word(sub.content, 0) for sub in subs]
+    lasts = [_word(sub.content, -1) for sub in subs]
+    times = [((sub.end + next_sub.start) / 2).total_seconds()
+             for sub, next_sub in zip(subs, subs[1:])]
+    return sorted(zip(times, lasts, firsts[1:]))
+
+
+def match_boundaries(generated: Sequence[Tuple[float, str, str]],
+                     manual: Sequence[Tuple[float, str, str]],
+                     tolerance: float = 0.5) -> int:
+    """Count the generated boundaries that match a manual boundary.
+
+    Boundaries match if they are at most tolerance seconds apart and have the
+    same words around them. Every manual boundary matches at most one
+    generated boundary, and matches never cross, so both lists are swept once
+    with two pointers.
+
+    Args:
+        generated: The generated boundaries, see boundaries().
+        manual: The manual boundaries, see boundaries().
+        tolerance: Maximal time between matching boundaries in seconds.
+
+    Returns:
+        The number of matches.
+    """
+    matched = 0
+    lo = 0
+    for time, before, after in generated:
+        while lo < len(manual) and manual[lo][0] < time - tolerance:
+            lo += 1
+
+        j = lo
+        while j < len(manual) and manual[j][0] <= time + tolerance:
+            if manual[j][1] == before and manual[j][2] == after:
+                matched += 1
+                lo = j + 1
+                break
+            j += 1
+
+    return matched
+
+
+def violations(subs: Iterable[srt.Subtitle], max_cps: float = 15,
+               max_width: int = 42) -> Tuple[int, int]:
+    """Count the subtitles that break the reading speed and line rules.
+
+    Args:
+        subs: The subtitles.
+        max_cps: Maximal characters per second, see convert.check_cps().
+        max_width: Maximal number of characters on a line.
+
+    Returns:
+        The number of subtitles that are read too fast, and the number of
+        subtitles with too long or too many lines.
+    """
+    cps = lines = 0
+    for sub in subs:
+        text = sub.content.split('\n')
+        seconds = (sub.end - sub.start).total_seconds()
+        chars = len(' '.join(text))
+        if chars and (seconds <= 0 or chars / seconds > max_cps):
+            cps += 1
+
+        if len(text) > 2 or any(len(line) > max_width for line in text):
+            lines += 1
+
+    return cps, lines
+
+
+def evaluate(generated: Sequence[srt.Subtitle],
+             manual: Sequence[srt.Subtitle], tolerance: float = 0.5,
+             max_cps: float = 15, max_width: int = 42) -> Evaluation:
+    """Evaluate generated subtitles against manual subtitles.
+
+    Args:
+        generated: The generated subtitles, sorted by start time.
+        manual: The manual subtitles, sorted by start time.
+        tolerance: Maximal time between matching boundaries in seconds.
+        max_cps: Maximal characters per second.
+        max_width: Maximal number of characters on a line.
+
+    Returns:
+        The counts of the evaluation.
+    """
+    generated_boundaries = boundaries(generated)
+    manual_boundaries = boundaries(manual)
+    cps, lines = violations(generated, max_cps, max_width)
+
+    return Evaluation(
+        files=1,
+        generated=len(generated),
+        manual=len(manual),
+        boundaries=len(generated_boundaries),
+        manual_boundaries=len(manual_boundaries),
+        matched=match_boundaries(generated_boundaries, manual_boundaries,
+                                 tolerance),
+        cps_violations=cps,
+        line_violations=lines,
+        basic_error=convert.basic_error(list(generated), list(manual),
+                                        max_width),
+    )
+
+
+def read(filename: str) -> List[srt.Subtitle]:
+    """Read the subtitles of an SRT file.
+
+    Args:
+        filename: Name of the SRT file.
+
+    Returns:
+        The subtitles, sorted by start time.
+    """
+    with open(filename, encoding='utf-8-sig') as f:
+        return sorted(srt.parse(f.read()))
+
+
+def evaluate_files(generated_file: str, manual_file: str,
+                   tolerance: float = 0.5, max_cps: float = 15,
+                   max_width: int = 42) -> Evaluation:
+    """Evaluate a generated SRT file against a manual SRT file.
+
+    Args:
+        generated_file: Name of the generated SRT file.
+        manual_file: Name of the manual SRT file.
+        tolerance: Maximal time between matching boundaries in seconds.
+        max_cps: Maximal characters per second.
+        max_width: Maximal number of characters on a line.
+
+    Returns:
+        The counts of the evaluation.
+    """
+    return evaluate(read(generated_file), read(manual_file), tolerance,
+                    max_cps, max_width)
+
+
+def pairs(generated: str, manual: str, extension: str = '.srt',
+          manual_name: Optional[Callable[[str], str]] = None
+          ) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """Pair the generated SRT files with their manual SRT files.
+
+    Args:
+        generated: A generated SRT file, or a directory that is searched
+            recursively for SRT files.
+        manual: The manual SRT file, or a directory with manual SRT files at
+            the same relative paths as the generated ones.
+        extension: Extension of the files that are searched for in a
+            directory, for example '.json' to pair ASR files.
+        manual_name: Function that maps the relative path of a found file to
+            the relative path of its manual file, the same path by default.
+
+    Returns:
+        The (generated, manual) file pairs, and the generated files without a
+        manual file.
+    """
+    if not os.path.isdir(generated):
+        return [(generated, manual)], []
+
+    found = []
+    missing = []
+    for root, dirs, files in os.walk(generated):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith(extension):
+                continue
+
+            path = os.path.join(root, name)
+            relpath = os.path.relpath(path, generated)
+            if manual_name is not None:
+                relpath = manual_name(relpath)
+
+            manual_file = os.path.join(manual, relpath)
+            if os.path.isfile(manual_file):
+                found.append((path, manual_file))
+            else:
+                missing.append(path)
+
+    return found, missing
+
+
+def _evaluate_pair(generated_file: str, manual_file: str, tolerance: float,
+                   max_cps: float, max_width: int) -> Union[Evaluation, str]:
+    """Evaluate a file pair in a worker process, see evaluate_files().
+
+    Args:
+        generated_file: Name of the generated SRT file.
+        manual_file: Name of the manual SRT file.
+        tolerance: Maximal time between matching boundaries in seconds.
+        max_cps: Maximal characters per second.
+        max_width: Maximal number of characters on a line.
+
+    Returns:
+        The evaluation, or the error message if a file couldn't be read.
+        Some srt errors can't be pickled, so they aren't raised.
+    """
+    try:
+        return evaluate_files(generated_file, manual_file, tolerance,
+                              max_cps, max_width)
+    except (OSError, ValueError, srt.SRTParseError) as e:
+        return f'{type(e).__name__}: {e}'
+
+
+def evaluate_corpus(file_pairs: Sequence[Tuple[str, str]],
+                    jobs: Optional[int] = None, tolerance: float = 0.5,
+                    max_cps: float = 15, max_width: int = 42
+                    ) -> Tuple[Dict[str, Evaluation], Dict[str, str]]:
+    """Evaluate file pairs in parallel.
+
+    Args:
+        file_pairs: The (generated, manual) SRT files, see pairs().
+        jobs: Number of worker processes, defaults to the number of CPUs.
+        tolerance: Maximal time between matching boundaries in seconds.
+        max_cps: Maximal characters per second.
+        max_width: Maximal number of characters on a line.
+
+    Returns:
+        The evaluation of every generated file, and the error of every
+        generated file that couldn't be evaluated.
+    """
+    results: Dict[str, Evaluation] = {}
+    errors: Dict[str, str] = {}
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(_evaluate_pair, generated, manual, tolerance,
+                               max_cps, max_width): generated
+                   for generated, manual in file_pairs}
+
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if isinstance(result, str):
+                errors[futures[future]] = result
+            else:
+                results[futures[future]] = result
+
+    return results, errors
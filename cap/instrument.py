@@ -0,0 +1,240 @@
+"""Per-stage profiling of the captioning pipeline.
+
+Pass a Profiler to cap.group() or convert.create_groups() to record the wall
+time, word count, group count and (optionally) memory allocations of every
+stage: reading, weighting (per weighting function), segmentation, retiming
+and line breaking. Without a profiler, every stage is entered through a
+shared no-op context manager, so profiling costs nothing when disabled.
+
+Stages can be nested; the name of a nested stage is prefixed with the name of
+its parent, like 'weights/pos_tags'. A stage that is entered multiple times
+(for example once per window in stream mode) accumulates its totals.
+
+Example:
+    >>> from cap import convert, instrument
+    >>> profiler = instrument.Profiler()
+    >>> groups = convert.create_groups(words, profiler=profiler)
+    >>> print(profiler.table())
+    stage                        calls     time ms      %    words   groups
+    weights                          1         9.7   26.2     3375
+      speech_gaps                    1         0.5    1.3     3375
+    ...
+"""
+import contextlib
+from dataclasses import dataclass, field
+import json
+import time
+import tracemalloc
+from typing import Any, ContextManager, Dict, Iterator, List, Optional, \
+    Tuple
+
+
+@dataclass
+class Stage:
+    """The totals of a stage.
+
+    Attributes:
+        name: Name of the stage, prefixed with the names of its parents.
+        calls: How many times the stage was entered.
+        seconds: Total wall time in seconds.
+        words: Total number of words the stage processed.
+        groups: Total number of caption groups the stage produced.
+        allocated: Total net memory allocated by the stage in bytes, if the
+            profiler traces memory.
+        counts: Other counts, for example the matches of every POS rule.
+    """
+    name: str
+    calls: int = 0
+    seconds: float = 0
+    words: int = 0
+    groups: int = 0
+    allocated: int = 0
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def depth(self) -> int:
+        """Number of parents of the stage."""
+        return self.name.count('/')
+
+
+class Profiler:
+    """Records the totals of every stage.
+
+    Args:
+        memory: Also trace memory allocations with tracemalloc. This makes
+            everything considerably slower.
+
+    Attributes:
+        stages: The totals of every stage, in the order they were first
+            entered.
+        memory: Whether memory allocations are traced.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.stages: Dict[str, Stage] = {}
+        self.memory = memory
+        self._path: List[str] = []
+        self._origin = time.perf_counter()
+
+        # open and close events, for speedscope()
+        self._events: List[Tuple[str, str, float]] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, words: int = 0) -> Iterator[Stage]:
+        """Record a stage while the context is active.
+
+        Args:
+            name: Name of the stage.
+            words: Number of words the stage processes.
+
+        Yields:
+            The totals of the stage, to add the number of groups or other
+            counts to.
+        """
+        self._path.append(name)
+        full_name = '/'.join(self._path)
+        totals = self.stages.get(full_name)
+        if totals is None:
+            totals = self.stages[full_name] = Stage(full_name)
+
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+
+        start = time.perf_counter()
+        self._events.append(('O', full_name, start))
+        try:
+            yield totals
+        finally:
+            end = time.perf_counter()
+            self._events.append(('C', full_name, end))
+
+            totals.calls += 1
+            totals.seconds += end - start
+            totals.words += words
+            if self.memory:
+                totals.allocated += tracemalloc.get_traced_memory()[0] - memory
+            if started_tracing:
+                tracemalloc.stop()
+
+            self._path.pop()
+
+    def total(self) -> float:
+        """Return the total time of the top level stages in seconds."""
+        return sum(totals.seconds for totals in self.stages.values()
+                   if totals.depth == 0)
+
+    def table(self) -> str:
+        """Format the totals as a human-readable table.
+
+        Returns:
+            The table, nested stages are indented below their parent.
+        """
+        total = self.total() or 1
+        header = (f'{"stage":<28} {"calls":>5} {"time ms":>11} {"%":>6} '
+                  f'{"words":>8} {"groups":>8}')
+        if self.memory:
+            header += f' {"alloc KB":>10}'
+
+        lines = [header]
+        for totals in self.stages.values():
+            name = '  ' * totals.depth + totals.name.rsplit('/', 1)[-1]
+            line = (f'{name:<28} {totals.calls:5d} '
+                    f'{totals.seconds * 1000:11.1f} '
+                    f'{100 * totals.seconds / total:6.1f} '
+                    f'{totals.words or "":>8} {totals.groups or "":>8}')
+            if self.memory:
+                line += f' {totals.allocated / 1000:10.1f}'
+            if totals.counts:
+                line += '   ' + ', '.join(f'{key} {value}' for key, value
+                                          in totals.counts.items())
+            lines.append(line.rstrip())
+
+        lines.append(f'{"total":<28} {"":5} {self.total() * 1000:11.1f}')
+        return '\n'.join(lines)
+
+    def json(self) -> Dict[str, Any]:
+        """Return the totals as JSON data.
+
+        Returns:
+            The total time and the totals of every stage.
+        """
+        return {
+            'seconds': self.total(),
+            'stages': [{
+                'name': totals.name,
+                'calls': totals.calls,
+                'seconds': totals.seconds,
+                'words': totals.words,
+                'groups': totals.groups,
+                **({'allocated': totals.allocated} if self.memory else {}),
+                **({'counts': totals.counts} if totals.counts else {}),
+            } for totals in self.stages.values()],
+        }
+
+    def speedscope(self, name: str = 'cap') -> Dict[str, Any]:
+        """Return the stages as an evented speedscope profile.
+
+        Open the profile at https://www.speedscope.app to see the stages on a
+        timeline.
+
+        Args:
+            name: Name of the profile.
+
+        Returns:
+            The profile in the speedscope file format.
+        """
+        frames = {stage_name: i for i, stage_name in enumerate(self.stages)}
+        end = self._events[-1][2] if self._events else self._origin
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': [{'name': stage_name} for stage_name in frames]},
+            'profiles': [{
+                'type': 'evented',
+                'name': name,
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': (end - self._origin) * 1000,
+                'events': [{'type': kind, 'frame': frames[stage_name],
+                            'at': (at - self._origin) * 1000}
+                           for kind, stage_name, at in self._events],
+            }],
+        }
+
+    def write_speedscope(self, filename: str) -> None:
+        """Write the stages as a speedscope profile, see speedscope().
+
+        Args:
+            filename: Name of the profile file.
+        """
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.speedscope(), f)
+
+
+_DISABLED: ContextManager[Optional[Stage]] = contextlib.nullcontext()
+
+
+def stage(profiler: Optional[Profiler], name: str, words: int = 0
+          ) -> ContextManager[Optional[Stage]]:
+    """Record a stage if there is a profiler.
+
+    Example:
+        >>> with instrument.stage(profiler, 'segment', len(data)) as totals:
+        ...     ranges = split_ranges(data)
+        ...     if totals:
+        ...         totals.groups += len(ranges)
+
+    Args:
+        profiler: The profiler, or None if profiling is disabled.
+        name: Name of the stage.
+        words: Number of words the stage processes.
+
+    Returns:
+        A context manager that yields the totals of the stage, or None if
+        profiling is disabled.
+    """
+    if profiler is None:
+        return _DISABLED
+
+    return profiler.stage(name, words)
@@ -0,0 +1,531 @@
+"""HTTP captioning service.
+
+This module provides an asyncio HTTP server that captions ASR files: POST an
+ASR file to /caption and the response is the SRT file. It's meant for
+serving many small clips per second from a single process:
+
+- Concurrent requests are combined into micro-batches. All sentences of a
+  batch are POS-tagged in a single call to the tagger, and the batch is
+  parsed, weighted and split in one job.
+- The jobs run in a pool of worker processes that keep the tagger loaded.
+- At most <queue_size> requests are accepted at the same time. More requests
+  are answered with 503 Service Unavailable, so clients can back off.
+- GET /metrics returns latency histograms of every stage in the Prometheus
+  text format.
+
+Only the standard library is used, start the server with `cap serve`.
+
+Example:
+    $ cap serve --port 8000 &
+    $ curl --data-binary @file.json 'localhost:8000/caption?mode=greedy'
+"""
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import io
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from . import asr
+from . import caption
+from . import convert
+from . import weighting
+from .tagcache import TagCache
+from .transcript import Transcript
+
+
+# upper bounds of the histogram buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+           10, float('inf'))
+
+# the stages of a request, see CaptionServer
+STAGES = ('queue', 'parse', 'tag', 'segment', 'total')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+# errors of an ASR file that can't be parsed, JSONDecodeError and
+# UnicodeDecodeError are ValueErrors
+INPUT_ERRORS = (ValueError, KeyError, IndexError, TypeError, AttributeError)
+
+# the tag cache of a worker process, see _init_worker()
+_tag_cache: Optional[TagCache] = None
+
+
+class HTTPError(Exception):
+    """An invalid HTTP request.
+
+    Attributes:
+        status: The HTTP status of the response.
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Histogram:
+    """Cumulative histogram of durations, like a Prometheus histogram.
+
+    Attributes:
+        counts: Number of observations in every bucket of BUCKETS.
+        total: Sum of all observations.
+        count: Number of observations.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Add an observation.
+
+        Args:
+            value: The observed value.
+        """
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+        self.total += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        """Format the histogram in the Prometheus text format.
+
+        Args:
+            name: Name of the metric.
+            labels: Labels of the metric, like 'stage="tag"'.
+
+        Returns:
+            The lines of the histogram.
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+
+        lines.append(f'{name}_sum{{{labels}}} {self.total}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+def _init_worker(tag_cache: Optional[str]) -> None:
+    """Load the tagger and open the tag cache in a worker process.
+
+    Args:
+        tag_cache: Filename of the tag cache, or None.
+    """
+    global _tag_cache  # pylint: disable=global-statement
+
+    weighting.load_tagger()
+    _tag_cache = TagCache(tag_cache) if tag_cache else None
+
+
+def _caption_batch(requests: List[Tuple[bytes, str]]
+                   ) -> Tuple[List[Tuple[int, str]], Dict[str, float]]:
+    """Caption a batch of ASR files, in a worker process.
+
+    Args:
+        requests: The ASR file and the segmentation mode of every request.
+
+    Returns:
+        The HTTP status and the SRT file (or error message) of every request,
+        and the time every stage took.
+    """
+    results: List[Tuple[int, str]] = [(200, '')] * len(requests)
+    timings = {}
+
+    start = time.perf_counter()
+    parsed: List[Tuple[int, Transcript, List[List[str]]]] = []
+    for i, (body, mode) in enumerate(requests):
+        if mode not in convert.SEGMENTERS:
+            results[i] = (400, f'unknown mode {mode!r}\n')
+            continue
+
+        try:
+            text = io.StringIO(body.decode('utf-8'))
+            data = Transcript(asr.ASR(text).words())
+            sentences = weighting.sentence_tokens(data)
+        except INPUT_ERRORS as e:
+            results[i] = (400, f'invalid ASR file: {e!r}\n')
+            continue
+
+        parsed.append((i, data, sentences))
+
+    timings['parse'] = time.perf_counter() - start
+
+    # tag the sentences of all requests at once
+    start = time.perf_counter()
+    tags = weighting.tag_sentences([sent for _, _, sents in parsed
+                                    for sent in sents], _tag_cache)
+    timings['tag'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    offset = 0
+    for i, data, _ in parsed:
+        request_tags = tags[offset:offset+len(data)]
+        offset += len(data)
+
+        # an error only fails its own request, not the whole batch
+        try:
+            convert.add_weights(data, tags=request_tags)
+
+            mode = requests[i][1]
+            groups = [data.words(lo, hi)
+                      for lo, hi in convert.SEGMENTERS[mode](data) if hi > lo]
+            groups = weighting.line_breaks(convert.cps(groups))
+            results[i] = (200, caption.compose(groups))
+        except INPUT_ERRORS as e:
+            results[i] = (400, f'invalid ASR file: {e!r}\n')
+        except Exception as e:  # pylint: disable=broad-except
+            results[i] = (500, f'captioning failed: {e!r}\n')
+
+    timings['segment'] = time.perf_counter() - start
+    return results, timings
+
+
+class CaptionServer:
+    """The captioning service.
+
+    Attributes:
+        queue_size: Maximum number of requests that are processed at the same
+            time.
+        batch_size: Maximum number of requests in a batch.
+        batch_delay: Maximum time in seconds to wait for more requests to
+            batch with the first.
+        max_body: Maximum size of an ASR file in bytes.
+        histograms: Latency histogram of every stage.
+        statuses: Number of responses with every HTTP status.
+        batch_sizes: Number of batches of every size.
+        address: The host and port the server listens on, once it is
+            serving. Useful when serving on port 0, any free port.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 256,
+                 batch_size: int = 32, batch_delay: float = 0.005,
+                 max_body: int = 64 << 20, tag_cache: Optional[str] = None):
+        """Create the server and start the worker processes.
+
+        Args:
+            workers: Number of worker processes, the number of CPUs by
+                default.
+            queue_size: Maximum number of requests that are processed at the
+                same time.
+            batch_size: Maximum number of requests in a batch.
+            batch_delay: Maximum time in seconds to wait for more requests to
+                batch with the first.
+            max_body: Maximum size of an ASR file in bytes.
+            tag_cache: Filename of the tag cache, see the tagcache module.
+        """
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_body = max_body
+
+        self.histograms = {stage: Histogram() for stage in STAGES}
+        self.statuses: Dict[int, int] = {}
+        self.batch_sizes: Dict[int, int] = {}
+
+        self._workers = workers or os.cpu_count() or 1
+        self._tag_cache = tag_cache
+        self._pool = self._start_pool()
+        self.address: Optional[Tuple[str, int]] = None
+        self._queue: 'asyncio.Queue[Tuple[bytes, str, asyncio.Future]]'
+        self._pending = 0
+
+    def _start_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        """Start the worker processes.
+
+        Returns:
+            The pool of worker processes.
+        """
+        return concurrent.futures.ProcessPoolExecutor(
+            self._workers, initializer=_init_worker,
+            initargs=(self._tag_cache,))
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000) -> None:
+        """Serve requests until cancelled.
+
+        Args:
+            host: The host to listen on.
+            port: The port to listen on, 0 for any free port, see
+                address.
+        """
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        batcher = asyncio.ensure_future(self._batcher())
+        server = await asyncio.start_server(self._connection, host, port)
+        self.address = server.sockets[0].getsockname()[:2]
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self._pool.shutdown()
+
+    async def _batcher(self) -> None:
+        """Combine queued requests into batches and run them in the pool."""
+        loop = asyncio.get_running_loop()
+        running = asyncio.Semaphore(self._workers)
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    batch.append(self._queue.get_nowait() if timeout <= 0
+                                 else await asyncio.wait_for(
+                                     self._queue.get(), timeout))
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+
+            self.batch_sizes[len(batch)] = \
+                self.batch_sizes.get(len(batch), 0) + 1
+
+            # one batch per worker, the others wait in the queue
+            await running.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            task.add_done_callback(lambda _: running.release())
+
+    async def _run_batch(self, batch: List[Tuple[bytes, str, asyncio.Future]]
+                         ) -> None:
+        """Caption a batch in the worker pool and set the results.
+
+        If a worker process dies, for example when it runs out of memory,
+        the pool is broken. Then the batch fails and the pool is replaced,
+        so the next batches are captioned by new worker processes.
+
+        Args:
+            batch: The ASR file, mode and result future of every request.
+        """
+        loop = asyncio.get_running_loop()
+        requests = [(body, mode) for body, mode, _ in batch]
+
+        dispatched = loop.time()
+        pool = self._pool
+        try:
+            results, timings = await loop.run_in_executor(
+                pool, _caption_batch, requests)
+        except Exception as e:  # pylint: disable=broad-except
+            # the other batches of the broken pool don't replace it again
+            if isinstance(e, BrokenProcessPool) and pool is self._pool:
+                pool.shutdown(wait=False)
+                self._pool = self._start_pool()
+
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result((result, timings, dispatched))
+
+    async def caption(self, body: bytes, mode: str = 'greedy'
+                      ) -> Tuple[int, str]:
+        """Caption an ASR file.
+
+        Args:
+            body: The ASR file.
+            mode: The segmentation mode, see convert.create_groups().
+
+        Returns:
+            The HTTP status and the SRT file or error message.
+        """
+        if self._pending >= self.queue_size:
+            return 503, 'too many requests, try again later\n'
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        future = loop.create_future()
+
+        self._pending += 1
+        try:
+            self._queue.put_nowait((body, mode, future))
+            (status, text), timings, dispatched = await future
+        except Exception as e:  # pylint: disable=broad-except
+            return 500, f'captioning failed: {e!r}\n'
+        finally:
+            self._pending -= 1
+
+        self.histograms['queue'].observe(dispatched - start)
+        for stage, seconds in timings.items():
+            self.histograms[stage].observe(seconds)
+        self.histograms['total'].observe(loop.time() - start)
+
+        return status, text
+
+    def metrics(self) -> str:
+        """Format the metrics in the Prometheus text format.
+
+        Returns:
+            The metrics.
+        """
+        lines = ['# TYPE cap_stage_seconds histogram']
+        for stage, histogram in self.histograms.items():
+            lines += histogram.lines('cap_stage_seconds', f'stage="{stage}"')
+
+        lines.append('# TYPE cap_responses_total counter')
+        for status, count in sorted(self.statuses.items()):
+            lines.append(f'cap_responses_total{{status="{status}"}} {count}')
+
+        lines.append('# TYPE cap_batches_total counter')
+        for size, count in sorted(self.batch_sizes.items()):
+            lines.append(f'cap_batches_total{{requests="{size}"}} {count}')
+
+        lines.append(f'cap_pending_requests {self._pending}')
+        return '\n'.join(lines) + '\n'
+
+    async def _respond(self, request: Tuple[str, str, bytes]
+                       ) -> Tuple[int, str, str]:
+        """Handle one HTTP request.
+
+        Args:
+            request: The method, target and body of the request.
+
+        Returns:
+            The HTTP status, content type and body of the response.
+        """
+        method, target, body = request
+        url = urlsplit(target)
+
+        if url.path == '/caption':
+            if method != 'POST':
+                return 405, 'text/plain', 'use POST\n'
+
+            mode = parse_qs(url.query).get('mode', ['greedy'])[-1]
+            status, text = await self.caption(body, mode)
+            if status == 200:
+                return status, 'application/x-subrip; charset=utf-8', text
+
+            return status, 'text/plain', text
+
+        if url.path == '/metrics' and method == 'GET':
+            return 200, 'text/plain; version=0.0.4', self.metrics()
+
+        if url.path == '/health' and method == 'GET':
+            return 200, 'text/plain', 'ok\n'
+
+        return 404, 'text/plain', 'not found\n'
+
+    async def _read_request(self, reader: asyncio.StreamReader
+                            ) -> Optional[Tuple[str, str, Dict[str, str],
+                                                bytes]]:
+        """Read an HTTP request.
+
+        Args:
+            reader: The stream of the connection.
+
+        Returns:
+            The method, target, headers and body, or None if the connection
+            is closed.
+
+        Raises:
+            HTTPError: If the request isn't valid, or too large.
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+
+        try:
+            method, target, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError as e:
+            raise HTTPError(400, 'invalid request line') from e
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError as e:
+            raise HTTPError(400, 'invalid Content-Length') from e
+
+        if length > self.max_body:
+            raise HTTPError(413, 'request too large')
+
+        body = await reader.readexactly(length)
+        return method, target, headers, body
+
+    async def _connection(self, reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter) -> None:
+        """Handle the requests of a connection, with keep-alive.
+
+        Args:
+            reader: The incoming stream of the connection.
+            writer: The outgoing stream of the connection.
+        """
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+
+                    method, target, headers, body = request
+                    status, content_type, text = await self._respond(
+                        (method, target, body))
+                    keep_alive = \
+                        headers.get('connection', '').lower() != 'close'
+                except HTTPError as e:
+                    status, content_type, text = e.status, 'text/plain', \
+                        f'{e}\n'
+
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+
+                data = text.encode('utf-8')
+                head = (f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                        f'Content-Type: {content_type}\r\n'
+                        f'Content-Length: {len(data)}\r\n')
+                if status == 503:
+                    head += 'Retry-After: 1\r\n'
+                if not keep_alive:
+                    head += 'Connection: close\r\n'
+
+                writer.write(head.encode('latin-1') + b'\r\n' + data)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # the server stops, asyncio (before Python 3.12) would log the
+            # cancelled task of an open connection as an error
+            pass
+        finally:
+            writer.close()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8000, **kwargs: Any) -> None:
+    """Run the captioning service until interrupted or terminated.
+
+    Args:
+        host: The host to listen on.
+        port: The port to listen on.
+        **kwargs: Options of CaptionServer.
+    """
+    # stop on SIGTERM just like on ctrl-c, so the worker pool is shut down
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    server = CaptionServer(**kwargs)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        pass
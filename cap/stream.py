@@ -0,0 +1,201 @@
+"""Streaming captioning.
+
+This module creates caption groups while the words come in, for example from
+a live stream or while reading a long ASR file. A caption group is committed
+as soon as later words are unlikely to change it:
+
+- At a speech gap, all buffered words form caption groups of their own, as
+  the gap is always the best place to split.
+- When the buffered words span more than <latency> seconds, the caption groups
+  that are followed by enough buffered words (LOOKAHEAD characters) are
+  committed, and so are all caption groups that ended more than <latency>
+  seconds ago. The last caption group is never committed this way, as later
+  words could belong to it.
+
+So a word is committed at most about <latency> seconds (in media time) after
+its caption group ends. Because the transcript is processed in parts, the
+caption groups can differ slightly from the ones of convert.create_groups().
+
+Example:
+    >>> from cap import asr, caption, stream
+    >>> words = asr.ASR('/path/to/file.json').words()
+    >>> with open('file.srt', 'w') as f:
+    ...     caption.write_stream(stream.stream_groups(words, latency=5), f)
+"""
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, \
+    Union
+
+from . import asr
+from . import convert
+from . import instrument
+from . import weighting
+from .tagcache import TagCache
+from .transcript import Transcript
+
+
+Caption = List[Union[asr.Word, asr.Punc]]
+
+# number of characters after a caption group that make it final, later words
+# hardly ever change how the words before this are split
+LOOKAHEAD = 81
+
+
+def _tag(data: Transcript, tagged: Dict[Tuple[str, ...], List[str]],
+         tag_cache: Optional[TagCache],
+         profiler: Optional[instrument.Profiler]) -> List[str]:
+    """Tag the buffered words, reusing the tags of the previous commit.
+
+    Only the sentences that weren't in the buffer at the previous commit are
+    tagged, usually the last one. As every sentence is tagged on its own,
+    the tags are the same as those of weighting.pos_tags().
+
+    Args:
+        data: The buffered words.
+        tagged: The tags of the sentences of the previous commit, by their
+            tokens. Updated to the sentences of data.
+        tag_cache: Persistent cache of previously tagged sentences.
+        profiler: Records the tagging, see the instrument module.
+
+    Returns:
+        The POS-tags of the words.
+    """
+    sents = [tuple(sent) for sent in weighting.sentence_tokens(data)]
+    missing = [sent for sent in sents if sent not in tagged]
+
+    with instrument.stage(profiler, 'pos_tags', sum(map(len, missing))):
+        tags = iter(weighting.tag_sentences(list(map(list, missing)),
+                                            tag_cache))
+        new = {sent: list(itertools.islice(tags, len(sent)))
+               for sent in missing}
+
+    tagged.update(new)
+    for sent in set(tagged) - set(sents):
+        del tagged[sent]
+
+    return [tag for sent in sents for tag in tagged[sent]]
+
+
+def _commit(words: Caption, latency: Optional[float],
+            next_start: Optional[float], tag_cache: Optional[TagCache],
+            mode: str, profiler: Optional[instrument.Profiler],
+            tagged: Dict[Tuple[str, ...], List[str]]
+            ) -> Tuple[convert.Groups, int, int]:
+    """Create the caption groups of the buffered words.
+
+    Args:
+        words: The buffered words.
+        latency: If given, only the caption groups that are final are
+            committed. A caption group is final if at least LOOKAHEAD
+            characters follow it, or if it ended more than latency seconds
+            before the last word. The last caption group is never final.
+            If None, all caption groups are committed.
+        next_start: Start time of the word after the buffered words, if known.
+        tag_cache: Persistent cache of previously tagged sentences.
+        mode: The segmentation mode, see convert.create_groups().
+        profiler: Records the stages, see the instrument module.
+        tagged: The tags of the sentences of the previous commit, see _tag().
+
+    Returns:
+        The committed caption groups, the number of buffered words they used
+        and the end of the first caption group that isn't committed (0 if
+        there are no caption groups). The remaining words must stay in the
+        buffer.
+    """
+    data = Transcript(words)
+    tags = _tag(data, tagged, tag_cache, profiler)
+    ranges = convert.create_ranges(data, tag_cache, mode, profiler=profiler,
+                                   tags=tags)
+
+    used = first = len(words)
+    if latency is not None:
+        deadline = data.end[-1] - latency
+        final = 0
+        while final < len(ranges) - 1 and (
+                data.chars(ranges[final][1], len(data)) >= LOOKAHEAD or
+                data.end[ranges[final][1] - 1] < deadline):
+            final += 1
+
+        if final == 0:
+            return [], 0, ranges[0][1] if ranges else 0
+
+        first = ranges[final][1]
+        used = ranges[final][0]
+        next_start = data.start[used]
+        ranges = ranges[:final]
+
+    with instrument.stage(profiler, 'groups', used) as totals:
+        groups = [data.words(lo, hi) for lo, hi in ranges]
+        if totals is not None:
+            totals.groups += len(groups)
+
+    with instrument.stage(profiler, 'cps', used):
+        groups = convert.cps(groups, next_start=next_start)
+
+    with instrument.stage(profiler, 'line_breaks', used):
+        return weighting.line_breaks(groups), used, first
+
+
+def stream_groups(words: Iterable[asr.Word], latency: float = 10,
+                  threshold: float = 1.5,
+                  tag_cache: Optional[TagCache] = None,
+                  mode: str = 'greedy',
+                  profiler: Optional[instrument.Profiler] = None
+                  ) -> Iterator[Caption]:
+    """Create caption groups from words as they come in.
+
+    If no caption group is final yet, the buffered words aren't weighted
+    again until the first caption group is followed by LOOKAHEAD characters
+    or ended more than latency seconds ago. The tags of the sentences that
+    stay in the buffer are reused.
+
+    Args:
+        words: Word and Punc instances, for example ASR.words().
+        latency: Maximal time in seconds between the end of a caption group
+            and the end of the last buffered word before the caption group is
+            committed.
+        threshold: Minimal length of a speech gap in seconds, see
+            weighting.speech_gaps().
+        tag_cache: Persistent cache of previously tagged sentences.
+        mode: The segmentation mode, see convert.create_groups().
+        profiler: Records the stages, see the instrument module. Buffered
+            words are weighted again for every commit, so the stages process
+            more words than there are.
+
+    Yields:
+        The caption groups, as soon as they're final.
+    """
+    buffer: Caption = []
+    tagged: Dict[Tuple[str, ...], List[str]] = {}
+
+    # the end of the first caption group that wasn't final, and the number
+    # of characters after it, see Transcript.chars()
+    first = 0
+    chars = 0
+
+    for word in words:
+        if buffer and word.start - buffer[-1].end > threshold:
+            groups, _, _ = _commit(buffer, None, word.start, tag_cache, mode,
+                                   profiler, tagged)
+            yield from groups
+            buffer = []
+            first = 0
+
+        buffer.append(word)
+        if first:
+            chars += len(word.text) + 1
+
+        if buffer[-1].end - buffer[0].start > latency and (
+                not first or chars >= LOOKAHEAD or
+                buffer[first - 1].end < buffer[-1].end - latency):
+            groups, used, first = _commit(buffer, latency, None, tag_cache,
+                                          mode, profiler, tagged)
+            yield from groups
+            buffer = buffer[used:]
+            first -= used
+            chars = sum(len(item.text) + 1 for item in buffer[first:]) - 1
+
+    if buffer:
+        groups, _, _ = _commit(buffer, None, None, tag_cache, mode, profiler,
+                               tagged)
+        yield from groups
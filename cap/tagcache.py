@@ -0,0 +1,247 @@
+"""Persistent Part-Of-Speech tag cache.
+
+This module provides the TagCache class, an on-disk cache for the POS-tags of
+sentences. Most sentences in the transcripts of one video creator have been
+tagged before, so a warm cache skips almost all of the tagger's work.
+
+The cache is a SQLite database. It can be shared by multiple processes at the
+same time, is capped at a maximum number of sentences and evicts the least
+recently used sentences when it grows beyond that. Looking up sentences only
+reads the database, except to record the use of sentences that weren't used
+in the last hour.
+
+Example:
+    >>> import cap
+    >>> from cap.tagcache import TagCache
+    >>> with TagCache('tags.sqlite') as cache:
+    ...     groups = cap.group('file.json', 'file.srt', tag_cache=cache)
+    ...     print(cache.stats())
+    {'hits': 1412, 'misses': 3, 'size': 20480}
+"""
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# the maximum number of variables SQLite accepts in a single query
+_CHUNK = 500
+
+# separates the tokens of a sentence in the database key
+_SEP = '\x1f'
+
+
+def tagger_version() -> str:
+    """Return the version of the tagger that is used by the weighting module.
+
+    Tags created by different tagger versions can differ, so the version is
+    part of every key in the cache.
+
+    Returns:
+        A string identifying the tagger and tagset.
+    """
+    import nltk  # pylint: disable=import-outside-toplevel
+
+    return f'nltk-{nltk.__version__}/perceptron/universal'
+
+
+class TagCache:
+    """On-disk cache for POS-tagged sentences.
+
+    Attributes:
+        filename: Filename of the SQLite database.
+        max_size: Maximum number of sentences in the cache.
+        version: Tagger version, see tagger_version().
+        touch_interval: Minimal time in seconds between updates of the last
+            use of a sentence.
+        hits: Number of sentences found in the cache by this instance.
+        misses: Number of sentences not found in the cache by this instance.
+    """
+
+    def __init__(self, filename: str, max_size: int = 1_000_000,
+                 version: Optional[str] = None,
+                 touch_interval: float = 3600):
+        """Open (or create) the cache with the given filename.
+
+        Args:
+            filename: Filename of the SQLite database.
+            max_size: Maximum number of sentences in the cache. The least
+                recently used sentences are removed when it grows larger.
+            version: Tagger version. Defaults to tagger_version().
+            touch_interval: Minimal time in seconds between updates of the
+                last use of a sentence. Looking up sentences that were used
+                more recently doesn't write to the database.
+        """
+        self.filename = filename
+        self.max_size = max_size
+        self.version = version or tagger_version()
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return the database connection of the current process.
+
+        A connection can't be shared with forked worker processes, so every
+        process opens its own.
+
+        Returns:
+            The SQLite connection.
+        """
+        if self._conn is not None and self._pid == os.getpid():
+            return self._conn
+
+        conn = sqlite3.connect(self.filename, timeout=60,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS tags ('
+                     'version TEXT, sentence TEXT, tags TEXT, used REAL, '
+                     'PRIMARY KEY (version, sentence))')
+        conn.execute('CREATE INDEX IF NOT EXISTS tags_used ON tags (used)')
+
+        self._conn = conn
+        self._pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, write: bool = True
+                     ) -> Iterator[sqlite3.Connection]:
+        """Run the statements in the with-block as one transaction.
+
+        Args:
+            write: Whether the transaction writes. A write transaction takes
+                the write lock at the start, a read transaction doesn't lock
+                out writers (in WAL mode) and sees a snapshot of the cache.
+
+        Yields:
+            The SQLite connection.
+
+        Raises:
+            BaseException: Any exception of the with-block, after the
+                transaction is rolled back.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        conn.execute('COMMIT')
+
+    def get_many(self, sentences: Sequence[Sequence[str]]
+                 ) -> List[Optional[List[str]]]:
+        """Look up the tags of multiple sentences.
+
+        The last use of the found sentences is only updated if it's longer
+        than touch_interval ago, so looking up recently used sentences only
+        reads the database.
+
+        Args:
+            sentences: The sentences, each a sequence of tokens.
+
+        Returns:
+            The tags of every sentence, or None if the sentence isn't cached.
+        """
+        keys = [_SEP.join(sent) for sent in sentences]
+        unique = list(set(keys))
+        found: Dict[str, List[str]] = {}
+        stale = []
+
+        now = time.time()
+        with self._transaction(write=False) as conn:
+            for i in range(0, len(unique), _CHUNK):
+                chunk = unique[i:i+_CHUNK]
+                marks = ','.join('?' * len(chunk))
+                rows = conn.execute(
+                    'SELECT sentence, tags, used FROM tags WHERE version = ? '
+                    f'AND sentence IN ({marks})', (self.version, *chunk))
+                for key, tags, used in rows:
+                    found[key] = tags.split(' ')
+                    if used < now - self.touch_interval:
+                        stale.append(key)
+
+        # mark the found sentences as recently used
+        if stale:
+            with self._transaction() as conn:
+                for i in range(0, len(stale), _CHUNK):
+                    chunk = stale[i:i+_CHUNK]
+                    marks = ','.join('?' * len(chunk))
+                    conn.execute(
+                        'UPDATE tags SET used = ? WHERE version = ? AND '
+                        f'sentence IN ({marks})', (now, self.version, *chunk))
+
+        result = []
+        for key, sent in zip(keys, sentences):
+            tags = found.get(key)
+            if tags is not None and len(tags) != len(sent):
+                tags = None
+
+            if tags is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+            result.append(tags)
+
+        return result
+
+    def put_many(self, items: Sequence[Tuple[Sequence[str], Sequence[str]]]
+                 ) -> None:
+        """Store the tags of multiple sentences.
+
+        Evicts the least recently used sentences if the cache grows larger
+        than max_size.
+
+        Args:
+            items: Pairs of a sentence (a sequence of tokens) and its tags.
+        """
+        if not items:
+            return
+
+        now = time.time()
+        rows = [(self.version, _SEP.join(sent), ' '.join(tags), now)
+                for sent, tags in items]
+
+        with self._transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO tags VALUES (?, ?, ?, ?)',
+                             rows)
+
+            size = conn.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+            if size > self.max_size:
+                conn.execute('DELETE FROM tags WHERE rowid IN (SELECT rowid '
+                             'FROM tags ORDER BY used LIMIT ?)',
+                             (size - self.max_size,))
+
+    def __len__(self) -> int:
+        """Return the number of sentences in the cache."""
+        conn = self._connect()
+        return conn.execute('SELECT COUNT(*) FROM tags').fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit and miss statistics of this instance.
+
+        Returns:
+            A dictionary with the number of hits and misses, and the number of
+            sentences in the cache.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+    def close(self) -> None:
+        """Close the database connection."""
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+
+        self._conn = None
+
+    def __enter__(self) -> 'TagCache':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
@@ -0,0 +1,192 @@
+"""Columnar representation of a transcript.
+
+A Caption-list stores every word as a separate Word or Punc instance. For long
+transcripts, that's hundreds of thousands of Python objects. The Transcript
+class stores the same data as columns: contiguous arrays for the start times,
+end times, weights, POS-tag ids and punctuation flags, and all text in a
+single string with offsets. Word and Punc instances are only created for the
+caption groups, see Transcript.words().
+
+Example:
+    >>> from cap import asr, transcript
+    >>> data = transcript.Transcript(asr.ASR('/path/to/file.json').words())
+    >>> data.text_at(0), data.start[0], data.weight[0]
+    ('An', 0.0, 0.0)
+    >>> data.words(0, 3)
+    [Word(text='An', start=0, end=1, weight=0),
+     Word(text='example', start=1, end=2, weight=0),
+     Punc(text='.', start=2, end=2, weight=0)]
+"""
+from array import array
+from typing import Iterable, List, Optional, Sequence, Union
+
+from . import asr
+
+
+Caption = List[Union[asr.Word, asr.Punc]]
+
+# the universal POS-tagset, the index of a tag is its tag id
+TAGS = ('ADJ', 'ADP', 'ADV', 'CONJ', 'DET', 'NOUN', 'NUM', 'PRT', 'PRON',
+        'VERB', '.', 'X')
+TAG_IDS = {tag: i for i, tag in enumerate(TAGS)}
+
+
+class Transcript:
+    """Struct-of-arrays version of the Caption-list.
+
+    All attributes are indexed by word number. The text of word i is
+    text[offsets[i]:offsets[i+1]].
+
+    Attributes:
+        start: Begin times of the words in seconds.
+        end: End times of the words in seconds.
+        weight: How good a split after a word would be.
+        tag: POS-tag id of the words, see TAGS. 'X' until tagged.
+        punc: 1 if the word is punctuation, 0 otherwise.
+        line_break: 1 if a new line starts after the word, 0 otherwise.
+        offsets: Offsets of the words in text.
+        text: Text of all words concatenated.
+    """
+
+    def __init__(self, words: Iterable[asr.Word] = ()):
+        """Create a transcript from Word and Punc instances.
+
+        Args:
+            words: Caption-list or any other iterable of Word and Punc
+                instances, for example ASR.words().
+        """
+        self.start = array('d')
+        self.end = array('d')
+        self.weight = array('d')
+        self.punc = array('B')
+        self.line_break = array('B')
+        self.offsets = array('L', [0])
+
+        texts = []
+        offset = 0
+        for word in words:
+            self.start.append(word.start)
+            self.end.append(word.end)
+            self.weight.append(word.weight)
+            self.punc.append(isinstance(word, asr.Punc))
+            self.line_break.append(word.line_break)
+            texts.append(word.text)
+
+            offset += len(word.text)
+            self.offsets.append(offset)
+
+        self.tag = array('B', [TAG_IDS['X']]) * len(self.start)
+        self.text = ''.join(texts)
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def text_at(self, index: int) -> str:
+        """Return the text of a word.
+
+        Args:
+            index: Index of the word.
+
+        Returns:
+            The text of the word.
+        """
+        return self.text[self.offsets[index]:self.offsets[index+1]]
+
+    def texts(self, lo: int = 0, hi: Optional[int] = None) -> List[str]:
+        """Return the text of multiple words.
+
+        Args:
+            lo: Index of the first word.
+            hi: Index after the last word, defaults to the end.
+
+        Returns:
+            The text of every word.
+        """
+        hi = len(self) if hi is None else hi
+        offsets = self.offsets
+        return [self.text[offsets[i]:offsets[i+1]] for i in range(lo, hi)]
+
+    def chars(self, lo: int, hi: int) -> int:
+        """Return the length of the words lo..hi joined by spaces.
+
+        This is len(' '.join(words)), computed in constant time from the
+        offsets.
+
+        Args:
+            lo: Index of the first word.
+            hi: Index after the last word.
+
+        Returns:
+            The number of characters.
+        """
+        if hi <= lo:
+            return 0
+
+        return self.offsets[hi] - self.offsets[lo] + hi - lo - 1
+
+    def tags(self) -> List[str]:
+        """Return the POS-tags of all words.
+
+        Returns:
+            The universal POS-tags.
+        """
+        return [TAGS[tag] for tag in self.tag]
+
+    def set_tags(self, tags: Sequence[str]) -> None:
+        """Set the POS-tags of all words.
+
+        Args:
+            tags: A universal POS-tag for every word.
+        """
+        unknown = TAG_IDS['X']
+        self.tag = array('B', [TAG_IDS.get(tag, unknown) for tag in tags])
+
+    def word(self, index: int) -> asr.Word:
+        """Create the Word or Punc instance of a word.
+
+        Args:
+            index: Index of the word.
+
+        Returns:
+            Punc if the word is punctuation, Word otherwise.
+        """
+        cls = asr.Punc if self.punc[index] else asr.Word
+        return cls(self.text_at(index), self.start[index], self.end[index],
+                   self.weight[index], bool(self.line_break[index]))
+
+    def words(self, lo: int = 0, hi: Optional[int] = None) -> Caption:
+        """Create the Caption-list of multiple words.
+
+        Args:
+            lo: Index of the first word.
+            hi: Index after the last word, defaults to the end.
+
+        Returns:
+            The Caption-list.
+        """
+        hi = len(self) if hi is None else hi
+        return [self.word(i) for i in range(lo, hi)]
+
+    def slice(self, lo: int, hi: int) -> 'Transcript':
+        """Copy the words lo..hi to a new transcript.
+
+        Args:
+            lo: Index of the first word.
+            hi: Index after the last word.
+
+        Returns:
+            The transcript of the words, including their weights and tags.
+        """
+        base, top = self.offsets[lo], self.offsets[hi]
+
+        part = Transcript()
+        part.start = self.start[lo:hi]
+        part.end = self.end[lo:hi]
+        part.weight = self.weight[lo:hi]
+        part.tag = self.tag[lo:hi]
+        part.punc = self.punc[lo:hi]
+        part.line_break = self.line_break[lo:hi]
+        part.offsets = array('L', (offset - base
+                                   for offset in self.offsets[lo:hi+1]))
+        part.text = self.text[base:top]
+        return part
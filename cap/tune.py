@@ -0,0 +1,516 @@
+"""Tune the weighting parameters against manual subtitles.
+
+The weighting functions and the greedy segmentation have parameters: the
+speech gap threshold, the punctuation factor and weights, the factor and
+split_weight of every POS rule, and the char_limit and char_limit_div of
+convert.split_ranges(). This module searches the values that minimize the
+total convert.basic_error() over a corpus of ASR files with manual SRT
+files.
+
+Everything that doesn't depend on the parameters is computed once per file:
+the ASR files are tagged in parallel before the first trial and the tags are
+stored in a tag cache. The worker processes that run the trials parse the ASR
+and manual SRT files themselves, read the tags from the cache and keep the
+files in memory. A trial only weights a copy of the cached transcript,
+splits it, adds line breaks and compares the result. Retiming with
+convert.cps() is skipped, because basic_error() only compares text.
+
+Every finished trial is appended to a JSON Lines file, so an interrupted
+search continues where it stopped when it is started again.
+
+Three search strategies are available:
+
+- grid: every combination of the candidate values of the parameters.
+- random: parameters drawn uniformly between their lowest and highest
+  candidate value.
+- coordinate: tune one parameter at a time over its candidate values, keeping
+  the best value of the others, for a number of rounds.
+
+Example:
+    $ cap tune asr/ manual-srt/ --search random --trials 500
+"""
+import concurrent.futures
+import contextlib
+from dataclasses import dataclass, replace
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, \
+    Sequence, Set, Tuple, cast
+
+import srt
+
+from . import asr, caption, convert, evaluate, weighting
+from .tagcache import TagCache
+from .transcript import Transcript
+
+
+Params = Dict[str, float]
+
+# maximal number of trials of a grid search
+MAX_GRID = 100000
+
+
+@dataclass(frozen=True)
+class Parameter:
+    """A tunable parameter.
+
+    Attributes:
+        name: Name of the parameter, like 'punctuation.factor'.
+        default: The default value in the weighting functions.
+        values: The candidate values for grid and coordinate search. Random
+            search draws values between the lowest and highest candidate.
+        integer: Whether the values are integers.
+    """
+    name: str
+    default: float
+    values: Tuple[float, ...]
+    integer: bool = False
+
+
+def parameters() -> List[Parameter]:
+    """Return the tunable parameters.
+
+    Returns:
+        The parameters, including those of every rule in weighting.RULES.
+    """
+    result = [
+        Parameter('speech_gaps.threshold', 1.5, (0.5, 1, 1.5, 2, 3)),
+        Parameter('punctuation.factor', 1, (0.5, 1, 1.5, 2)),
+        Parameter('punctuation.period', 0.95, (0.6, 0.8, 0.95, 1.2)),
+        Parameter('punctuation.question', 0.85, (0.6, 0.85, 1.0, 1.2)),
+        Parameter('punctuation.comma', 0.6, (0.2, 0.4, 0.6, 0.8)),
+    ]
+    for rule in weighting.RULES:
+        result += [
+            Parameter(f'{rule.name}.factor', rule.factor, (0.5, 1, 2)),
+            Parameter(f'{rule.name}.split_weight', rule.split_weight,
+                      (0.1, 0.2, 0.3, 0.4, 0.6)),
+        ]
+
+    result += [
+        Parameter('split.char_limit', 81, (60, 70, 81, 90), integer=True),
+        Parameter('split.char_limit_div', 5, (2, 3, 5, 8), integer=True),
+    ]
+    return result
+
+
+def defaults() -> Params:
+    """Return the default value of every parameter.
+
+    Returns:
+        The parameters as used by convert.create_groups().
+    """
+    return {param.name: param.default for param in parameters()}
+
+
+def weigh(data: Transcript, params: Params) -> Transcript:
+    """Add the weights to a tagged transcript, like convert.add_weights().
+
+    Args:
+        data: The tagged transcript, without weights.
+        params: The value of every parameter, see parameters().
+
+    Returns:
+        The transcript with added weights.
+    """
+    weighting.speech_gaps(data, params['speech_gaps.threshold'])
+    weighting.punctuation(data, params['punctuation.factor'],
+                          (params['punctuation.period'],
+                           params['punctuation.question'],
+                           params['punctuation.comma']))
+
+    rules = [replace(rule, factor=params[f'{rule.name}.factor'],
+                     split_weight=params[f'{rule.name}.split_weight'])
+             for rule in weighting.RULES]
+    return weighting.pos_rules(data, rules)
+
+
+def subtitles(data: Transcript, params: Params) -> List[srt.Subtitle]:
+    """Create the subtitles of a tagged transcript with the parameters.
+
+    The subtitles aren't retimed, see the module documentation.
+
+    Args:
+        data: The tagged transcript, without weights. It isn't changed.
+        params: The value of every parameter, see parameters().
+
+    Returns:
+        The subtitles.
+    """
+    data = weigh(data.slice(0, len(data)), params)
+    ranges = convert.split_ranges(data, int(params['split.char_limit']),
+                                  int(params['split.char_limit_div']))
+    groups = weighting.line_breaks([data.words(lo, hi) for lo, hi in ranges])
+    return caption.create_subtitles(groups)
+
+
+def _srt_name(relpath: str) -> str:
+    """Return the relative path of the manual file of an ASR file."""
+    return os.path.splitext(relpath)[0] + '.srt'
+
+
+def pairs(asr_dir: str, manual_dir: str) -> Tuple[List[Tuple[str, str]],
+                                                  List[str]]:
+    """Pair the ASR files with their manual SRT files.
+
+    Args:
+        asr_dir: Directory that is searched recursively for ASR files.
+        manual_dir: Directory with the manual SRT files at the same relative
+            paths as the ASR files, with the .srt extension.
+
+    Returns:
+        The (ASR file, manual SRT file) pairs, and the ASR files without a
+        manual file.
+    """
+    return evaluate.pairs(asr_dir, manual_dir, '.json', _srt_name)
+
+
+def corpus_fingerprint(file_pairs: Sequence[Tuple[str, str]]) -> str:
+    """Identify the corpus and the code that trials are run with.
+
+    Recorded trials are only valid for the same files and the same weighting
+    and segmentation code, see Search.
+
+    Args:
+        file_pairs: The (ASR file, manual SRT file) pairs, see pairs().
+
+    Returns:
+        A hash of the paths, sizes and modification times of the files, the
+        rules in weighting.RULES and the source of the modules that create
+        the subtitles.
+    """
+    digest = hashlib.sha256()
+    for filename in itertools.chain.from_iterable(file_pairs):
+        info = os.stat(filename)
+        digest.update(json.dumps([os.path.abspath(filename), info.st_size,
+                                  info.st_mtime_ns]).encode())
+
+    digest.update(repr(weighting.RULES).encode())
+    for module in (asr, caption, convert, evaluate, weighting):
+        with open(cast(str, module.__file__), 'rb') as f:
+            digest.update(f.read())
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+
+    return digest.hexdigest()[:16]
+
+
+# the tag cache of a worker process that tags the files
+_tag_cache: Optional[TagCache] = None
+
+# the files of a worker process that runs trials, loaded by the first trial
+_pairs: Sequence[Tuple[str, str]] = []
+_trial_cache = ''
+_files: Optional[List[Tuple[Transcript, List[srt.Subtitle]]]] = None
+
+
+def _init_prepare(tag_cache: str) -> None:
+    """Load the tagger and open the tag cache in a worker process.
+
+    Args:
+        tag_cache: Filename of the tag cache.
+    """
+    global _tag_cache  # pylint: disable=global-statement
+
+    weighting.load_tagger()
+    _tag_cache = TagCache(tag_cache)
+
+
+def _prepare(asr_file: str, manual_file: str) -> None:
+    """Tag an ASR file and check that its manual SRT file can be read.
+
+    Args:
+        asr_file: Name of the ASR file.
+        manual_file: Name of the manual SRT file.
+    """
+    data = Transcript(asr.ASR(asr_file).words())
+    weighting.pos_tags(data, cache=_tag_cache)
+    evaluate.read(manual_file)
+
+
+def prepare(file_pairs: Sequence[Tuple[str, str]], tag_cache: str,
+            jobs: Optional[int] = None) -> None:
+    """Tag all files once, in parallel, and store the tags in a tag cache.
+
+    The sentences that are in the cache already aren't tagged again.
+
+    Args:
+        file_pairs: The (ASR file, manual SRT file) pairs, see pairs().
+        tag_cache: Filename of the tag cache, see the tagcache module.
+        jobs: Number of worker processes, defaults to the number of CPUs.
+    """
+    with concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_init_prepare, initargs=(tag_cache,)) as pool:
+        list(pool.map(_prepare, *zip(*file_pairs)))
+
+
+def _init_trials(file_pairs: Sequence[Tuple[str, str]], tag_cache: str
+                 ) -> None:
+    """Remember the files of the trials in a worker process.
+
+    Args:
+        file_pairs: The (ASR file, manual SRT file) pairs, see pairs().
+        tag_cache: Filename of the tag cache with the tags of prepare().
+    """
+    global _pairs, _trial_cache  # pylint: disable=global-statement
+    _pairs = file_pairs
+    _trial_cache = tag_cache
+
+
+def _load() -> List[Tuple[Transcript, List[srt.Subtitle]]]:
+    """Parse the files of the trials once in a worker process.
+
+    Returns:
+        The tagged transcript and the manual subtitles of every pair.
+    """
+    global _files  # pylint: disable=global-statement
+
+    if _files is None:
+        files = []
+        with TagCache(_trial_cache) as cache:
+            for asr_file, manual_file in _pairs:
+                data = Transcript(asr.ASR(asr_file).words())
+                weighting.pos_tags(data, cache=cache)
+                files.append((data, evaluate.read(manual_file)))
+        _files = files
+
+    return _files
+
+
+def _trial(params: Params) -> Tuple[int, float]:
+    """Run a trial on all files, in a worker process.
+
+    Args:
+        params: The value of every parameter.
+
+    Returns:
+        The total basic_error and the time the trial took in seconds. The
+        first trial of a worker also loads the files.
+    """
+    start = time.perf_counter()
+    error = sum(convert.basic_error(subtitles(data, params), manual)
+                for data, manual in _load())
+    return error, time.perf_counter() - start
+
+
+def _key(params: Params) -> str:
+    """Return a key that identifies the parameter values of a trial."""
+    return json.dumps(params, sort_keys=True)
+
+
+class Search:
+    """Runs trials in parallel and records them in a JSON Lines file.
+
+    Every trial is recorded with the fingerprint of the corpus and code it
+    ran with, see corpus_fingerprint(). Trials in the file with the same
+    fingerprint and parameter values aren't run again, their recorded error
+    is used. Trials with another fingerprint are ignored.
+
+    Args:
+        file_pairs: The (ASR file, manual SRT file) pairs, see pairs().
+        tag_cache: Filename of the tag cache with the tags of the files, see
+            prepare().
+        results: Name of the JSON Lines file, or None to not record trials.
+        jobs: Number of worker processes, defaults to the number of CPUs.
+        report: Function that is called with every new best trial. It isn't
+            called for the recorded trials.
+        fingerprint: The fingerprint of the files, see
+            corpus_fingerprint().
+
+    Attributes:
+        errors: The error of every finished trial, by key.
+        best: The parameters and error of the best trial so far.
+        ignored: Number of recorded trials with another fingerprint.
+    """
+
+    def __init__(self, file_pairs: Sequence[Tuple[str, str]], tag_cache: str,
+                 results: Optional[str] = None, jobs: Optional[int] = None,
+                 report: Optional[Callable[[Params, int], None]] = None,
+                 fingerprint: str = ''):
+        self.errors: Dict[str, int] = {}
+        self.best: Optional[Tuple[Params, int]] = None
+        self.ignored = 0
+        self._results = results
+        self._report = report
+        self._fingerprint = fingerprint
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            jobs, initializer=_init_trials, initargs=(file_pairs, tag_cache))
+        self._limit = 2 * (jobs or os.cpu_count() or 1)
+
+        if results and os.path.exists(results):
+            with open(results, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+
+                    trial = json.loads(line)
+                    if trial.get('fingerprint') != fingerprint:
+                        self.ignored += 1
+                    else:
+                        self._finish(trial['params'], trial['error'],
+                                     report=False)
+
+    def __enter__(self) -> 'Search':
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._pool.shutdown()
+
+    def _finish(self, params: Params, error: int, report: bool = True
+                ) -> None:
+        """Record the error of a trial.
+
+        Args:
+            params: The parameters of the trial.
+            error: The total basic_error of the trial.
+            report: Whether to report a new best trial.
+        """
+        self.errors[_key(params)] = error
+        if self.best is None or error < self.best[1]:
+            self.best = (params, error)
+            if report and self._report is not None:
+                self._report(params, error)
+
+    def _collect(self, running: Dict[concurrent.futures.Future, Params],
+                 keys: Set[str], results: Optional[IO[str]]) -> None:
+        """Wait until at least one running trial finishes and record it.
+
+        Args:
+            running: The parameters of the running trials.
+            keys: The keys of the running trials, see _key().
+            results: The opened JSON Lines file, or None.
+        """
+        done, _ = concurrent.futures.wait(
+            running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            params = running.pop(future)
+            keys.discard(_key(params))
+            error, seconds = future.result()
+            self._finish(params, error)
+
+            if results is not None:
+                results.write(json.dumps({
+                    'params': params, 'error': error,
+                    'seconds': round(seconds, 3),
+                    'fingerprint': self._fingerprint}) + '\n')
+                results.flush()
+
+    def run(self, trials: Iterable[Params]) -> List[int]:
+        """Run trials, at most two per worker at a time.
+
+        Args:
+            trials: The parameters of every trial.
+
+        Returns:
+            The error of every trial.
+        """
+        todo = []
+        running: Dict[concurrent.futures.Future, Params] = {}
+        keys: Set[str] = set()
+
+        with contextlib.ExitStack() as stack:
+            results = None
+            if self._results:
+                results = stack.enter_context(
+                    open(self._results, 'a', encoding='utf-8'))
+
+            for params in trials:
+                todo.append(params)
+                key = _key(params)
+                if key in self.errors or key in keys:
+                    continue
+
+                if len(running) >= self._limit:
+                    self._collect(running, keys, results)
+                running[self._pool.submit(_trial, params)] = params
+                keys.add(key)
+
+            while running:
+                self._collect(running, keys, results)
+
+        return [self.errors[_key(params)] for params in todo]
+
+
+def _round(param: Parameter, value: float) -> float:
+    """Round a value to the precision of a parameter."""
+    return int(round(value)) if param.integer else round(value, 3)
+
+
+def grid(tuned: Sequence[Parameter], start: Params) -> Iterator[Params]:
+    """Generate every combination of the candidate values.
+
+    Args:
+        tuned: The parameters to tune.
+        start: The value of the other parameters.
+
+    Yields:
+        The parameters of every trial.
+    """
+    for values in itertools.product(*(param.values for param in tuned)):
+        yield dict(start, **{param.name: value
+                             for param, value in zip(tuned, values)})
+
+
+def random_search(tuned: Sequence[Parameter], start: Params, trials: int,
+                  seed: int = 0) -> Iterator[Params]:
+    """Generate random parameter values.
+
+    The values are drawn with a seeded generator, so a resumed search
+    generates the same trials.
+
+    Args:
+        tuned: The parameters to tune.
+        start: The value of the other parameters.
+        trials: Number of trials.
+        seed: Seed of the random generator.
+
+    Yields:
+        The parameters of every trial.
+    """
+    rng = random.Random(seed)
+    for _ in range(trials):
+        yield dict(start, **{
+            param.name: _round(param, rng.uniform(min(param.values),
+                                                  max(param.values)))
+            for param in tuned})
+
+
+def coordinate_search(search: Search, tuned: Sequence[Parameter],
+                      start: Params, rounds: int = 2) -> Params:
+    """Tune one parameter at a time, keeping the best value of the others.
+
+    The candidate values of a parameter are tried in parallel. A round tunes
+    every parameter once, the search stops early when a round doesn't
+    improve.
+
+    Args:
+        search: The search to run the trials with.
+        tuned: The parameters to tune.
+        start: The initial value of every parameter.
+        rounds: Maximal number of rounds.
+
+    Returns:
+        The best parameters.
+    """
+    current = dict(start)
+    best_error = search.run([current])[0]
+
+    for _ in range(rounds):
+        improved = False
+        for param in tuned:
+            candidates = [dict(current, **{param.name: value})
+                          for value in param.values]
+            errors = search.run(candidates)
+            error, index = min((error, i) for i, error in enumerate(errors))
+            if error < best_error:
+                current, best_error = candidates[index], error
+                improved = True
+
+        if not improved:
+            break
+
+    return current
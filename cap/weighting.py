@@ -1,19 +1,45 @@
 """
 This module provides functions to add weights to words in a caption. All
-functions accept a List of Word or Punc classes and return the same type.
+functions accept a List of Word or Punc classes and return the same type. The
+weighting functions also accept a columnar transcript.Transcript, which they
+update in place.
 """
+from array import array
+import concurrent.futures
+import dataclasses
 from dataclasses import dataclass
+import functools
+import itertools
+import operator
 import re
-from typing import List, Union, Sequence
+from typing import Any, Callable, Dict, Iterator, List, Optional, \
+    Pattern, Sequence, Tuple, TypeVar, Union
 import math
 
-import nltk
-
 from . import asr
+from .tagcache import TagCache
+from .transcript import TAG_IDS, Transcript
 
 
 Caption = List[Union[asr.Word, asr.Punc]]
 
+# the weighting functions return the same type as they are given
+Words = TypeVar('Words', Caption, Transcript)
+
+# punctuation that ends a sentence
+SENTENCE_END = ('.', '?', '!')
+
+# number of words that are tagged per job when tagging in parallel
+TAG_BATCH = 2000
+
+# a space in front of punctuation, which is stripped in the subtitles
+_PUNC = re.compile(r' ([,.?!])')
+
+# NLTK resources needed by the tagger, the name of the perceptron tagger
+# depends on the NLTK version
+MODELS = ('averaged_perceptron_tagger', 'averaged_perceptron_tagger_eng',
+          'universal_tagset')
+
 
 @dataclass
 class Pos(asr.Word):
@@ -26,47 +52,584 @@ class Pos(asr.Word):
         start: See Word dataclass documentation.
         end: See Word dataclass documentation.
         weight: See Word dataclass documentation.
-        tag: Part-Of-Speech tag assigned to a word.
+        line_break: See Word dataclass documentation.
+        tag: Part-Of-Speech tag assigned to a word, 'X' (unknown) by default.
 
     """
-    tag: str
+    tag: str = 'X'
 
 
-def pos_tagger(words: Caption) -> List[Pos]:
-    """Tagging Caption elements with Part-Of-Speech tags.
+@dataclass(frozen=True)
+class Rule:
+    """A rule that avoids splitting inside a sequence of POS-tags.
 
-    Returns a universal POS-tagged list of the custom Caption-list dataformat
-    using the NLTK library function pos_tag().
+    The pattern is a sequence of universal POS-tags (see transcript.TAGS)
+    separated by spaces. Tags can be grouped with parentheses and combined
+    with the regular expression operators |, ?, * and +. For example, a
+    preposition followed by a noun phrase is 'ADP (DET ADJ?|ADJ|PRON) NOUN'.
+
+    For documentation of the guidelines see:
+        https://bbc.github.io/subtitle-guidelines/#Break-at-natural-points
+
+    Attributes:
+        name: Name of the rule.
+        pattern: The sequence of POS-tags.
+        position: Index of the word in the sequence after which splitting is
+            avoided, the first word by default.
+        split_weight: Indicating the importance of not splitting on the word.
+        factor: Indicating the importance of this rule.
+    """
+    name: str
+    pattern: str
+    position: int = 0
+    split_weight: float = 0.3
+    factor: float = 1
+
+
+# the guidelines of the BBC, see the pos_* functions
+PRON_VERB = Rule('pron_verb', 'PRON VERB', split_weight=0.2)
+DET_NOUN = Rule('det_noun', 'DET NOUN', split_weight=0.3)
+PREP_PHRASE = Rule('prep_phrase', 'ADP (DET ADJ?|ADJ|PRON) NOUN',
+                   split_weight=0.4)
+CONJ_PHRASE = Rule('conj_phrase', 'CONJ (DET ADJ?|ADJ|PRON) NOUN',
+                   split_weight=0.3)
+COMPLEX_VERBS = Rule('complex_verbs', 'VERB VERB', split_weight=0.3)
+
+# the rule registry, the rules used by pos_rules() and create_groups()
+RULES: List[Rule] = [PRON_VERB, DET_NOUN, PREP_PHRASE, CONJ_PHRASE,
+                     COMPLEX_VERBS]
+
+
+def register_rule(rule: Rule) -> Rule:
+    """Add a rule to the rule registry.
+
+    Use this to add house-style rules to the BBC guidelines. All registered
+    rules are applied in the same single pass over the tags.
+
+    Example:
+        >>> register_rule(Rule('num_noun', 'NUM NOUN', split_weight=0.3))
+
+    Args:
+        rule: The rule to add.
+
+    Returns:
+        The rule.
+    """
+    compile_rules((rule,))
+    RULES.append(rule)
+    return rule
+
+
+def download_models(download_dir: Optional[str] = None,
+                    quiet: bool = False) -> bool:
+    """Download the NLTK models used by the tagger.
+
+    Run this (or `cap download`) once when installing, so the models never
+    have to be downloaded while captioning.
+
+    Args:
+        download_dir: Directory to save the models in. Defaults to the
+            NLTK data directory.
+        quiet: Don't print download progress.
+
+    Returns:
+        True if the models are available after downloading.
+    """
+    import nltk  # pylint: disable=import-outside-toplevel
+
+    for model in MODELS:
+        nltk.download(model, download_dir=download_dir, quiet=quiet)
+
+    load_tagger.cache_clear()
+    try:
+        load_tagger()
+    except LookupError:
+        return False
+
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def load_tagger() -> Callable[[List[List[str]]], List[List[str]]]:
+    """Load the POS-tagger.
+
+    NLTK is imported and the tagger model is loaded the first time this
+    function is called; later calls return the same tagger. If the models are
+    not installed, they are downloaded once. Use download_models() to install
+    them beforehand.
+
+    Returns:
+        A function that tags a list of sentences with universal POS-tags.
+    """
+    # nltk is slow to import, so only import it when tagging is needed
+    import nltk  # pylint: disable=import-outside-toplevel
+    from nltk.tag import map_tag  # pylint: disable=import-outside-toplevel
+
+    def load() -> Any:
+        tagger = nltk.tag.PerceptronTagger()
+        map_tag('en-ptb', 'universal', 'NN')
+        return tagger
+
+    try:
+        tagger = load()
+    except LookupError:
+        for model in MODELS:
+            nltk.download(model, quiet=True)
+        tagger = load()
+
+    @functools.lru_cache(maxsize=None)
+    def universal(tag: str) -> str:
+        return map_tag('en-ptb', 'universal', tag)
+
+    def tag_sents(sents: List[List[str]]) -> List[List[str]]:
+        return [[universal(tag) for _, tag in tagger.tag(sent)]
+                for sent in sents]
+
+    return tag_sents
+
+
+def sentences(words: Union[Caption, Transcript]
+              ) -> Iterator[Tuple[int, int]]:
+    """Split a Caption-list into sentences.
+
+    A sentence ends after a period, question mark or exclamation mark. The
+    words after the last of these marks form the final sentence.
+
+    Args:
+        words: The custom Caption-list dataformat or a Transcript.
+
+    Yields:
+        The (start, stop) indices of every sentence in words.
+    """
+    if isinstance(words, Transcript):
+        yield from _sentences_transcript(words)
+        return
+
+    start = 0
+    for index, word in enumerate(words):
+        if isinstance(word, asr.Punc) and word.text in SENTENCE_END:
+            yield start, index + 1
+            start = index + 1
+
+    if start < len(words):
+        yield start, len(words)
+
+
+def _sentences_transcript(words: Transcript) -> Iterator[Tuple[int, int]]:
+    """Transcript version of sentences()."""
+    start = 0
+    for index, punc in enumerate(words.punc):
+        if punc and words.text_at(index) in SENTENCE_END:
+            yield start, index + 1
+            start = index + 1
 
-    When tagging with the pos_tag() function, the optional parameter 'tagset'
-    is set to 'universal' to simplify tags.
+    if start < len(words):
+        yield start, len(words)
+
+
+def _tag_batch(sents: List[List[str]]) -> List[List[str]]:
+    """Tag sentences with the tagger of this (worker) process."""
+    return load_tagger()(sents)
+
+
+def _tag_parallel(sents: List[List[str]],
+                  pool: concurrent.futures.Executor) -> List[List[str]]:
+    """Tag sentences in batches of about TAG_BATCH words in parallel.
+
+    Every sentence is tagged on its own, so this gives the same tags as
+    tagging all sentences at once.
+
+    Args:
+        sents: The sentences, lists of lowercased words.
+        pool: The worker processes.
+
+    Returns:
+        The universal POS-tags of every sentence.
+    """
+    batches: List[List[List[str]]] = [[]]
+    words = 0
+    for sent in sents:
+        if words >= TAG_BATCH:
+            batches.append([])
+            words = 0
+        batches[-1].append(sent)
+        words += len(sent)
+
+    if len(batches) == 1:
+        return _tag_batch(sents)
+
+    return [tags for batch in pool.map(_tag_batch, batches) for tags in batch]
+
+
+def tag_sentences(sents: List[List[str]],
+                  cache: Optional[TagCache] = None,
+                  pool: Optional[concurrent.futures.Executor] = None
+                  ) -> List[str]:
+    """Tag sentences with the tagger, using the cache if given.
+
+    All sentences are tagged in a single call to the tagger, so combine the
+    sentences of multiple transcripts to tag them at once. If a pool of
+    worker processes is given, the sentences are divided over the workers.
+
+    Args:
+        sents: The sentences, lists of lowercased words.
+        cache: Persistent cache of previously tagged sentences.
+        pool: Worker processes to tag in parallel, preferably with the tagger
+            loaded already (initializer=load_tagger).
+
+    Returns:
+        The universal POS-tags of all words in all sentences.
+    """
+    tagged: List[Optional[List[str]]] = [None] * len(sents)
+    if cache is not None:
+        tagged = cache.get_many(sents)
+
+    missing = [i for i, tags in enumerate(tagged) if tags is None]
+    if missing:
+        todo = [sents[i] for i in missing]
+        if pool is None:
+            new_tags = load_tagger()(todo)
+        else:
+            new_tags = _tag_parallel(todo, pool)
+        for i, tags in zip(missing, new_tags):
+            tagged[i] = tags
+
+        if cache is not None:
+            cache.put_many(list(zip(todo, new_tags)))
+
+    return [tag for tags in tagged if tags is not None for tag in tags]
+
+
+def pos_tags(words: Union[Caption, Transcript],
+             cache: Optional[TagCache] = None,
+             pool: Optional[concurrent.futures.Executor] = None
+             ) -> List[str]:
+    """Tag every element of a Caption-list with a universal POS-tag.
+
+    The whole Caption-list is tagged at once: it is split into sentences and
+    all sentences are passed to the tagger from load_tagger() in a single
+    call, so the tagger sees every word in its sentence context. Tag a
+    transcript once with this function and pass the result to the pos_*
+    weighting functions to prevent them from tagging it again.
+
+    If a cache is given, only the sentences that are not in the cache are
+    tagged and these are added to the cache afterwards.
+
+    The tags of a Transcript are also stored in its tag attribute, which is
+    used by the pos_* weighting functions.
 
     See https://www.nltk.org/book/ch05.html for documentation.
 
+    Args:
+        words: The custom Caption-list dataformat or a Transcript.
+        cache: Persistent cache of previously tagged sentences.
+        pool: Worker processes to tag in parallel, see tag_sentences().
+
+    Returns:
+        The universal POS-tags, one for each element in words.
+    """
+    if isinstance(words, Transcript):
+        return _pos_tags_transcript(words, cache, pool)
+
+    sents = [[word.text.lower() for word in words[start:stop]]
+             for start, stop in sentences(words)]
+
+    return tag_sentences(sents, cache, pool)
+
+
+def sentence_tokens(words: Transcript) -> List[List[str]]:
+    """Return the sentences of a transcript as they are tagged.
+
+    Args:
+        words: The Transcript.
+
+    Returns:
+        The sentences, lists of lowercased words, see tag_sentences().
+    """
+    texts = [text.lower() for text in words.texts()]
+    return [texts[start:stop] for start, stop in sentences(words)]
+
+
+def _pos_tags_transcript(words: Transcript, cache: Optional[TagCache],
+                         pool: Optional[concurrent.futures.Executor]
+                         ) -> List[str]:
+    """Transcript version of pos_tags(), also sets words.tag."""
+    tags = tag_sentences(sentence_tokens(words), cache, pool)
+    words.set_tags(tags)
+    return tags
+
+
+def pos_tagger(words: Caption) -> List[Pos]:
+    """Tagging Caption elements with Part-Of-Speech tags.
+
+    Returns a universal POS-tagged list of the custom Caption-list dataformat
+    using pos_tags().
+
     Args:
         words: The custom Caption-list dataformat.
 
     Returns:
         The Caption-list with added universal POS-tags.
     """
-    tagged_words = []
-    for word in words:
-        text = word.text.lower()
-        try:
-            tag = nltk.pos_tag([text], tagset='universal')[0][1]
-        except LookupError:
-            nltk.download('averaged_perceptron_tagger')
-            nltk.download('universal_tagset')
-            tag = nltk.pos_tag([text], tagset='universal')[0][1]
+    return [Pos(word.text, word.start, word.end, word.weight, tag=tag)
+            for word, tag in zip(words, pos_tags(words))]
+
+
+def _translate(pattern: str) -> bytes:
+    """Translate a Rule pattern to a regular expression over tag ids.
+
+    Args:
+        pattern: The Rule pattern.
+
+    Returns:
+        The regular expression, for Transcript.tag as bytes.
+
+    Raises:
+        ValueError: If the pattern contains something else than POS-tags and
+            the operators ( ) | ? * +.
+    """
+    regex = b''
+    for token in re.findall(r'[A-Z]+|\S', pattern):
+        if token in TAG_IDS:
+            regex += re.escape(bytes([TAG_IDS[token]]))
+        elif token == '(':
+            regex += b'(?:'
+        elif token in ')|?*+':
+            regex += token.encode()
+        else:
+            raise ValueError(f'unknown POS-tag {token!r} in rule pattern '
+                             f'{pattern!r}')
+
+    if re.fullmatch(regex, b''):
+        raise ValueError(f'rule pattern {pattern!r} matches an empty '
+                         'sequence')
+
+    return regex
+
+
+@functools.lru_cache(maxsize=None)
+def compile_rules(rules: Tuple[Rule, ...]) -> Pattern[bytes]:
+    """Compile rules to a single matcher over tag ids.
+
+    The matcher is one regular expression that stops at every word where at
+    least one of the rules matches. For every rule, it has a group that is
+    set if that rule matches at that word. So all rules are applied in a
+    single scan over the tags, regardless of the number of rules.
+
+    Args:
+        rules: The rules.
+
+    Returns:
+        The compiled regular expression, for Transcript.tag as bytes.
+    """
+    regexes = [_translate(rule.pattern) for rule in rules]
+    any_rule = b'|'.join(b'(?:' + regex + b')' for regex in regexes)
+    each_rule = b''.join(b'(?:(?=(' + regex + b')))?' for regex in regexes)
+    return re.compile(b'(?=' + any_rule + b')' + each_rule)
+
+
+def rule_masks(tags: bytes, rules: Sequence[Rule]) -> Dict[int, int]:
+    """Find the rules that match at every word.
+
+    Args:
+        tags: The tag ids of the words, like Transcript.tag.
+        rules: The rules.
+
+    Returns:
+        For every word where at least one rule matches, a bit mask with bit i
+        set if rule i matches there.
+    """
+    rules = tuple(rules)
+    masks: Dict[int, int] = {}
+    if not rules:
+        return masks
+
+    bits = [(i, 1 << i, rule.position) for i, rule in enumerate(rules)]
+    for match in compile_rules(rules).finditer(tags):
+        start = match.start()
+        groups = match.groups()
+        for i, bit, position in bits:
+            if groups[i] is not None:
+                index = start + position
+                masks[index] = masks.get(index, 0) | bit
+
+    return masks
+
+
+def rule_deltas(tags: bytes, rules: Sequence[Rule]) -> 'array[float]':
+    """Compute the weight change of every word, see pos_rules().
+
+    Every rule adds 1 to the weight of every word except the last, and
+    subtracts its lowered weight (split_weight / factor) where it matches.
+    The changes of all rules are summed in rule order, so a delta only
+    depends on the rules that match. It's computed once for every
+    combination of rules, and only the words where a rule matches are
+    visited.
+
+    Args:
+        tags: The tag ids of the words, like Transcript.tag.
+        rules: The rules.
+
+    Returns:
+        The weight change of every word.
+    """
+    lower = [rule.split_weight * (1 / rule.factor) for rule in rules]
+
+    @functools.lru_cache(maxsize=None)
+    def delta(mask: int) -> float:
+        value = 0.0
+        for i, split_weight in enumerate(lower):
+            value += 1
+            if mask >> i & 1:
+                value -= split_weight
+        return value
+
+    deltas = array('d', [delta(0)]) * len(tags)
+    for index, mask in rule_masks(tags, rules).items():
+        if index < len(deltas):
+            deltas[index] = delta(mask)
+
+    if deltas:
+        deltas[-1] = 0.0
+
+    return deltas
+
+
+def _apply_rules(weights: Sequence[float], tags: bytes,
+                 rules: Sequence[Rule], before: int = 0) -> 'array[float]':
+    """Add the weight changes of rules to weights in one step.
+
+    Args:
+        weights: The weight of every word.
+        tags: The tag ids of the words, and of the words around them.
+        rules: The rules.
+        before: Number of tags of the words before the weighted words.
+
+    Returns:
+        The new weight of every word.
+    """
+    deltas = rule_deltas(tags, rules)[before:before + len(weights)]
+    return array('d', list(map(operator.add, weights, deltas)))
+
+
+def _longest(pattern: str) -> float:
+    """Return the length of the longest tag sequence a Rule pattern matches.
+
+    Args:
+        pattern: The Rule pattern.
+
+    Returns:
+        The number of tags, math.inf if the pattern contains * or +.
+    """
+    # the longest finished alternative and the current one of every group
+    groups = [[0.0, 0.0]]
+    for token in re.findall(r'[A-Z]+|\S', pattern):
+        if token == '(':
+            groups.append([0.0, 0.0])
+        elif token == ')':
+            longest = max(groups.pop())
+            groups[-1][1] += longest
+        elif token == '|':
+            groups[-1] = [max(groups[-1]), 0.0]
+        elif token in '*+':
+            groups[-1][1] = math.inf
+        elif token != '?':
+            groups[-1][1] += 1
+
+    return max(groups[0])
+
+
+def rule_context(rules: Sequence[Rule]) -> Tuple[int, Optional[int]]:
+    """Return the number of words around a word that rules look at.
+
+    The weight change of a word only depends on the tags of these words, so
+    a part of a transcript is weighted like the whole transcript if it's
+    given the tags around it, see pos_rules().
+
+    Args:
+        rules: The rules.
+
+    Returns:
+        The number of words before and after a word. The number after is
+        None if a rule can match any number of words.
+    """
+    before = max((rule.position for rule in rules), default=0)
+
+    # the last word isn't changed, so the next word is always needed
+    after = max([_longest(rule.pattern) - 1 - rule.position
+                 for rule in rules] + [1])
+    return before, None if math.isinf(after) else int(after)
+
+
+def rule_matches(words: Transcript, rules: Optional[Sequence[Rule]] = None
+                 ) -> Dict[str, int]:
+    """Count the words where every POS rule matches.
+
+    Args:
+        words: The tagged Transcript.
+        rules: The rules, defaults to the rule registry RULES.
+
+    Returns:
+        The number of matches of every rule, by rule name.
+    """
+    tags = words.tag.tobytes()
+    return {rule.name: sum(1 for _ in compile_rules((rule,)).finditer(tags))
+            for rule in (RULES if rules is None else rules)}
+
+
+def pos_rules(words: Words, rules: Optional[Sequence[Rule]] = None,
+              tags: Optional[Sequence[str]] = None,
+              context: Tuple[bytes, bytes] = (b'', b'')) -> Words:
+    """Apply multiple POS rules at once.
+
+    Every rule lowers the weight of the words where its pattern matches. Like
+    the pos_* functions, every rule also adds 1 to the weight of every word
+    except the last. The rules are compiled to a single matcher (see
+    compile_rules()), so this needs one scan over the tags of the transcript.
+    The changes of all rules are summed into one delta per word (see
+    rule_deltas()), which is added to the weights in one step.
+
+    For the default rules and the weights of speech_gaps() and punctuation(),
+    the weights are exactly the same as those of the pos_* functions applied
+    one after another. Other weights can differ in the last bit, as the
+    changes are rounded in another order.
+
+    Args:
+        words: The custom Caption-list dataformat or a Transcript.
+        rules: The rules, defaults to the rule registry RULES.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
+        context: If a Transcript is a part of a longer transcript, the tag
+            ids of the words before and after it, as far as rule_context().
+            The weights are then the same as those of the longer transcript.
+
+    Returns:
+        The words with adjusted weights.
+    """
+    rules = tuple(RULES if rules is None else rules)
+
+    if isinstance(words, Transcript):
+        before, after = context
+        words.weight = _apply_rules(
+            words.weight, before + words.tag.tobytes() + after, rules,
+            len(before))
+        return words
 
-        tagged_words.append(Pos(word.text, word.start, word.end, word.weight,
-                                tag=tag))
+    if tags is None:
+        tags = pos_tags(words)
 
-    return tagged_words
+    ids = bytes(map(TAG_IDS.get, tags, itertools.repeat(TAG_IDS['X'])))
+    weights = _apply_rules(list(map(operator.attrgetter('weight'), words)),
+                           ids, rules)
+    for word, weight in zip(words, weights):
+        word.weight = weight
+
+    return words
 
 
-def pos_pron_verb(words: Caption, factor: float = 1,
-                  split_weight: float = 0.2) -> Caption:
+def pos_pron_verb(words: Words, factor: float = 1,
+                  split_weight: float = 0.2,
+                  tags: Optional[Sequence[str]] = None) -> Words:
     """Avoid splitting between pronoun + verb by adjusting weight.
 
     Returns the custom Caption-list dataformat with adjusted weights for the
@@ -81,25 +644,21 @@ def pos_pron_verb(words: Caption, factor: float = 1,
         factor: Float indicating the importance of this split function.
         split_weight: Float indicating the importance of not splitting on the
             word.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
 
     Returns:
         The custom POS-tagged Caption-list dataformat with adjusted weight
         attribute.
     """
-    tagged_words = pos_tagger(words)
-
-    for index, word in enumerate(tagged_words[:-1]):
-        next_word = tagged_words[index+1]
-        words[index].weight += 1
-
-        if word.tag == 'PRON' and next_word.tag == 'VERB':
-            words[index].weight -= split_weight * (1 / factor)
-
-    return words
+    rule = dataclasses.replace(PRON_VERB, factor=factor,
+                               split_weight=split_weight)
+    return pos_rules(words, [rule], tags)
 
 
-def pos_det_noun(words: Caption, factor: float = 1,
-                 split_weight: float = 0.3) -> Caption:
+def pos_det_noun(words: Words, factor: float = 1,
+                 split_weight: float = 0.3,
+                 tags: Optional[Sequence[str]] = None) -> Words:
     """Avoid splitting between determiner + noun by adjusting weight.
 
     Returns the custom Caption-list dataformat with adjusted weights for the
@@ -114,26 +673,22 @@ def pos_det_noun(words: Caption, factor: float = 1,
         factor: Indicating the importance of this split function.
         split_weight: Indicating the importance of not splitting on the
             word.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
 
     Returns:
         The custom POS-tagged Caption-list dataformat with adjusted weight
         attribute.
     """
-    tagged_words = pos_tagger(words)
+    rule = dataclasses.replace(DET_NOUN, factor=factor,
+                               split_weight=split_weight)
+    return pos_rules(words, [rule], tags)
 
-    for index, word in enumerate(tagged_words[:-1]):
-        next_word = tagged_words[index+1]
-        words[index].weight += 1
 
-        if word.tag == 'DET' and next_word.tag == 'NOUN':
-            words[index].weight -= split_weight * (1 / factor)
-
-    return words
-
-
-def pos_prep_phrase(words: Caption,
+def pos_prep_phrase(words: Words,
                     factor: float = 1,
-                    split_weight: float = 0.4) -> Caption:
+                    split_weight: float = 0.4,
+                    tags: Optional[Sequence[str]] = None) -> Words:
     """Avoid splitting between preposition + following phrase.
 
     Returns the custom Caption-list dataformat with adjusted weights for the
@@ -148,49 +703,22 @@ def pos_prep_phrase(words: Caption,
         factor: Indicating the importance of this split function.
         split_weight: Indicating the importance of not splitting on the
             word.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
 
     Returns:
         The custom POS-tagged Caption-list dataformat with adjusted weight
         attribute.
     """
-    tagged_words = pos_tagger(words)
-
-    for index, word in enumerate(tagged_words[:-1]):
-        words[index].weight += 1
-
-        if word == tagged_words[-3]:
-            next_word = tagged_words[index+1]
-            nextnext = tagged_words[index+2]
-
-            adp_options = (('ADP', 'DET', 'NOUN'),
-                           ('ADP', 'ADJ', 'NOUN'),
-                           ('ADP', 'PRON', 'NOUN'))
-            if (word.tag, next_word.tag, nextnext.tag) in adp_options:
-                words[index].weight -= split_weight * (1 / factor)
-
-            continue
-
-        if word == tagged_words[-2]:
-            continue
-
-        next_word = tagged_words[index+1]
-        nextnext = tagged_words[index+2]
-        nextnextnext = tagged_words[index+3]
-
-        if word.tag == 'ADP' and \
-            ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
-             (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
-             (next_word.tag == 'DET' and nextnext.tag == 'ADJ' and
-              nextnextnext.tag == 'NOUN') or
-             (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
-            words[index].weight -= split_weight * (1 / factor)
-
-    return words
+    rule = dataclasses.replace(PREP_PHRASE, factor=factor,
+                               split_weight=split_weight)
+    return pos_rules(words, [rule], tags)
 
 
-def pos_conj_phrase(words: Caption,
+def pos_conj_phrase(words: Words,
                     factor: float = 1,
-                    split_weight: float = 0.3) -> Caption:
+                    split_weight: float = 0.3,
+                    tags: Optional[Sequence[str]] = None) -> Words:
     """Avoid splitting between conjunction + following phrase.
 
     Returns the custom Caption-list dataformat with adjusted weights for the
@@ -205,48 +733,21 @@ def pos_conj_phrase(words: Caption,
         factor: Indicating the importance of this split function.
         split_weight: Indicating the importance of not splitting on the
             word.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
 
     Returns:
         The custom POS-tagged Caption-list dataformat with adjusted weight
         attribute.
     """
-    tagged_words = pos_tagger(words)
-
-    for index, word in enumerate(tagged_words[:-1]):
-        words[index].weight += 1
-
-        if word == tagged_words[-3]:
-            next_word = tagged_words[index+1]
-            nextnext = tagged_words[index+2]
-
-            if word.tag == 'CONJ' and \
-                ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
-                 (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
-                 (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
-                words[index].weight -= split_weight * (1 / factor)
-
-            continue
-
-        if word == tagged_words[-2]:
-            continue
+    rule = dataclasses.replace(CONJ_PHRASE, factor=factor,
+                               split_weight=split_weight)
+    return pos_rules(words, [rule], tags)
 
-        next_word = tagged_words[index+1]
-        nextnext = tagged_words[index+2]
-        nextnextnext = tagged_words[index+3]
 
-        if word.tag == 'CONJ' and \
-            ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
-             (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
-             (next_word.tag == 'DET' and nextnext.tag == 'ADJ' and
-              nextnextnext.tag == 'NOUN') or
-             (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
-            words[index].weight -= split_weight * (1 / factor)
-
-    return words
-
-
-def complex_verbs(words: Caption, factor: float = 1,
-                  split_weight: float = 0.3) -> Caption:
+def complex_verbs(words: Words, factor: float = 1,
+                  split_weight: float = 0.3,
+                  tags: Optional[Sequence[str]] = None) -> Words:
     """Avoid splitting between complex verbs # BUG: y adjusting weight.
 
     Returns the custom Caption-list dataformat with adjusted weights for the
@@ -261,25 +762,20 @@ def complex_verbs(words: Caption, factor: float = 1,
         factor: Indicating the importance of this split function.
         split_weight: Indicating the importance of not splitting on the
             word.
+        tags: The POS-tags of words as returned by pos_tags(). The words are
+            tagged if not given. A Transcript uses its own tags instead.
 
     Returns:
         The custom POS-tagged Caption-list dataformat with adjusted weight
         attribute.
     """
-    tagged_words = pos_tagger(words)
-
-    for index, word in enumerate(tagged_words[:-1]):
-        next_word = tagged_words[index+1]
-        words[index].weight += 1
-
-        if word.tag == 'VERB' and next_word.tag == 'VERB':
-            words[index].weight -= split_weight * (1 / factor)
-
-    return words
+    rule = dataclasses.replace(COMPLEX_VERBS, factor=factor,
+                               split_weight=split_weight)
+    return pos_rules(words, [rule], tags)
 
 
-
-def speech_gaps(data: Caption, threshold: float = 1.5) -> Caption:
+def speech_gaps(data: Words, threshold: float = 1.5,
+                next_start: Optional[float] = None) -> Words:
     """Add weight to words with a speech gap after them.
 
     This function uses a threshold for the gap. The weight is hardcoded to be
@@ -289,21 +785,44 @@ def speech_gaps(data: Caption, threshold: float = 1.5) -> Caption:
         data: The transcript subtitles according to our custom Caption-list
             datastructure.
         threshold: Determines the length of a speech gap.
+        next_start: Start time of the word after data, if the transcript
+            continues after data.
 
     Returns:
         The Caption-list datastructure with adjusted weights.
     """
+    if isinstance(data, Transcript):
+        _speech_gaps_transcript(data, threshold, next_start)
+        return data
+
     # loop pairwise over data
     for word_1, word_2 in zip(data, data[1:]):
         if word_2.start - word_1.end > threshold:
             word_1.weight = 100
 
+    if data and next_start is not None and \
+            next_start - data[-1].end > threshold:
+        data[-1].weight = 100
+
     return data
 
 
-def punctuation(words: Caption,
+def _speech_gaps_transcript(data: Transcript, threshold: float,
+                            next_start: Optional[float]) -> None:
+    """Transcript version of speech_gaps()."""
+    start, end, weight = data.start, data.end, data.weight
+    for index in range(len(data) - 1):
+        if start[index+1] - end[index] > threshold:
+            weight[index] = 100
+
+    if data and next_start is not None and \
+            next_start - end[-1] > threshold:
+        weight[-1] = 100
+
+
+def punctuation(words: Words,
                 factor: float = 1,
-                params: Sequence[float] = (0.95, 0.85, 0.6)) -> Caption:
+                params: Sequence[float] = (0.95, 0.85, 0.6)) -> Words:
     """Adjusts weights of punctuation.
 
     Args:
@@ -317,6 +836,10 @@ def punctuation(words: Caption,
     Returns:
         The Caption-list datastructure with adjusted weights.
     """
+    if isinstance(words, Transcript):
+        _punctuation_transcript(words, factor, params)
+        return words
+
     period, question, comma = params
 
     punct_dict = {'.': period,
@@ -333,6 +856,24 @@ def punctuation(words: Caption,
     return words
 
 
+def _punctuation_transcript(words: Transcript, factor: float,
+                            params: Sequence[float]) -> None:
+    """Transcript version of punctuation()."""
+    period, question, comma = params
+
+    punct_dict = {'.': period,
+                  '?': question,
+                  ',': comma,
+                  '!': 0.4,
+                  ';': 0.3,
+                  ':': 0.3}
+
+    for index, punc in enumerate(words.punc):
+        if punc:
+            words.weight[index] += \
+                punct_dict.get(words.text_at(index), 0.2) * factor
+
+
 def length(data: List[str],
            max_length: int = 42,
            splits: List[List[str]] = []) -> List[List[str]]:
@@ -407,15 +948,19 @@ def line_breaks(groups: List[Caption], factor: float = 1,
                 bound: int = 42) -> List[Caption]:
     r"""Add line breaks to caption groups.
 
-    This function appends the string '\n' to the word in the middle of the
+    This function sets the line_break flag of the word in the middle of the
     caption group with the highest weight, if the caption is longer than
-    <bound> characters (usually 42).
+    <bound> characters (usually 42). The flags of the other words are cleared,
+    so the caption groups can be broken again with another bound.
 
     First, a list of split options is created. This makes sure both lines are
     shorter than <bound> characters. Then it add weights to these split options
     using numpy's linspace over a parabola with roots at the number of split
     options: \(-\frac{1}{h^2}x^2 + 1\).
 
+    The line lengths are computed from the cumulative lengths of the words, so
+    this takes linear time in the size of the caption group.
+
     Args:
         groups: The caption groups, consists of a list of our custom
             Caption-list dataformats.
@@ -427,26 +972,38 @@ def line_breaks(groups: List[Caption], factor: float = 1,
         dataformats.
     """
     f = lambda x, h: -1 / (h**2) * x**2 + 1
-    line_in_bound = lambda s: len(' '.join(x.text for x in s)) <= bound
 
     for group in groups:
+        for word in group:
+            word.line_break = False
+
         # don't split caption groups with fewer characters than bound
-        sent = ' '.join(w.text for w in group)
-        punc = re.compile(r' ([,.?!])')
-        sent = punc.sub(r'\g<1>', sent)
+        sent = _PUNC.sub(r'\g<1>', ' '.join(w.text for w in group))
 
         if len(sent) <= bound:
             continue
 
-        goods = []
+        # cumulative[i] is the length of the words before i, without spaces
+        cumulative = list(itertools.accumulate(
+            itertools.chain([0], (len(w.text) for w in group))))
+        total = cumulative[-1] + len(group) - 1
+
+        # split before word i if both group[:i] and group[i:] are in bound,
+        # the options form a range, as the first line grows with i
+        first = 1
+        while first < len(group) and \
+                total - cumulative[first] - first > bound:
+            first += 1
+
+        last = first
+        while last < len(group) and cumulative[last] + last - 1 <= bound:
+            last += 1
 
-        for i, _ in enumerate(group):
-            if line_in_bound(group[:i]) and line_in_bound(group[i:]):
-                goods.append(group[i-1])
+        goods = group[first-1:last-1]
 
         # if there's no 'right' split, just split in half
         if len(goods) == 0:
-            group[len(group)//2].text += '\n'
+            group[len(group)//2].line_break = True
             continue
 
         half = math.ceil(len(goods) / 2)
@@ -456,6 +1013,6 @@ def line_breaks(groups: List[Caption], factor: float = 1,
             word.weight += f(weight, half) * factor
 
         split = max(goods, key=lambda t: t.weight)
-        split.text += '\n'
+        split.line_break = True
 
     return groups
@@ -25,6 +25,9 @@ setuptools.setup(
         'nltk'
     ],
     extras_require={
+        'lstm': [
+            'torch'
+        ],
         'dev': [
             'pylint',
             'mypy',
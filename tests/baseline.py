@@ -0,0 +1,394 @@
+"""The original implementations of functions that were rewritten for speed.
+
+The tests compare the rewritten functions with these. They're copied from
+the first version of cap. The pos_* functions get the tagged words of
+pos_tagger() instead of tagging the words themselves, so they can run without
+the tagger.
+"""
+from datetime import timedelta
+import json
+import math
+import re
+from typing import IO, Dict, List, Sequence, Tuple
+
+import srt
+
+from cap import asr
+from cap.weighting import Pos
+
+
+Caption = List[asr.Word]
+Groups = List[Caption]
+
+
+def asr_groups(f: IO[str]) -> Caption:
+    """ASR.groups(), reading the words from an opened ASR file."""
+    cap = []
+
+    words = json.load(f)['results']['items']
+
+    for word in words:
+        text = word['alternatives'][0]['content']
+
+        if word['type'] == 'pronunciation':
+            start = word['start_time']
+            end = word['end_time']
+            cap.append(asr.Word(text, float(start), float(end), weight=0))
+        else:
+            time = cap[-1].end
+            cap.append(asr.Punc(text, time, time, weight=0))
+
+    return cap
+
+
+def speech_gaps(data: Caption, threshold: float = 1.5) -> Caption:
+    # loop pairwise over data
+    for word_1, word_2 in zip(data, data[1:]):
+        if word_2.start - word_1.end > threshold:
+            word_1.weight = 100
+
+    return data
+
+
+def punctuation(words: Caption,
+                factor: float = 1,
+                params: Sequence[float] = (0.95, 0.85, 0.6)) -> Caption:
+    period, question, comma = params
+
+    punct_dict = {'.': period,
+                  '?': question,
+                  ',': comma,
+                  '!': 0.4,
+                  ';': 0.3,
+                  ':': 0.3}
+
+    for word in words:
+        if isinstance(word, asr.Punc):
+            word.weight += punct_dict.get(word.text, 0.2) * factor
+
+    return words
+
+
+def pos_tagger(words: Caption, tags: Sequence[str]) -> List[Pos]:
+    """Create the tagged words of the pos_* functions from given tags."""
+    return [Pos(word.text, word.start, word.end, word.weight, tag=tag)
+            for word, tag in zip(words, tags)]
+
+
+def pos_pron_verb(words: Caption, tagged_words: List[Pos],
+                  factor: float = 1, split_weight: float = 0.2
+                  ) -> Caption:
+    for index, word in enumerate(tagged_words[:-1]):
+        next_word = tagged_words[index+1]
+        words[index].weight += 1
+
+        if word.tag == 'PRON' and next_word.tag == 'VERB':
+            words[index].weight -= split_weight * (1 / factor)
+
+    return words
+
+
+def pos_det_noun(words: Caption, tagged_words: List[Pos],
+                 factor: float = 1, split_weight: float = 0.3
+                 ) -> Caption:
+    for index, word in enumerate(tagged_words[:-1]):
+        next_word = tagged_words[index+1]
+        words[index].weight += 1
+
+        if word.tag == 'DET' and next_word.tag == 'NOUN':
+            words[index].weight -= split_weight * (1 / factor)
+
+    return words
+
+
+def pos_prep_phrase(words: Caption, tagged_words: List[Pos],
+                    factor: float = 1, split_weight: float = 0.4
+                    ) -> Caption:
+    for index, word in enumerate(tagged_words[:-1]):
+        words[index].weight += 1
+
+        if word == tagged_words[-3]:
+            next_word = tagged_words[index+1]
+            nextnext = tagged_words[index+2]
+
+            adp_options = (('ADP', 'DET', 'NOUN'),
+                           ('ADP', 'ADJ', 'NOUN'),
+                           ('ADP', 'PRON', 'NOUN'))
+            if (word.tag, next_word.tag, nextnext.tag) in adp_options:
+                words[index].weight -= split_weight * (1 / factor)
+
+            continue
+
+        if word == tagged_words[-2]:
+            continue
+
+        next_word = tagged_words[index+1]
+        nextnext = tagged_words[index+2]
+        nextnextnext = tagged_words[index+3]
+
+        if word.tag == 'ADP' and \
+            ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
+             (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
+             (next_word.tag == 'DET' and nextnext.tag == 'ADJ' and
+              nextnextnext.tag == 'NOUN') or
+             (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
+            words[index].weight -= split_weight * (1 / factor)
+
+    return words
+
+
+def pos_conj_phrase(words: Caption, tagged_words: List[Pos],
+                    factor: float = 1, split_weight: float = 0.3
+                    ) -> Caption:
+    for index, word in enumerate(tagged_words[:-1]):
+        words[index].weight += 1
+
+        if word == tagged_words[-3]:
+            next_word = tagged_words[index+1]
+            nextnext = tagged_words[index+2]
+
+            if word.tag == 'CONJ' and \
+                ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
+                 (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
+                 (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
+                words[index].weight -= split_weight * (1 / factor)
+
+            continue
+
+        if word == tagged_words[-2]:
+            continue
+
+        next_word = tagged_words[index+1]
+        nextnext = tagged_words[index+2]
+        nextnextnext = tagged_words[index+3]
+
+        if word.tag == 'CONJ' and \
+            ((next_word.tag == 'DET' and nextnext.tag == 'NOUN') or
+             (next_word.tag == 'ADJ' and nextnext.tag == 'NOUN') or
+             (next_word.tag == 'DET' and nextnext.tag == 'ADJ' and
+              nextnextnext.tag == 'NOUN') or
+             (next_word.tag == 'PRON' and nextnext.tag == 'NOUN')):
+            words[index].weight -= split_weight * (1 / factor)
+
+    return words
+
+
+def complex_verbs(words: Caption, tagged_words: List[Pos],
+                  factor: float = 1, split_weight: float = 0.3
+                  ) -> Caption:
+    for index, word in enumerate(tagged_words[:-1]):
+        next_word = tagged_words[index+1]
+        words[index].weight += 1
+
+        if word.tag == 'VERB' and next_word.tag == 'VERB':
+            words[index].weight -= split_weight * (1 / factor)
+
+    return words
+
+
+# the POS weighting functions in the order of create_groups()
+POS_FUNCTIONS = (pos_pron_verb, pos_det_noun, pos_prep_phrase,
+                 pos_conj_phrase, complex_verbs)
+
+
+def check_cps(data: Caption, max_cps: float = 15,
+              deviation: float = 1.5) -> int:
+    tot_time = data[-1].end - data[0].start
+    characters = len(' '.join(word.text for word in data))
+    cur_cps = characters / tot_time
+
+    if cur_cps > max_cps + deviation:
+        return 1
+
+    if cur_cps < max_cps - deviation:
+        return -1
+
+    return 0
+
+
+def cps(data: List[Caption], threshold: float = 0.75) -> List[Caption]:
+    max_it = int((threshold / 0.05) - 1)
+    for i, group in enumerate(data):
+        it = 0
+        check = check_cps(group)
+
+        while check != 0 and it != max_it:
+            if check == -1:
+                group[-1].end -= 0.035
+                group[0].start += 0.015
+                check = check_cps(group)
+                it += 1
+
+            else:
+                try:
+                    strt = data[i+1][0].start
+                except IndexError:
+                    break
+
+                if strt - group[-1].end > threshold:
+                    group[-1].end += 0.05
+                    check = check_cps(group)
+                    it += 1
+
+                else:
+                    check = 0
+
+    return data
+
+
+def split_weights(subs: Caption, result: Groups = [],
+                  char_limit: int = 81, char_limit_div: int = 5) -> Groups:
+    if len(' '.join(x.text for x in subs)) <= char_limit:
+        result.append(subs)
+        return result
+
+    try:
+        max_weight = max(subs[char_limit_div:-char_limit_div],
+                         key=lambda t: t.weight)
+    except ValueError:
+        return result
+
+    max_index = subs.index(max_weight)
+
+    split_weights(subs[:max_index+1])
+    split_weights(subs[max_index+1:])
+
+    return result
+
+
+def split_groups(subs: Caption) -> Groups:
+    """Run split_weights() like create_groups() did, but only once.
+
+    The recursive calls of split_weights() collect the caption groups in the
+    default value of its result argument, which is emptied afterwards.
+    """
+    result = split_weights.__defaults__[0]  # type: ignore
+    split_weights(subs)
+    groups = list(result)
+    result.clear()
+    return groups
+
+
+def _abs_linspace(start: int, stop: int, step: int) -> List[float]:
+    """Simple version of np.abs(np.linspace())."""
+    if step == 1:
+        return [start]
+
+    return [abs(start + x * (stop-start)/(step - 1)) for x in range(step)]
+
+
+def line_breaks(groups: List[Caption], factor: float = 1,
+                bound: int = 42) -> List[Caption]:
+    """Add line breaks by appending '\\n' to the text of a word."""
+    f = lambda x, h: -1 / (h**2) * x**2 + 1
+    line_in_bound = lambda s: len(' '.join(x.text for x in s)) <= bound
+
+    for group in groups:
+        # don't split caption groups with fewer characters than bound
+        sent = ' '.join(w.text for w in group)
+        punc = re.compile(r' ([,.?!])')
+        sent = punc.sub(r'\g<1>', sent)
+
+        if len(sent) <= bound:
+            continue
+
+        goods = []
+
+        for i, _ in enumerate(group):
+            if line_in_bound(group[:i]) and line_in_bound(group[i:]):
+                goods.append(group[i-1])
+
+        # if there's no 'right' split, just split in half
+        if len(goods) == 0:
+            group[len(group)//2].text += '\n'
+            continue
+
+        half = math.ceil(len(goods) / 2)
+        weights = _abs_linspace(-half, half, len(goods) + 2)[1:-1]
+
+        for word, weight in zip(goods, weights):
+            word.weight += f(weight, half) * factor
+
+        split = max(goods, key=lambda t: t.weight)
+        split.text += '\n'
+
+    return groups
+
+
+def newlines(groups: Groups) -> List[Tuple[str, float, float, float]]:
+    """Return the words of caption groups like line_breaks() leaves them.
+
+    Args:
+        groups: The caption groups, with line breaks as line_break flags or
+            as a newline after the text like line_breaks().
+
+    Returns:
+        The text (with the newline), start, end and weight of every word.
+    """
+    return [(word.text + '\n' * word.line_break, word.start, word.end,
+             word.weight) for group in groups for word in group]
+
+
+def create_groups(subs: Caption, tags: Sequence[str]) -> Groups:
+    """The original create_groups(), with the given POS-tags."""
+    tagged = pos_tagger(subs, tags)
+    subs = speech_gaps(subs)
+    subs = punctuation(subs)
+    for function in POS_FUNCTIONS:
+        subs = function(subs, tagged)
+
+    groups = split_groups(subs)
+    groups = cps(groups)
+
+    return line_breaks(groups)
+
+
+def create_subtitles(caption: Groups) -> List[srt.Subtitle]:
+    punc = re.compile(r' ([,.?!])')
+    nl = re.compile(r'\n ')
+
+    subtitles = []
+    for i, group in enumerate(caption):
+        text = ' '.join(word.text for word in group)
+
+        # strip spaces in front of punctuation
+        text = punc.sub(r'\g<1>', text)
+        text = nl.sub(r'\n', text)
+
+        start = group[0].start
+        end = group[-1].end
+        sub = srt.Subtitle(i, timedelta(seconds=start),
+                           timedelta(seconds=end), text)
+        subtitles.append(sub)
+
+    return subtitles
+
+
+def compose(caption: Groups) -> str:
+    return srt.compose(create_subtitles(caption))
+
+
+def tokenize(content: str) -> List[str]:
+    """Tokenize a subtitle like create_traindata() of caption_segmentation."""
+    # Add the eoc tags at the end of each caption
+    content += " <eoc>"
+
+    # Preprocess the sub to indepently train on punctuation and nl's
+    content = content.replace('\n', ' <nl> ')
+    content = content.replace('.', ' .')
+    content = content.replace('?', ' ?')
+    content = content.replace('!', ' !')
+    content = content.replace(',', ' ,')
+    content = content.replace(';', ' ;')
+    content = content.replace(':', ' :')
+    return content.lower().split()
+
+
+def build_vocab(training_data: List[List[str]]) -> Dict[str, int]:
+    """The vocabulary of train() in caption_segmentation."""
+    word_to_ix = {'unk': 0}
+    for sent in training_data:
+        for word in sent:
+            if word not in word_to_ix:
+                word_to_ix[word] = len(word_to_ix)
+    return word_to_ix
@@ -0,0 +1,80 @@
+"""Random transcripts for the tests."""
+import json
+import random
+from typing import List, Tuple
+
+from cap import asr
+
+
+Caption = List[asr.Word]
+
+# the tags of the words, punctuation is tagged '.'
+TAGS = ('ADJ', 'ADP', 'ADV', 'CONJ', 'DET', 'NOUN', 'NUM', 'PRT', 'PRON',
+        'VERB', 'X')
+PUNCTUATION = '..??!,,,;:-'
+
+
+def random_words(seed: int, n: int, gaps: float = 0.02,
+                 punctuation: float = 0.1) -> Tuple[Caption, List[str]]:
+    """Create a random transcript without weights.
+
+    Args:
+        seed: Seed of the random generator, the same seed gives the same
+            transcript.
+        n: Number of words and punctuation marks.
+        gaps: Chance of a speech gap of 2 seconds before a word.
+        punctuation: Chance that an element is a punctuation mark.
+
+    Returns:
+        The words and their POS-tags.
+    """
+    rng = random.Random(seed)
+    words: Caption = []
+    tags: List[str] = []
+    clock = 0.0
+    for i in range(n):
+        if words and rng.random() < punctuation:
+            words.append(asr.Punc(rng.choice(PUNCTUATION), clock, clock, 0))
+            tags.append('.')
+            continue
+
+        clock += 2 if rng.random() < gaps else rng.uniform(0, 0.2)
+        end = clock + rng.uniform(0.1, 0.6)
+        text = rng.choice(('a', 'an', 'the', 'word', 'caption', 'it')) + \
+            'x' * rng.randrange(8) + str(i)
+        words.append(asr.Word(text, round(clock, 3), round(end, 3), 0))
+        tags.append(rng.choice(TAGS))
+        clock = end
+
+    return words, tags
+
+
+def asr_json(words: Caption) -> str:
+    """Create the content of an ASR file.
+
+    Args:
+        words: The words and punctuation, see random_words().
+
+    Returns:
+        The ASR file as JSON.
+    """
+    items = []
+    for word in words:
+        item = {'alternatives': [{'confidence': '0.9',
+                                  'content': word.text}]}
+        if isinstance(word, asr.Punc):
+            item['type'] = 'punctuation'
+        else:
+            item.update(start_time=f'{word.start:.3f}',
+                        end_time=f'{word.end:.3f}', type='pronunciation')
+        items.append(item)
+
+    return json.dumps({
+        'jobName': 'sample',
+        'results': {
+            'transcripts': [{'transcript': ' '.join(word.text
+                                                    for word in words)}],
+            'items': items,
+        },
+        'status': 'COMPLETED',
+    })
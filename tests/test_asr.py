@@ -0,0 +1,86 @@
+"""Tests of reading ASR files, compared with the json module."""
+import io
+import json
+import unittest
+
+from cap import asr
+
+import baseline
+import samples
+
+
+class TestStreamItems(unittest.TestCase):
+
+    def test_same_as_json(self) -> None:
+        for seed in range(5):
+            words, _ = samples.random_words(seed, 300)
+            content = samples.asr_json(words)
+            expected = json.loads(content)['results']['items']
+            for chunk_size in (1, 7, 100, 1 << 16):
+                items = list(asr.stream_items(io.StringIO(content),
+                                              chunk_size=chunk_size))
+                self.assertEqual(items, expected)
+
+    def test_skipped_values(self) -> None:
+        content = json.dumps({
+            'a': [1, {'b': '}]"\\\\'}, 'c\\"'],
+            'results': {'x': None, 'items': [{'n': [1.5, True]}, 'ü'],
+                        'y': {'items': [3]}},
+            'z': 'end',
+        }, indent=1)
+        for chunk_size in (1, 3, 1 << 16):
+            self.assertEqual(list(asr.stream_items(io.StringIO(content),
+                                                   chunk_size=chunk_size)),
+                             [{'n': [1.5, True]}, 'ü'])
+
+    def test_other_path(self) -> None:
+        content = '{"items": [], "other": {"list": [1, 2]}}'
+        self.assertEqual(list(asr.stream_items(io.StringIO(content),
+                                               ('items',))), [])
+        self.assertEqual(list(asr.stream_items(io.StringIO('[1, 2]'), ())),
+                         [1, 2])
+        self.assertEqual(list(asr.stream_items(io.StringIO(content),
+                                               ('other', 'list'))), [1, 2])
+
+    def test_errors(self) -> None:
+        with self.assertRaises(KeyError):
+            list(asr.stream_items(io.StringIO('{"results": {}}')))
+        with self.assertRaises(KeyError):
+            list(asr.stream_items(io.StringIO('{"other": 1}')))
+        with self.assertRaises(json.JSONDecodeError):
+            list(asr.stream_items(io.StringIO('{"results": {"items": 1}}')))
+        with self.assertRaises(json.JSONDecodeError):
+            list(asr.stream_items(io.StringIO(
+                '{"results": {"items": [1]}} 2')))
+
+        # the elements before the error are read
+        items = asr.stream_items(io.StringIO('{"results": {"items": [1, 2'))
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(json.JSONDecodeError):
+            list(items)
+
+
+class TestASR(unittest.TestCase):
+
+    def test_same_as_original(self) -> None:
+        for seed in range(5):
+            words, _ = samples.random_words(seed, 300)
+            content = samples.asr_json(words)
+            expected = baseline.asr_groups(io.StringIO(content))
+            self.assertEqual(asr.ASR(io.StringIO(content)).groups(), expected)
+            self.assertEqual(list(asr.ASR(io.StringIO(content)).words()),
+                             expected)
+
+    def test_loaded(self) -> None:
+        words, _ = samples.random_words(0, 20)
+        data = asr.ASR(io.StringIO(samples.asr_json(words)))
+        self.assertEqual(data.transcript(),
+                         ' '.join(word.text for word in words))
+        self.assertEqual(data.json()['status'], 'COMPLETED')
+
+        # the loaded data is used instead of the consumed stream
+        self.assertEqual(len(data.groups()), len(words))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Tests of the subtitle writers, compared with srt.compose()."""
+import copy
+import io
+import json
+import os
+import tempfile
+import unittest
+from xml.etree import ElementTree
+
+import srt
+
+from cap import asr, caption, convert
+
+import baseline
+import samples
+
+
+def sample_groups(seed: int, n: int = 600) -> convert.Groups:
+    """Create caption groups with line breaks from random words.
+
+    Args:
+        seed: Seed of the random generator.
+        n: Number of words.
+
+    Returns:
+        The caption groups.
+    """
+    words, tags = samples.random_words(seed, n)
+    return convert.create_groups(words, tags=tags)
+
+
+def original(groups: convert.Groups) -> convert.Groups:
+    """Copy caption groups with the line breaks in the text of the words."""
+    groups = copy.deepcopy(groups)
+    for group in groups:
+        for word in group:
+            if word.line_break:
+                word.text += '\n'
+                word.line_break = False
+    return groups
+
+
+class TestCompose(unittest.TestCase):
+
+    def test_same_as_srt(self) -> None:
+        for seed in range(10):
+            groups = sample_groups(seed)
+            self.assertEqual(caption.compose(groups),
+                             baseline.compose(original(groups)))
+
+    def test_unordered(self) -> None:
+        groups = sample_groups(0)
+        groups[3], groups[7] = groups[7], groups[3]
+
+        # a caption group without duration, and one with an empty line
+        groups[10][-1].end = groups[10][0].start
+        groups[12][0].line_break = True
+        groups[12][1].text = ''
+        self.assertEqual(caption.compose(groups),
+                         baseline.compose(original(groups)))
+
+    def test_cues(self) -> None:
+        groups = sample_groups(1)
+        cues = list(caption.cues(groups, start_index=5))
+        subtitles = list(srt.sort_and_reindex(
+            baseline.create_subtitles(original(groups)), start_index=5))
+        self.assertEqual([cue.number for cue in cues],
+                         [sub.index for sub in subtitles])
+        self.assertEqual([cue.text for cue in cues],
+                         [sub.content for sub in subtitles])
+
+    def test_formats(self) -> None:
+        groups = sample_groups(2)
+        subtitles = list(srt.parse(caption.compose(groups)))
+
+        vtt = caption.compose(groups, 'vtt')
+        self.assertTrue(vtt.startswith('WEBVTT\n\n'))
+        self.assertEqual(vtt.count(' --> '), len(subtitles))
+
+        body = ElementTree.fromstring(caption.compose(groups, 'ttml'))
+        paragraphs = body.findall('.//{http://www.w3.org/ns/ttml}p')
+        self.assertEqual(len(paragraphs), len(subtitles))
+
+        cues = json.loads(caption.compose(groups, 'json'))
+        self.assertEqual([cue['text'] for cue in cues],
+                         [sub.content for sub in subtitles])
+        # the SRT times are truncated to milliseconds
+        for cue, sub in zip(cues, subtitles):
+            self.assertAlmostEqual(cue['start'], sub.start.total_seconds(),
+                                   delta=0.001)
+        self.assertEqual(sum(len(cue['words']) for cue in cues),
+                         sum(map(len, groups)))
+
+    def test_escape(self) -> None:
+        groups = [[asr.Word('<b>&', 0, 1, 0)]]
+        self.assertIn('&lt;b&gt;&amp;', caption.compose(groups, 'vtt'))
+        self.assertIn('&lt;b&gt;&amp;', caption.compose(groups, 'ttml'))
+
+
+class TestWrite(unittest.TestCase):
+
+    def test_write_formats(self) -> None:
+        groups = sample_groups(3)
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = {fmt: os.path.join(directory, 'out' + f.extension)
+                         for fmt, f in caption.FORMATS.items()}
+            caption.write_formats(groups, filenames)
+            for fmt, filename in filenames.items():
+                with open(filename, encoding='utf-8') as f:
+                    self.assertEqual(f.read(), caption.compose(groups, fmt))
+
+            caption.write(groups, filenames['srt'])
+            with open(filenames['srt'], encoding='utf-8') as f:
+                self.assertEqual(f.read(), baseline.compose(original(groups)))
+
+    def test_write_stream(self) -> None:
+        groups = sample_groups(4)
+        f = io.StringIO()
+        caption.write_stream(iter(groups), f)
+        self.assertEqual(f.getvalue(), caption.compose(groups))
+
+        files = {'srt': io.StringIO(), 'vtt': io.StringIO()}
+        caption.write_stream(iter(groups), files)
+        self.assertEqual(files['vtt'].getvalue(),
+                         caption.compose(groups, 'vtt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
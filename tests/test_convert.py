@@ -0,0 +1,179 @@
+"""Tests of the convert module, compared with the original functions."""
+import concurrent.futures
+import copy
+import random
+import unittest
+
+from cap import asr, convert
+from cap.transcript import Transcript
+
+import baseline
+import samples
+
+
+def random_groups(seed: int) -> convert.Groups:
+    """Create caption groups of a few words with random times.
+
+    Args:
+        seed: Seed of the random generator.
+
+    Returns:
+        The caption groups, all with a positive duration.
+    """
+    rng = random.Random(seed)
+    groups = []
+    clock = 0.0
+    for _ in range(rng.randrange(1, 6)):
+        group = []
+        for _ in range(rng.randrange(1, 4)):
+            clock = round(clock + rng.choice((0, 0.05, 0.3, 1, 2)), 3)
+            end = round(clock + rng.choice((0.05, 0.1, 0.2, 0.5,
+                                            rng.uniform(0.01, 3))), 3)
+            group.append(asr.Word(rng.choice(('a', 'ok', 'the', 'caption')),
+                                  clock, end, 0))
+            clock = end
+        groups.append(group)
+
+    return groups
+
+
+def weighted_words(seed: int, n: int = 1000) -> samples.Caption:
+    """Create random words with the weights of the original functions.
+
+    Args:
+        seed: Seed of the random generator.
+        n: Number of words.
+
+    Returns:
+        The weighted words.
+    """
+    words, tags = samples.random_words(seed, n)
+    tagged = baseline.pos_tagger(words, tags)
+    words = baseline.punctuation(baseline.speech_gaps(words))
+    for function in baseline.POS_FUNCTIONS:
+        words = function(words, tagged)
+    return words
+
+
+class TestSplitRanges(unittest.TestCase):
+
+    def test_same_as_split_weights(self) -> None:
+        for seed in range(30):
+            words = weighted_words(seed)
+            expected = baseline.split_groups(words)
+            data = Transcript(words)
+            self.assertEqual([data.words(lo, hi) for lo, hi in
+                              convert.split_ranges(data)], expected)
+            self.assertEqual(convert.split_weights(words, []), expected)
+
+    def test_equal_weights(self) -> None:
+        # the first of the highest weights is split on
+        words, _ = samples.random_words(0, 500)
+        self.assertEqual(convert.split_weights(words, []),
+                         baseline.split_groups(words))
+
+    def test_other_limits(self) -> None:
+        words = weighted_words(1)
+        for char_limit, div in ((42, 2), (60, 3), (120, 10)):
+            data = Transcript(words)
+            ranges = convert.split_ranges(data, char_limit, div)
+            self.assertEqual(len(ranges), len(set(ranges)))
+            for lo, hi in ranges:
+                self.assertLessEqual(data.chars(lo, hi), char_limit)
+
+
+class TestCreateGroups(unittest.TestCase):
+
+    def test_same_as_original(self) -> None:
+        for seed in range(20):
+            words, tags = samples.random_words(seed, 1000)
+            expected = baseline.create_groups(copy.deepcopy(words), tags)
+            result = convert.create_groups(Transcript(words), tags=tags)
+            self.assertEqual(baseline.newlines(result),
+                             baseline.newlines(expected))
+
+    def test_caption_list(self) -> None:
+        words, tags = samples.random_words(0, 300)
+        self.assertEqual(
+            convert.create_groups(copy.deepcopy(words), tags=tags),
+            convert.create_groups(Transcript(words), tags=tags))
+
+
+class TestCps(unittest.TestCase):
+
+    def test_same_as_original(self) -> None:
+        for seed in range(2000):
+            groups = random_groups(seed)
+            self.assertEqual(convert.cps(copy.deepcopy(groups)),
+                             baseline.cps(copy.deepcopy(groups)))
+
+    def test_jump_over_limits(self) -> None:
+        # shortening 'ok' by one step makes it too fast, so it's lengthened
+        # and shortened again until the gap is too small
+        groups = [[asr.Word('ok', 0, 0.1, 0)], [asr.Word('next', 0.9, 1.3, 0)]]
+        expected = baseline.cps(copy.deepcopy(groups))
+        self.assertEqual(convert.cps(groups), expected)
+        self.assertAlmostEqual(groups[0][0].start, 0.06)
+        self.assertAlmostEqual(groups[0][0].end, 0.16)
+
+        # and until max_it steps without a next caption group
+        groups = [[asr.Word('ok', 0, 0.16, 0)], [asr.Word('next', 5, 5.3, 0)]]
+        expected = baseline.cps(copy.deepcopy(groups))
+        self.assertEqual(convert.cps(groups), expected)
+
+    def test_no_duration(self) -> None:
+        groups = [[asr.Word('word', 1, 1, 0)], [asr.Word('next', 5, 6, 0)]]
+        result = convert.cps(copy.deepcopy(groups))
+        self.assertEqual(result[0], groups[0])
+
+
+class TestParallelGroups(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.pool = concurrent.futures.ProcessPoolExecutor(2)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.pool.shutdown()
+
+    def test_same_as_serial(self) -> None:
+        for seed in range(5):
+            words, tags = samples.random_words(seed, 5000)
+            for mode in convert.SEGMENTERS:
+                expected = convert.create_groups(Transcript(words), mode=mode,
+                                                 tags=tags)
+                result = convert.parallel_groups(Transcript(words), self.pool,
+                                                 mode=mode, tags=tags,
+                                                 chunk_words=200)
+                self.assertEqual(result, expected)
+
+    def test_greedy_cuts(self) -> None:
+        for seed in range(20):
+            words, tags = samples.random_words(seed, 2000)
+            data = Transcript(words)
+            convert.add_weights(data, tags=tags)
+
+            cuts = convert.greedy_cuts(data)
+            self.assertTrue(cuts)
+
+            bounds = [0] + cuts + [len(data)]
+            chunks = [[(lo + begin, lo + end) for begin, end in
+                       convert.split_ranges(data.slice(lo, hi))]
+                      for lo, hi in zip(bounds, bounds[1:])]
+            self.assertEqual(sum(chunks, []), convert.split_ranges(data))
+
+    def test_close_speech_gaps(self) -> None:
+        words, _ = samples.random_words(0, 50, gaps=0)
+        for i in range(10, 50):
+            words[i].start += 2 if i == 10 else 4
+            words[i].end += 2 if i == 10 else 4
+
+        # speech gaps after words 9 and 10, too close to cut at
+        data = Transcript(words)
+        self.assertEqual(convert.speech_gap_starts(data), [10, 11])
+        self.assertEqual(convert.greedy_cuts(data), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
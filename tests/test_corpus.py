@@ -0,0 +1,75 @@
+"""Tests of the training corpus, compared with the original tokenization."""
+import os
+import tempfile
+import unittest
+
+from cap import caption, corpus, convert
+
+import baseline
+import samples
+
+
+class TestCorpus(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for seed in range(3):
+            words, tags = samples.random_words(seed, 300)
+            words[5].text = 'Don\'t'
+            path = os.path.join(self.directory.name, str(seed % 2),
+                                f'{seed}.srt')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            caption.write(convert.create_groups(words, tags=tags), path)
+            self.files.append(path)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_tokenize(self) -> None:
+        for content in ('Hello, world.\nHow are you?', 'Wait... what?!',
+                        'A: b; c', ''):
+            self.assertEqual(corpus.tokenize(content),
+                             baseline.tokenize(content))
+
+    def test_srt_files(self) -> None:
+        self.assertEqual(corpus.srt_files(self.directory.name),
+                         sorted(self.files))
+
+    def test_build(self) -> None:
+        filename = os.path.join(self.directory.name, 'corpus.bin')
+        sentences, errors = corpus.build(self.directory.name, filename, 2)
+        self.assertEqual(errors, {})
+
+        training_data = [tokens for path in sorted(self.files)
+                         for tokens in corpus.tokenize_file(path)]
+        self.assertEqual(sentences, len(training_data))
+
+        data = corpus.Corpus(filename)
+        try:
+            self.assertEqual(len(data), len(training_data))
+            self.assertEqual(data.word_to_ix(),
+                             baseline.build_vocab(training_data))
+            self.assertEqual([[data.vocab[ix] for ix in tokens]
+                              for tokens in data], training_data)
+            self.assertEqual(data.lengths(), list(map(len, training_data)))
+            self.assertEqual(data.max_len, max(map(len, training_data)))
+        finally:
+            data.close()
+
+    def test_errors(self) -> None:
+        broken = os.path.join(self.directory.name, 'broken.srt')
+        with open(broken, 'wb') as f:
+            f.write(b'\xff\xfe\x00')
+        filename = os.path.join(self.directory.name, 'corpus.bin')
+        _, errors = corpus.build(self.directory.name, filename, 2)
+        self.assertEqual(list(errors), [broken])
+
+        with open(filename, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            corpus.Corpus(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
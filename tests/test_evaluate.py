@@ -0,0 +1,112 @@
+"""Tests of the evaluation against manual subtitles."""
+from datetime import timedelta
+import os
+import tempfile
+import unittest
+
+import srt
+
+from cap import evaluate
+
+
+def subtitle(index: int, start: float, end: float, content: str
+             ) -> srt.Subtitle:
+    """Create a subtitle with the times in seconds."""
+    return srt.Subtitle(index, timedelta(seconds=start),
+                        timedelta(seconds=end), content)
+
+
+MANUAL = [
+    subtitle(1, 0, 2, 'This is the first,'),
+    subtitle(2, 2.1, 4, 'and this is the second.'),
+    subtitle(3, 4.2, 6, '"Last" one!'),
+]
+
+
+class TestEvaluate(unittest.TestCase):
+
+    def test_boundaries(self) -> None:
+        self.assertEqual(evaluate.boundaries(MANUAL),
+                         [(2.05, 'first', 'and'), (4.1, 'second', 'last')])
+        self.assertEqual(evaluate.boundaries([]), [])
+
+    def test_match_boundaries(self) -> None:
+        manual = evaluate.boundaries(MANUAL)
+        self.assertEqual(evaluate.match_boundaries(manual, manual), 2)
+
+        # too far away, or other words around the boundary
+        self.assertEqual(evaluate.match_boundaries(
+            [(2.6, 'first', 'and'), (4.1, 'second', 'one')], manual), 0)
+        self.assertEqual(evaluate.match_boundaries(
+            [(2.4, 'first', 'and')], manual, tolerance=0.5), 1)
+
+        # a manual boundary matches only once
+        self.assertEqual(evaluate.match_boundaries(
+            [(2.0, 'first', 'and'), (2.1, 'first', 'and')], manual), 1)
+
+    def test_violations(self) -> None:
+        subs = [
+            subtitle(1, 0, 1, 'way too many characters for one second'),
+            subtitle(2, 1, 5, 'a line that is a lot longer than forty-two '
+                              'characters'),
+            subtitle(3, 5, 9, 'one\ntwo\nthree'),
+            subtitle(4, 9, 12, 'fine\nlines'),
+        ]
+        self.assertEqual(evaluate.violations(subs), (1, 2))
+
+    def test_evaluate(self) -> None:
+        generated = [
+            subtitle(1, 0, 2, 'This is the first,'),
+            subtitle(2, 2.1, 3, 'and this is'),
+            subtitle(3, 3, 6, 'the second. "Last" one!'),
+        ]
+        result = evaluate.evaluate(generated, MANUAL)
+        self.assertEqual((result.boundaries, result.manual_boundaries,
+                          result.matched), (2, 2, 1))
+        self.assertEqual(result.precision, 0.5)
+        self.assertEqual(result.recall, 0.5)
+        self.assertEqual(result.f1, 0.5)
+
+        total = result + evaluate.evaluate(MANUAL, MANUAL)
+        self.assertEqual(total.files, 2)
+        self.assertEqual(total.metrics()['precision'], 0.75)
+        self.assertEqual(evaluate.Evaluation().f1, 0.0)
+
+
+class TestFiles(unittest.TestCase):
+
+    def test_pairs(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            generated = os.path.join(directory, 'generated')
+            manual = os.path.join(directory, 'manual')
+            for name in ('generated/a.srt', 'generated/sub/b.srt',
+                         'generated/c.srt', 'generated/notes.txt',
+                         'manual/a.srt', 'manual/sub/b.srt'):
+                path = os.path.join(directory, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(srt.compose(MANUAL))
+
+            found, missing = evaluate.pairs(generated, manual)
+            self.assertEqual(found, [
+                (os.path.join(generated, 'a.srt'),
+                 os.path.join(manual, 'a.srt')),
+                (os.path.join(generated, 'sub', 'b.srt'),
+                 os.path.join(manual, 'sub', 'b.srt')),
+            ])
+            self.assertEqual(missing, [os.path.join(generated, 'c.srt')])
+            self.assertEqual(evaluate.pairs(found[0][0], found[0][1]),
+                             ([found[0]], []))
+
+            self.assertEqual(evaluate.evaluate_files(*found[0]).matched, 2)
+
+            results, errors = evaluate.evaluate_corpus(
+                found + [(missing[0], os.path.join(manual, 'c.srt'))], 2)
+            self.assertEqual(set(results), {path for path, _ in found})
+            self.assertEqual(list(errors), missing)
+            self.assertTrue(errors[missing[0]].startswith(
+                'FileNotFoundError'))
+
+
+if __name__ == '__main__':
+    unittest.main()
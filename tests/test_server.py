@@ -0,0 +1,218 @@
+"""Tests of the captioning service, against a server on a free local port.
+
+The worker processes load the POS-tagger, so download the models first with
+`cap download`.
+"""
+import asyncio
+import http.client
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import unittest
+
+from cap import server
+
+
+def asr_file(words: List[str]) -> bytes:
+    """Create an ASR file of words that are spoken one after another.
+
+    Args:
+        words: The words, a word ending with a period is followed by a
+            punctuation item.
+
+    Returns:
+        The ASR file.
+    """
+    items: List[Dict[str, Any]] = []
+    for i, word in enumerate(words):
+        items.append({
+            'start_time': f'{i * 0.4:.2f}',
+            'end_time': f'{i * 0.4 + 0.3:.2f}',
+            'alternatives': [{'confidence': '0.99',
+                              'content': word.rstrip('.')}],
+            'type': 'pronunciation',
+        })
+        if word.endswith('.'):
+            items.append({'alternatives': [{'confidence': '0.0',
+                                            'content': '.'}],
+                          'type': 'punctuation'})
+
+    return json.dumps({
+        'results': {
+            'transcripts': [{'transcript': ' '.join(words)}],
+            'items': items,
+        },
+    }).encode()
+
+
+GOOD = asr_file('This is a short video about captions. We split the words '
+                'into caption groups. Every group has at most two lines, '
+                'and is shown long enough to read it.'.split())
+
+
+class ServerTest(unittest.TestCase):
+    """Runs a CaptionServer in a background thread for every test."""
+
+    queue_size = 256
+
+    def setUp(self) -> None:
+        self.server = server.CaptionServer(workers=1,
+                                           queue_size=self.queue_size)
+        self.loop = asyncio.new_event_loop()
+        self.task: Optional['asyncio.Task[None]'] = None
+
+        def run() -> None:
+            asyncio.set_event_loop(self.loop)
+            self.task = self.loop.create_task(self.server.serve('127.0.0.1',
+                                                                0))
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+
+            # close the connections that are still open
+            pending = asyncio.all_tasks(self.loop)
+            for task in pending:
+                task.cancel()
+            self.loop.run_until_complete(
+                asyncio.gather(*pending, return_exceptions=True))
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+        deadline = time.monotonic() + 10
+        while self.server.address is None:
+            self.assertLess(time.monotonic(), deadline, 'server not started')
+            time.sleep(0.01)
+
+    def tearDown(self) -> None:
+        self.loop.call_soon_threadsafe(lambda: self.task and
+                                       self.task.cancel())
+        self.thread.join(30)
+        self.loop.close()
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None
+                ) -> Tuple[int, str, str]:
+        """Send a request to the server.
+
+        Args:
+            method: The HTTP method.
+            path: The path and query.
+            body: The body of the request.
+
+        Returns:
+            The HTTP status, content type and body of the response.
+        """
+        assert self.server.address is not None
+        host, port = self.server.address
+        connection = http.client.HTTPConnection(host, port, timeout=60)
+        try:
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return (response.status, response.getheader('Content-Type', ''),
+                    response.read().decode())
+        finally:
+            connection.close()
+
+
+class TestCaption(ServerTest):
+
+    def test_good_file(self) -> None:
+        for mode in ('greedy', 'dp'):
+            status, content_type, text = self.request(
+                'POST', f'/caption?mode={mode}', GOOD)
+            self.assertEqual(status, 200, text)
+            self.assertTrue(content_type.startswith('application/x-subrip'))
+            self.assertTrue(text.startswith('1\n00:00:00,000 --> '))
+            self.assertIn('captions.', text)
+
+    def test_empty_file(self) -> None:
+        status, _, text = self.request('POST', '/caption', asr_file([]))
+        self.assertEqual((status, text), (200, ''))
+
+    def test_malformed_file(self) -> None:
+        bad_time = json.loads(GOOD)
+        bad_time['results']['items'][0]['start_time'] = 'soon'
+        no_alternatives = json.loads(GOOD)
+        no_alternatives['results']['items'][0]['alternatives'] = []
+
+        for body in (b'{"results": ', b'\xff', b'{}',
+                     json.dumps(bad_time).encode(),
+                     json.dumps(no_alternatives).encode()):
+            status, _, text = self.request('POST', '/caption', body)
+            self.assertEqual(status, 400, (body, text))
+            self.assertTrue(text.startswith('invalid ASR file'), text)
+
+    def test_unknown_mode(self) -> None:
+        status, _, text = self.request('POST', '/caption?mode=best', GOOD)
+        self.assertEqual(status, 400)
+        self.assertIn("unknown mode 'best'", text)
+
+    def test_wrong_method(self) -> None:
+        self.assertEqual(self.request('GET', '/caption')[0], 405)
+        self.assertEqual(self.request('GET', '/nothing')[0], 404)
+
+    def test_bad_request_in_batch(self) -> None:
+        # requests in the same batch don't fail with the bad one
+        batch = [(GOOD, 'greedy'), (b'{"results": {"items": [{}]}}', 'greedy'),
+                 (GOOD, 'dp')]
+        # pylint: disable=protected-access
+        results, _ = server._caption_batch(batch)
+        self.assertEqual([status for status, _ in results], [200, 400, 200])
+
+    def test_metrics(self) -> None:
+        self.request('POST', '/caption', GOOD)
+        self.request('POST', '/caption?mode=best', GOOD)
+
+        status, content_type, text = self.request('GET', '/metrics')
+        self.assertEqual(status, 200)
+        self.assertTrue(content_type.startswith('text/plain'))
+
+        lines = text.splitlines()
+        self.assertIn('cap_responses_total{status="200"} 1', lines)
+        self.assertIn('cap_responses_total{status="400"} 1', lines)
+        self.assertIn('cap_stage_seconds_count{stage="total"} 2', lines)
+        self.assertIn('cap_stage_seconds_bucket{stage="tag",le="+Inf"} 2',
+                      lines)
+        self.assertIn('cap_pending_requests 0', lines)
+
+
+class TestBrokenPool(ServerTest):
+
+    def test_dead_worker(self) -> None:
+        # pylint: disable=protected-access
+        pool = self.server._pool
+        self.assertEqual(self.request('POST', '/caption', GOOD)[0], 200)
+
+        # the batch of the dead worker fails, the next batches get a new pool
+        for process in list(pool._processes.values()):
+            process.kill()
+            process.join()
+
+        status, _, text = self.request('POST', '/caption', GOOD)
+        self.assertEqual(status, 500)
+        self.assertIn('BrokenProcessPool', text)
+
+        status, _, text = self.request('POST', '/caption', GOOD)
+        self.assertEqual(status, 200, text)
+        self.assertIsNot(self.server._pool, pool)
+
+
+class TestFullQueue(ServerTest):
+
+    # a server that accepts no requests at all is always full
+    queue_size = 0
+
+    def test_full_queue(self) -> None:
+        status, _, text = self.request('POST', '/caption', GOOD)
+        self.assertEqual(status, 503)
+        self.assertIn('try again later', text)
+
+        status, _, text = self.request('GET', '/metrics')
+        self.assertIn('cap_responses_total{status="503"} 1',
+                      text.splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
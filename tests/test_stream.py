@@ -0,0 +1,68 @@
+"""Tests of streaming captioning.
+
+The words are tagged by the POS-tagger, so download the models first with
+`cap download`.
+"""
+import copy
+from typing import Dict, List, Tuple
+import unittest
+
+from cap import convert, stream, weighting
+from cap.transcript import Transcript
+
+import samples
+
+
+def texts(groups: convert.Groups) -> List[str]:
+    """Return the text of every word of the caption groups, in order."""
+    return [word.text for group in groups for word in group]
+
+
+class TestStreamGroups(unittest.TestCase):
+
+    def test_all_words(self) -> None:
+        for seed in range(5):
+            # long words can be lost when a caption group can't be split,
+            # see convert.split_ranges()
+            words, _ = samples.random_words(seed, 500)
+            for word in words:
+                word.text = word.text[:6]
+
+            for latency in (2, 5, 10):
+                groups = list(stream.stream_groups(copy.deepcopy(words),
+                                                   latency=latency))
+                self.assertEqual(texts(groups), texts([words]))
+                self.assertTrue(all(groups))
+
+    def test_same_as_create_groups(self) -> None:
+        # without speech gaps and a long latency, all words are committed
+        # at once
+        words, _ = samples.random_words(0, 300, gaps=0)
+        groups = list(stream.stream_groups(copy.deepcopy(words),
+                                           latency=1000))
+        self.assertEqual(groups, convert.create_groups(words))
+
+    def test_tag_reuse(self) -> None:
+        words, _ = samples.random_words(2, 100)
+        data = Transcript(words)
+        tagged: Dict[Tuple[str, ...], List[str]] = {}
+        tags = stream._tag(data, tagged, None, None)
+        self.assertEqual(tags, weighting.pos_tags(Transcript(words)))
+        self.assertEqual(set(tagged), set(
+            map(tuple, weighting.sentence_tokens(data))))
+
+        # the sentences that stay in the buffer aren't tagged again
+        rest = Transcript(words[50:])
+        sents = set(map(tuple, weighting.sentence_tokens(rest)))
+        kept = set(tagged) & sents
+        self.assertTrue(kept)
+        old = {sent: tagged[sent] for sent in kept}
+        tags = stream._tag(rest, tagged, None, None)
+        self.assertEqual(tags, weighting.pos_tags(rest))
+        self.assertEqual(set(tagged), sents)
+        for sent in kept:
+            self.assertIs(tagged[sent], old[sent])
+
+
+if __name__ == '__main__':
+    unittest.main()
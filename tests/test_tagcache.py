@@ -0,0 +1,75 @@
+"""Tests of the POS-tag cache."""
+import contextlib
+import os
+import sqlite3
+import tempfile
+import time
+from typing import List
+import unittest
+
+from cap.tagcache import TagCache
+
+
+SENTENCES = [['This', 'is', 'a', 'test', '.'], ['Another', 'one']]
+TAGS = [['DET', 'VERB', 'DET', 'NOUN', '.'], ['DET', 'NOUN']]
+
+
+class TestTagCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'tags.sqlite')
+        self.cache = TagCache(self.filename, version='test')
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.directory.cleanup()
+
+    def used(self) -> List[float]:
+        """Return the last use of the cached sentences, in sentence order."""
+        with contextlib.closing(sqlite3.connect(self.filename)) as conn:
+            return [used for used, in conn.execute(
+                'SELECT used FROM tags ORDER BY sentence')]
+
+    def test_get_many(self) -> None:
+        self.assertEqual(self.cache.get_many(SENTENCES), [None, None])
+        self.cache.put_many(list(zip(SENTENCES, TAGS)))
+        self.assertEqual(self.cache.get_many(SENTENCES + [['new']]),
+                         TAGS + [None])
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 2, 'misses': 3, 'size': 2})
+
+    def test_version(self) -> None:
+        self.cache.put_many(list(zip(SENTENCES, TAGS)))
+        with TagCache(self.filename, version='other') as other:
+            self.assertEqual(other.get_many(SENTENCES), [None, None])
+
+    def test_evict_least_recently_used(self) -> None:
+        self.cache.max_size = 2
+        self.cache.touch_interval = 0
+        for sentence, tags in zip(SENTENCES, TAGS):
+            self.cache.put_many([(sentence, tags)])
+            time.sleep(0.01)
+
+        self.cache.get_many(SENTENCES[:1])
+        self.cache.put_many([(['new'], ['ADJ'])])
+        self.assertEqual(self.cache.get_many(SENTENCES + [['new']]),
+                         [TAGS[0], None, ['ADJ']])
+
+    def test_touch_interval(self) -> None:
+        self.cache.put_many(list(zip(SENTENCES, TAGS)))
+        used = self.used()
+
+        # recently used sentences are only read
+        self.cache.get_many(SENTENCES)
+        self.assertEqual(self.used(), used)
+
+        time.sleep(0.01)
+        self.cache.touch_interval = 0
+        self.cache.get_many(SENTENCES[:1])
+        self.assertGreater(self.used()[1], used[1])
+        self.assertEqual(self.used()[0], used[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
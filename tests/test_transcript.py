@@ -0,0 +1,69 @@
+"""Tests of the columnar transcript."""
+import unittest
+
+from cap import asr
+from cap.transcript import TAGS, Transcript
+
+import samples
+
+
+class TestTranscript(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.words, self.tags = samples.random_words(0, 200)
+        for i, word in enumerate(self.words):
+            word.weight = i / 7
+            word.line_break = i % 5 == 0
+        self.data = Transcript(self.words)
+
+    def test_words(self) -> None:
+        self.assertEqual(len(self.data), len(self.words))
+        self.assertEqual(self.data.words(), self.words)
+        self.assertEqual(self.data.words(10, 20), self.words[10:20])
+        self.assertEqual(self.data.word(3), self.words[3])
+        self.assertEqual([type(word) for word in self.data.words()],
+                         [type(word) for word in self.words])
+        self.assertEqual(Transcript().words(), [])
+
+    def test_texts(self) -> None:
+        texts = [word.text for word in self.words]
+        self.assertEqual(self.data.texts(), texts)
+        self.assertEqual(self.data.texts(5, 9), texts[5:9])
+        self.assertEqual(self.data.text_at(7), texts[7])
+
+    def test_chars(self) -> None:
+        for lo in range(0, 30, 3):
+            for hi in range(lo, 40, 5):
+                self.assertEqual(self.data.chars(lo, hi),
+                                 len(' '.join(self.data.texts(lo, hi))))
+        self.assertEqual(self.data.chars(10, 5), 0)
+
+    def test_tags(self) -> None:
+        self.assertEqual(self.data.tags(), ['X'] * len(self.words))
+        self.data.set_tags(self.tags)
+        self.assertEqual(self.data.tags(), self.tags)
+
+        # unknown tags become 'X'
+        self.data.set_tags(['NOUN', 'unknown'])
+        self.assertEqual(self.data.tags(), ['NOUN', 'X'])
+        self.assertIn('.', TAGS)
+
+    def test_slice(self) -> None:
+        self.data.set_tags(self.tags)
+        part = self.data.slice(50, 120)
+        self.assertEqual(part.words(), self.words[50:120])
+        self.assertEqual(part.tags(), self.tags[50:120])
+        self.assertEqual(part.chars(0, len(part)), self.data.chars(50, 120))
+
+        # a slice is a copy
+        part.weight[0] += 1
+        self.assertEqual(self.data.weight[50], self.words[50].weight)
+
+    def test_punctuation(self) -> None:
+        data = Transcript([asr.Word('Hi', 0, 1, 0), asr.Punc('.', 1, 1, 0)])
+        self.assertEqual(list(data.punc), [0, 1])
+        self.assertIsInstance(data.word(1), asr.Punc)
+
+
+if __name__ == '__main__':
+    unittest.main()
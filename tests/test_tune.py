@@ -0,0 +1,136 @@
+"""Tests of tuning the weighting parameters.
+
+The files are tagged by the POS-tagger, so download the models first with
+`cap download`.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+from cap import caption, convert, tune, weighting
+from cap.transcript import Transcript
+
+import samples
+
+
+class TestParameters(unittest.TestCase):
+
+    def test_defaults(self) -> None:
+        params = tune.defaults()
+        self.assertEqual(len(params), len(tune.parameters()))
+        for rule in weighting.RULES:
+            self.assertEqual(params[f'{rule.name}.factor'], rule.factor)
+            self.assertEqual(params[f'{rule.name}.split_weight'],
+                             rule.split_weight)
+
+    def test_same_as_create_groups(self) -> None:
+        words, tags = samples.random_words(0, 1000)
+        data = Transcript(words)
+        data.set_tags(tags)
+        expected = convert.add_weights(Transcript(words), tags=tags)
+        self.assertEqual(tune.weigh(data.slice(0, len(data)),
+                                    tune.defaults()).weight,
+                         expected.weight)
+
+        # the same text, but not retimed
+        subtitles = tune.subtitles(data, tune.defaults())
+        self.assertEqual(list(data.weight), [0] * len(data))
+        groups = convert.create_groups(words, tags=tags)
+        self.assertEqual([sub.content for sub in subtitles],
+                         [sub.content
+                          for sub in caption.create_subtitles(groups)])
+
+    def test_grid(self) -> None:
+        tuned = tune.parameters()[:2]
+        trials = list(tune.grid(tuned, tune.defaults()))
+        self.assertEqual(len(trials),
+                         len(tuned[0].values) * len(tuned[1].values))
+        self.assertEqual(len({json.dumps(trial, sort_keys=True)
+                              for trial in trials}), len(trials))
+
+    def test_random_search(self) -> None:
+        tuned = [param for param in tune.parameters()
+                 if param.name.startswith('split.')]
+        trials = list(tune.random_search(tuned, tune.defaults(), 20, seed=3))
+        self.assertEqual(trials, list(tune.random_search(
+            tuned, tune.defaults(), 20, seed=3)))
+        for trial in trials:
+            for param in tuned:
+                value = trial[param.name]
+                self.assertIsInstance(value, int)
+                self.assertTrue(min(param.values) <= value
+                                <= max(param.values))
+
+
+class TestSearch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        asr_dir = os.path.join(cls.directory.name, 'asr')
+        manual_dir = os.path.join(cls.directory.name, 'manual')
+        os.makedirs(asr_dir)
+        os.makedirs(manual_dir)
+        for seed in range(3):
+            words, tags = samples.random_words(seed, 400)
+            with open(os.path.join(asr_dir, f'{seed}.json'), 'w',
+                      encoding='utf-8') as f:
+                f.write(samples.asr_json(words))
+
+            groups = convert.create_groups(words, tags=tags)
+            caption.write(groups, os.path.join(manual_dir, f'{seed}.srt'))
+
+        cls.pairs, missing = tune.pairs(asr_dir, manual_dir)
+        assert not missing
+        cls.tag_cache = os.path.join(cls.directory.name, 'tags.sqlite')
+        tune.prepare(cls.pairs, cls.tag_cache, 2)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_resume(self) -> None:
+        results = os.path.join(self.directory.name, 'results.jsonl')
+        fingerprint = tune.corpus_fingerprint(self.pairs)
+        tuned = [param for param in tune.parameters()
+                 if param.name == 'split.char_limit']
+        trials = list(tune.grid(tuned, tune.defaults()))
+
+        reported = []
+        with tune.Search(self.pairs, self.tag_cache, results, 2,
+                         lambda *best: reported.append(best),
+                         fingerprint) as search:
+            errors = search.run(trials + trials[:1])
+        self.assertEqual(len(errors), len(trials) + 1)
+        self.assertEqual(errors[0], errors[-1])
+        self.assertEqual(search.best[1], min(errors))
+        self.assertEqual(reported[-1], search.best)
+
+        with open(results, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), len(trials))
+
+        # the recorded trials aren't run again
+        with tune.Search(self.pairs, self.tag_cache, results, 1,
+                         fingerprint=fingerprint) as search:
+            self.assertEqual(len(search.errors), len(trials))
+            self.assertEqual(search.run(trials), errors[:-1])
+        with open(results, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), len(trials))
+
+        with tune.Search(self.pairs, self.tag_cache, results, 1,
+                         fingerprint='other') as search:
+            self.assertEqual(search.ignored, len(trials))
+            self.assertEqual(search.errors, {})
+
+    def test_coordinate_search(self) -> None:
+        tuned = [param for param in tune.parameters()
+                 if param.name.startswith('punctuation.')]
+        with tune.Search(self.pairs, self.tag_cache, jobs=2) as search:
+            default_error = search.run([tune.defaults()])[0]
+            best = tune.coordinate_search(search, tuned, tune.defaults(), 1)
+            self.assertLessEqual(search.run([best])[0], default_error)
+
+
+if __name__ == '__main__':
+    unittest.main()
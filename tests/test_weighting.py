@@ -0,0 +1,138 @@
+"""Tests of the POS rules, compared with the original pos_* functions."""
+from array import array
+import copy
+import dataclasses
+from typing import List, Tuple
+import unittest
+
+from cap import asr, transcript, weighting
+
+import baseline
+import samples
+
+
+def weighted_words(seed: int, n: int = 300
+                   ) -> Tuple[samples.Caption, List[str]]:
+    """Create random words with the weights of the non-POS functions.
+
+    Args:
+        seed: Seed of the random generator.
+        n: Number of words.
+
+    Returns:
+        The words and their POS-tags.
+    """
+    words, tags = samples.random_words(seed, n)
+    weighting.speech_gaps(words)
+    weighting.punctuation(words)
+    return words, tags
+
+
+class TestPosRules(unittest.TestCase):
+
+    def test_caption_list(self) -> None:
+        for seed in range(50):
+            words, tags = weighted_words(seed)
+            expected = copy.deepcopy(words)
+            tagged = baseline.pos_tagger(words, tags)
+            for function in baseline.POS_FUNCTIONS:
+                expected = function(expected, tagged)
+
+            result = weighting.pos_rules(copy.deepcopy(words), tags=tags)
+            self.assertEqual([word.weight for word in result],
+                             [word.weight for word in expected])
+
+    def test_transcript(self) -> None:
+        for seed in range(50):
+            words, tags = weighted_words(seed)
+            expected = copy.deepcopy(words)
+            tagged = baseline.pos_tagger(words, tags)
+            for function in baseline.POS_FUNCTIONS:
+                expected = function(expected, tagged)
+
+            data = transcript.Transcript(words)
+            data.set_tags(tags)
+            weighting.pos_rules(data)
+            self.assertEqual(list(data.weight),
+                             [word.weight for word in expected])
+
+    def test_single_rules(self) -> None:
+        functions = (
+            (weighting.pos_pron_verb, baseline.pos_pron_verb),
+            (weighting.pos_det_noun, baseline.pos_det_noun),
+            (weighting.pos_prep_phrase, baseline.pos_prep_phrase),
+            (weighting.pos_conj_phrase, baseline.pos_conj_phrase),
+            (weighting.complex_verbs, baseline.complex_verbs),
+        )
+        for seed in range(20):
+            words, tags = weighted_words(seed)
+            tagged = baseline.pos_tagger(words, tags)
+            for function, original in functions:
+                result = function(copy.deepcopy(words), tags=tags)
+                expected = original(copy.deepcopy(words), tagged)
+                self.assertEqual([word.weight for word in result],
+                                 [word.weight for word in expected])
+
+                # other factors can round differently in the last bit
+                result = function(copy.deepcopy(words), 2, 0.7, tags=tags)
+                expected = original(copy.deepcopy(words), tagged, 2, 0.7)
+                for new, old in zip(result, expected):
+                    self.assertAlmostEqual(new.weight, old.weight, places=12)
+
+    def test_short(self) -> None:
+        words, tags = weighted_words(0, 3)
+        rules = len(weighting.RULES)
+        for n in range(1, 4):
+            result = weighting.pos_rules(copy.deepcopy(words[:n]),
+                                         tags=tags[:n])
+            self.assertEqual([word.weight for word in result],
+                             [word.weight + rules for word in words[:n-1]]
+                             + [words[n-1].weight])
+
+        self.assertEqual(weighting.pos_rules([], tags=[]), [])
+
+    def test_rule_position(self) -> None:
+        # avoid splitting after the verb instead of the pronoun
+        rule = dataclasses.replace(weighting.PRON_VERB, position=1)
+        tags = array('B', [transcript.TAG_IDS[tag]
+                           for tag in ('PRON', 'VERB', 'NOUN', 'PRON')])
+        self.assertEqual(list(weighting.rule_deltas(tags.tobytes(), [rule])),
+                         [1.0, 1 - 0.2, 1.0, 0.0])
+
+
+class TestLineBreaks(unittest.TestCase):
+
+    def test_same_as_original(self) -> None:
+        for seed in range(20):
+            words, tags = weighted_words(seed, 1000)
+            groups = baseline.split_groups(weighting.pos_rules(words,
+                                                               tags=tags))
+            for bound in (42, 30, 60):
+                expected = baseline.line_breaks(copy.deepcopy(groups),
+                                                bound=bound)
+                result = weighting.line_breaks(copy.deepcopy(groups),
+                                               bound=bound)
+                self.assertEqual(baseline.newlines(result),
+                                 baseline.newlines(expected))
+
+    def test_break_again(self) -> None:
+        words, tags = weighted_words(0, 200)
+        groups = baseline.split_groups(weighting.pos_rules(words, tags=tags))
+        result = weighting.line_breaks(weighting.line_breaks(
+            copy.deepcopy(groups), bound=20))
+        expected = weighting.line_breaks(copy.deepcopy(groups))
+        self.assertEqual([[word.line_break for word in group]
+                          for group in result],
+                         [[word.line_break for word in group]
+                          for group in expected])
+
+    def test_no_split_option(self) -> None:
+        # no split keeps both lines within the bound, so split in the middle
+        group = [asr.Word('x' * 30, i, i + 1, 0) for i in range(3)]
+        weighting.line_breaks([group], bound=42)
+        self.assertEqual([word.line_break for word in group],
+                         [False, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()